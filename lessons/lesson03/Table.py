@@ -1,22 +1,84 @@
 class Table:
     def __init__(self):
-        self.table = {}
-        self.var2num = {}
+        self.table = {}         # map from value -> (canonical var, num)
+        self.var2num = {}       # map from var -> num
+        self.num2value = []     # num -> value
+        self.num2var = []       # num -> canonical var
         self.nrows = 0
+        self.log = []           # undo log, see mark() and undo()
     
     def __str__(self):
         return f"VALUE -> (VAR, NUM): {str(self.table)}, VAR -> NUM: {str(self.var2num)}"
 
     def addRow(self, value, varName):
+        self.log.append(('row', value, self.table.get(value), varName, self.var2num.get(varName)))
         self.table[value] = (varName, self.nrows)
         self.var2num[varName] = self.nrows
+        self.num2value.append(value)
+        self.num2var.append(varName)
         self.nrows += 1
 
     def updateEnv(self, var, num):
+        self.log.append(('var', var, self.var2num.get(var)))
         self.var2num[var] = num
+
+    def mark(self):
+        return len(self.log)
+
+    def undo(self, mark):
+        '''
+            Rolls the table back to what it was when mark() returned
+            mark, so a block can build on its parent's numbering and
+            hand it back unchanged to the next child.
+        '''
+        while len(self.log) > mark:
+            entry = self.log.pop()
+            if entry[0] == 'row':
+                kind, value, oldRow, var, oldNum = entry
+                self.num2value.pop()
+                self.num2var.pop()
+                self.nrows -= 1
+                self.restore(self.table, value, oldRow)
+                self.restore(self.var2num, var, oldNum)
+            elif entry[0] == 'var':
+                kind, var, oldNum = entry
+                self.restore(self.var2num, var, oldNum)
+            else:
+                kind, num, oldVar, value, oldRow = entry
+                self.num2var[num] = oldVar
+                self.table[value] = oldRow
+
+    def restore(self, d, key, old):
+        if old is None:
+            d.pop(key, None)
+        else:
+            d[key] = old
     
     def getValue(self, num):
-        for key in self.table:
-            if self.table[key][1] == num:
-                return key
-        return -1, -1
\ No newline at end of file
+        if num < 0 or num >= self.nrows:
+            return -1, -1
+        return self.num2value[num]
+
+    def getCanonicalVar(self, num):
+        return self.num2var[num]
+
+    def holder(self, num):
+        # canonical var of num, or None once it has been overwritten
+        var = self.num2var[num]
+        if self.var2num.get(var) != num:
+            return None
+        return var
+
+    def setCanonical(self, num, var):
+        value = self.num2value[num]
+        self.log.append(('canon', num, self.num2var[num], value, self.table[value]))
+        self.num2var[num] = var
+        self.table[value] = (var, num)
+        self.updateEnv(var, num)
+
+    def canonicalize(self, var):
+        # the var that first computed var's value, if it still holds it
+        holder = self.holder(self.var2num[var])
+        if holder is None:
+            return var
+        return holder
\ No newline at end of file
@@ -0,0 +1,51 @@
+import random
+import sys
+import time
+import lvn
+
+'''
+Times LVN on one synthetic basic block of n instructions.
+
+    The block mixes consts, copies, recomputed expressions and
+    redefinitions over a pool of variables, roughly like straight-line
+    code that was unrolled or generated. Time per instruction should
+    stay flat as n grows.
+
+    python bench_lvn.py [n ...]
+'''
+
+def synthesize(n, rng):
+    block = [{'label': 'b0'}]
+    names = ['a']
+    ops = ['add', 'mul', 'sub']
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.2:
+            insn = {'dest': 'v'+str(i), 'op': 'const', 'type': 'int', 'value': rng.randrange(100)}
+        elif kind < 0.3:
+            insn = {'dest': 'v'+str(i), 'op': 'id', 'type': 'int', 'args': [rng.choice(names)]}
+        else:
+            args = [rng.choice(names[-50:]), rng.choice(names[-50:])]
+            insn = {'dest': 'v'+str(i), 'op': rng.choice(ops), 'type': 'int', 'args': args}
+        if rng.random() < 0.05:
+            insn['dest'] = rng.choice(names)     # redefine an older variable
+        else:
+            names.append(insn['dest'])
+        block.append(insn)
+    block.append({'op': 'print', 'args': names[-10:]})
+    return block
+
+def main():
+    sizes = [int(n) for n in sys.argv[1:]] or [5000, 10000, 20000, 50000]
+    rng = random.Random(0)
+    print('| instructions | time (s) | us per instruction |')
+    print('|---|---|---|')
+    for n in sizes:
+        block = synthesize(n, rng)
+        start = time.perf_counter()
+        lvn.lvn_helper(block, [{'name': 'a', 'type': 'int'}])
+        elapsed = time.perf_counter() - start
+        print('| '+str(n)+' | '+str(round(elapsed, 2))+' | '+str(round(elapsed / n * 1e6, 1))+' |')
+
+if __name__ == "__main__":
+    main()
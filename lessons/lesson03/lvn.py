@@ -1,127 +1,338 @@
 from Table import Table
 import itertools
-import json
+import os
 import sys
-sys.path.append("../library")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
 import cfg
+import instrument
+import stream
 
-def construct_value(insn, lvn_table):
+# Ops whose result depends only on their args, so equal values can share a var
+PURE = ('id', 'add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or',
+        'fadd', 'fsub', 'fmul', 'fdiv', 'feq', 'flt', 'fgt', 'fle', 'fge',
+        'ceq', 'clt', 'cgt', 'cle', 'cge', 'char2int', 'int2char', 'ptradd')
+COMMUTATIVE = ('add', 'mul', 'eq', 'and', 'or', 'fadd', 'fmul', 'feq', 'ceq')
+MAX_INT = 2**63 - 1
+
+def wrap(value):
+    # Bril ints are 64-bit two's complement
+    value = value & (2**64 - 1)
+    if value > MAX_INT:
+        value = value - 2**64
+    return value
+
+def fold(op, args):
+    match op:
+        case 'add':
+            return wrap(args[0] + args[1])
+        case 'sub':
+            return wrap(args[0] - args[1])
+        case 'mul':
+            return wrap(args[0] * args[1])
+        case 'div':
+            if args[1] == 0:
+                return None     # leave the trap to run time
+            quotient = abs(args[0]) // abs(args[1])
+            return wrap(quotient if (args[0] < 0) == (args[1] < 0) else -quotient)
+        case 'eq':
+            return args[0] == args[1]
+        case 'lt':
+            return args[0] < args[1]
+        case 'gt':
+            return args[0] > args[1]
+        case 'le':
+            return args[0] <= args[1]
+        case 'ge':
+            return args[0] >= args[1]
+        case 'not':
+            return not args[0]
+        case 'and':
+            return args[0] and args[1]
+        case 'or':
+            return args[0] or args[1]
+    return None
+
+FOLDABLE = ('add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or')
+
+def simplify(op, nums, lvn_table):
+    '''
+        Constant folding and algebraic identities.
+
+        output: ('const', value) when the result is known,
+                ('copy', i) when the result is the i-th arg,
+                None otherwise
+    '''
+    consts = []
+    for num in nums:
+        value = lvn_table.getValue(num)
+        consts.append(value[2] if value[0] == 'const' else None)
+    if op not in FOLDABLE:
+        return None
+    if None not in consts:
+        folded = fold(op, consts)
+        return None if folded is None else ('const', folded)
+    if op == 'not':
+        return None
+
+    x, y = consts
+    same = nums[0] == nums[1]
+    match op:
+        case 'add':
+            if y == 0:
+                return ('copy', 0)
+            if x == 0:
+                return ('copy', 1)
+        case 'sub':
+            if y == 0:
+                return ('copy', 0)
+            if same:
+                return ('const', 0)
+        case 'mul':
+            if y == 1:
+                return ('copy', 0)
+            if x == 1:
+                return ('copy', 1)
+            if x == 0 or y == 0:
+                return ('const', 0)
+        case 'div':
+            if y == 1:
+                return ('copy', 0)
+        case 'eq' | 'le' | 'ge':
+            if same:
+                return ('const', True)
+        case 'lt' | 'gt':
+            if same:
+                return ('const', False)
+        case 'and':
+            if x is False or y is False:
+                return ('const', False)
+            if y is True or same:
+                return ('copy', 0)
+            if x is True:
+                return ('copy', 1)
+        case 'or':
+            if x is True or y is True:
+                return ('const', True)
+            if y is False or same:
+                return ('copy', 0)
+            if x is False:
+                return ('copy', 1)
+    return None
+
+def construct_value(insn, lvn_table, fold=False):
     for a in insn['args']:
         if a not in lvn_table.var2num:
             lvn_table.addRow(('unknown', a), a)
 
+    if fold and 'dest' in insn and insn['op'] != 'id':
+        nums = [lvn_table.var2num[a] for a in insn['args']]
+        simplified = simplify(insn['op'], nums, lvn_table)
+        if simplified is not None and simplified[0] == 'const':
+            insn['op'] = 'const'
+            insn['value'] = simplified[1]
+            del insn['args']
+            return ('const', insn['type'], insn['value'])
+        if simplified is not None:
+            insn['op'] = 'id'
+            insn['args'] = [insn['args'][simplified[1]]]
+
     if insn['op'] == 'id':
-        arg = insn['args'][0]
-        num = lvn_table.var2num[arg]
-        lvn_table.var2num[insn['dest']] = num
-        value = lvn_table.getValue(num)
-        return value
+        # dest is bound by the caller, once it knows which var holds the value
+        return lvn_table.getValue(lvn_table.var2num[insn['args'][0]])
     else:
         nums = []
         for a in insn['args']:
             nums.append(lvn_table.var2num[a])
-        # sort list so (ADD, 0, 2) == (ADD, 2, 0) can be more easily supported
-        nums.sort()
+        # sort list so (ADD, 0, 2) == (ADD, 2, 0), but only where that holds
+        if insn['op'] in COMMUTATIVE:
+            nums.sort()
         return (insn['op'],) + tuple(nums)
 
-def willBeOverwritten(num, block, dest):
-    for i in range(num+1, len(block)):
+def nextDefinitions(block):
+    '''
+        One backward sweep over block.
+
+        output: list where entry i is the index of the next insn
+                that redefines block[i]['dest'], or None
+    '''
+    nextDef = [None]*len(block)
+    lastDef = {}    # map from var -> index of the closest def below
+    for i in range(len(block)-1, -1, -1):
         insn = block[i]
         if 'dest' in insn:
-            if dest == insn['dest']:
+            nextDef[i] = lastDef.get(insn['dest'])
+            lastDef[insn['dest']] = i
+    return nextDef
+
+class FreshNames:
+    '''
+        Hands out var1, var2, ... for renaming var, skipping every
+        name already used anywhere in the function.
+    '''
+    def __init__(self, blocks, args):
+        self.taken = set(a['name'] for a in args)
+        for block in blocks:
+            for insn in block:
+                if 'dest' in insn:
+                    self.taken.add(insn['dest'])
                 if 'args' in insn:
-                    for a in insn['args']:
-                        if a == insn['dest']:   # Test to see if we have a = a +1 situation
-                            return True, i+1
-                return True, i
-    return False, -1
-
-def generateFreshVar(var, block):
-    num = 1
-    restart = True
-    while restart:
-        restart = False
-        newVar = var+str(num)
-        for insn in block:
-            if 'dest' in insn:
-                if newVar == insn['dest']:
-                    num = num + 1
-                    restart = True
-                    break
-    return newVar
-        
+                    self.taken.update(insn['args'])
+        self.counters = {}  # map from var -> next suffix to try
+
+    def generateFreshVar(self, var):
+        num = self.counters.get(var, 1)
+        while var+str(num) in self.taken:
+            num = num + 1
+        self.counters[var] = num + 1
+        self.taken.add(var+str(num))
+        return var+str(num)
+
 def addArguments(args, table):
     for a in args:
         argName = a['name']
         table.addRow(('arg', argName), argName)
 
-def lvn_helper(block, args):
-    lvn_table = Table()
-    addArguments(args, lvn_table)
+def lvn_helper(block, args, freshNames=None, fold=False, lvn_table=None):
+    if freshNames is None:
+        freshNames = FreshNames([block], args)
+    if lvn_table is None:
+        lvn_table = Table()
+        addArguments(args, lvn_table)
+    nextDef = nextDefinitions(block)
+    renamed = {}    # map from var -> fresh name its reads use until var is redefined
     for i,insn in enumerate(block):
         value = ()
+        if 'args' in insn and renamed:
+            insn['args'] = [renamed.get(a, a) for a in insn['args']]
+        if 'dest' in insn:
+            renamed.pop(insn['dest'], None)
         if 'op' in insn:
             # Construct value 
-            if 'args' in insn:
-                value = construct_value(insn, lvn_table)
-            else:   # 'value' in insn
-                if insn['op'] == 'const': 
-                    value = (insn['op'], insn['value'])
-                else:
-                    continue
+            if insn['op'] == 'const':
+                value = (insn['op'], insn['type'], insn['value'])
+            elif 'dest' in insn and insn['op'] not in PURE:
+                # calls, loads, allocs, ... produce a new value every time
+                for a in insn.get('args', []):
+                    if a not in lvn_table.var2num:
+                        lvn_table.addRow(('unknown', a), a)
+                value = ('impure', lvn_table.nrows)
+            elif 'args' in insn:
+                value = construct_value(insn, lvn_table, fold)
+            else:
+                continue
             # Add value to table
             if value not in lvn_table.table:
                 if 'dest' in insn:
                     # Edge case
                     dest = insn['dest']
-                    w, end = willBeOverwritten(i, block, dest)
-                    if (w):
-                        insn['dest'] = generateFreshVar(dest, block)
-                        for n in range(i+1, end):
-                            if 'args' in block[n]:
-                                newArgs = []
-                                for a in block[n]['args']:
-                                    if a == dest:
-                                        newArgs.append(insn['dest'])
-                                    else:
-                                        newArgs.append(a)
-                                block[n]['args'] = newArgs
+                    if nextDef[i] is not None:
+                        insn['dest'] = freshNames.generateFreshVar(dest)
+                        renamed[dest] = insn['dest']
                     lvn_table.addRow(value, insn['dest'])
                     # Transforms each insn to use canonical vars for args
                     if 'args' in insn:
                         newArgs = []
                         for arg in insn['args']:
-                            num = lvn_table.var2num[arg]
-                            for key in lvn_table.table:
-                                if lvn_table.table[key][1] == num:
-                                    newArgs.append(lvn_table.table[key][0])
+                            newArgs.append(lvn_table.canonicalize(arg))
                         insn['args'] = newArgs
             else:
                 if 'dest' in insn:
-                    if insn['op'] != 'id':
-                        lvn_table.var2num[insn['dest']] = lvn_table.table[value][1]
+                    num = lvn_table.table[value][1]
+                    holder = lvn_table.holder(num)
+                    if holder is None:
+                        # The var that held the value was overwritten (an arg
+                        # or a var read before its def), so dest takes over
+                        if 'args' in insn:
+                            insn['args'] = [lvn_table.canonicalize(a) for a in insn['args']]
+                        lvn_table.setCanonical(num, insn['dest'])
+                    else:
+                        lvn_table.updateEnv(insn['dest'], num)
                         insn['op'] = 'id'
-                    insn['args'] = [lvn_table.table[value][0]]
+                        insn.pop('value', None)
+                        insn['args'] = [holder]
     
     return block
 
-def lvn(blocks, args):
+def lvn(blocks, args, fold=False):
     newBlocks = []
+    freshNames = FreshNames(blocks, args)
     for block in blocks:
-        newBlock = lvn_helper(block, args)
+        newBlock = lvn_helper(block, args, freshNames, fold)
         newBlocks.append(newBlock)
     return newBlocks
 
+'''
+Superlocal value numbering over extended basic blocks
+
+    A block with exactly one predecessor only runs after that
+    predecessor, so it can keep numbering where the predecessor left
+    off. Each EBB is a tree rooted at the entry or at a join point. It
+    is walked depth first with one Table. Before a child runs, the walk
+    takes a mark of the table's undo log, and afterwards it rolls back
+    to that mark, so the next child starts from the parent's numbering
+    without anything being copied.
+
+    Example:
+    .entry:                                 .entry:
+        s: int = add a b;                       s: int = add a b;
+        br c .then .end;                        br c .then .end;
+    .then:                          --->    .then:
+        t: int = add b a;                       t: int = id s;
+'''
+def ebb_lvn(blocks, args, fold=False):
+    freshNames = FreshNames(blocks, args)
+    blockMap = {}
+    for block in blocks:
+        blockMap[block[0]['label']] = block
+    successors = cfg.createCFG(list(itertools.chain(*blocks)))
+    predecessors = cfg.buildPredecessorList(successors)
+    entry = blocks[0][0]['label']
+
+    def inheritsFrom(label):
+        preds = cfg.getPredecessors(label, predecessors)
+        if label == entry or len(preds) != 1 or preds[0] == label:
+            return None
+        return preds[0]
+
+    # Unreachable blocks have no predecessors, so they are roots too
+    visited = set()
+    roots = [entry] + [b[0]['label'] for b in blocks if inheritsFrom(b[0]['label']) is None]
+    for root in roots:
+        if root in visited:
+            continue
+        lvn_table = Table()
+        addArguments(args, lvn_table)
+        stack = [root]      # labels to run, or undo marks to roll back to
+        while stack:
+            top = stack.pop()
+            if isinstance(top, int):
+                lvn_table.undo(top)
+                continue
+            visited.add(top)
+            lvn_helper(blockMap[top], args, freshNames, fold, lvn_table)
+            for succ in cfg.getSuccessors(top, successors):
+                if succ not in visited and inheritsFrom(succ) == top:
+                    stack.append(lvn_table.mark())
+                    stack.append(succ)
+    return blocks
+
+@instrument.stage('lvn')
+def optimize(func, ebb=False, fold=False):
+    basicBlocks = cfg.formBasicBlocks(func['instrs'])
+    numbering = ebb_lvn if ebb else lvn
+    if 'args' in func:
+        basicBlocks = numbering(basicBlocks, func['args'], fold)
+    else:
+        basicBlocks = numbering(basicBlocks, [], fold)
+    func['instrs'] = list(itertools.chain(*basicBlocks))
+
 def main():
-    program = json.load(sys.stdin)
-    for func in program['functions']:
-        basicBlocks = cfg.formBasicBlocks(func['instrs'])
-        if 'args' in func:
-            basicBlocks = lvn(basicBlocks, func['args'])
-        else:
-            basicBlocks = lvn(basicBlocks, [])
-        func['instrs'] = list(itertools.chain(*basicBlocks))
-    json.dump(program, sys.stdout, indent=2, sort_keys=True)
+    reader = stream.reader(sys.stdin)
+    writer = stream.writer(sys.stdout)
+    for func in reader:
+        optimize(func, '-e' in sys.argv, '-f' in sys.argv)
+        writer.write(func)
+    writer.close(reader.extra)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,8 +1,10 @@
 import itertools
-import json
+import os
 import sys
-sys.path.append("../library")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
 import cfg
+import instrument
+import stream
 
 '''
 Trivial Dead Code Elimination: Optimization #1
@@ -16,77 +18,124 @@ Trivial Dead Code Elimination: Optimization #1
         d: int = add a b                    print d
         e: int = add c d
         print d
+
+    Uses are counted once per function. Definitions whose dest has no
+    uses go on a worklist; deleting one decrements the counts of its
+    args, which can queue more definitions. Calls are kept even when
+    their result is unused since they may have side effects.
 '''
 
+@instrument.stage('tdce_opt1')
 def tdce_opt1(func):
-    # print(func['instrs'][0])
-    changed = True
-    while changed:
-        changed = False
-        remove = []
-        used = []
-        defined = []
-        for insn in func['instrs']:
-            # print(insn)
-            if 'dest' in insn:
-                defined.append(insn['dest'])
-            if 'args' in insn:
-                for var in insn['args']:
-                    used.append(var)
-        # pass 2: Any insn that's been def'd but never used gets removed
-        for insn in func['instrs']:
-            if 'dest' in insn and insn['dest'] not in used:
-                remove.append(insn)  
-                changed = True              
-        func['instrs'] = [ x for x in func['instrs'] if x not in remove ]
+    insns = func['instrs']
+    uses = {}           # map from varName -> number of reads
+    defs = {}           # map from varName -> indexes of insns defining it
+    for i, insn in enumerate(insns):
+        if 'args' in insn:
+            for var in insn['args']:
+                uses[var] = uses.get(var, 0) + 1
+        if 'dest' in insn and insn['op'] != 'call':
+            defs.setdefault(insn['dest'], []).append(i)
+
+    worklist = [var for var in defs if var not in uses]
+    dead = [False] * len(insns)
+    while len(worklist) != 0:
+        var = worklist.pop()
+        for i in defs.pop(var, []):
+            dead[i] = True
+            for arg in insns[i].get('args', []):
+                uses[arg] -= 1
+                if uses[arg] == 0:
+                    worklist.append(arg)
+    func['instrs'] = [insn for i, insn in enumerate(insns) if not dead[i]]
     return func['instrs']
 
 '''
 Trivial Dead Code Elimination: Optimization #2
-    Within a basic block, if a variable, v, is def'd two or more times in a row
-    before being used, only keep the most recent def(v) before use(v).
+    If a variable, v, is def'd and v is not live right after the def (every
+    path from there redefines v before reading it, or never reads it), remove
+    def(v). Liveness is solved once over the whole CFG, then each block is
+    swept backwards.
 
     Example:
-        a: int = const 4                    a: int = const 5
-        a: int = const 5        --->        print a
-        print a
+        a: int = const 4                    br c .left .right
+        br c .left .right       --->    .left:
+    .left:                                  a: int = const 5
+        a: int = const 5                    print a
+        print a                         .right:
+    .right:                                 ret
+        ret
 '''
+def liveness(blocks):
+    '''
+        input: basic blocks of a function
+        output: map from block label -> set of vars live on exit
+    '''
+    successors = cfg.createCFG(list(itertools.chain(*blocks)))
+    uses = {}       # map from label -> vars read before any def in the block
+    defs = {}       # map from label -> vars def'd in the block
+    for block in blocks:
+        label = block[0]['label']
+        uses[label] = set()
+        defs[label] = set()
+        for insn in block:
+            if 'args' in insn:
+                uses[label].update(a for a in insn['args'] if a not in defs[label])
+            if 'dest' in insn:
+                defs[label].add(insn['dest'])
+
+    liveIn = {label: set() for label in uses}
+    liveOut = {label: set() for label in uses}
+    # Sweep in reverse block order until nothing changes, so most
+    # successors are up to date by the time their predecessors are visited
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            label = block[0]['label']
+            out = set()
+            for succ in cfg.getSuccessors(label, successors):
+                out |= liveIn[succ]
+            liveOut[label] = out
+            newIn = uses[label] | (out - defs[label])
+            if newIn != liveIn[label]:
+                liveIn[label] = newIn
+                changed = True
+    return liveOut
+
+@instrument.stage('tdce_opt2')
 def tdce_opt2(blocks):
+    liveOut = liveness(blocks)
     newBlocks = []
     for block in blocks:
-        changed = True
-        newBlock = block
-        last_def = {}
-        while changed:
-            changed = False
-            remove = []
-            for insn in newBlock:
-                # check for uses
-                if 'args' in insn:
-                    for a in insn['args']:
-                        if a in last_def:
-                            del last_def[a]             
-                # check for defs
-                if 'dest' in insn:
-                    if insn['dest'] not in last_def:
-                        last_def[insn['dest']] = insn
-                    else:
-                        remove.append(last_def[insn['dest']])
-                        changed = True
-                        last_def[insn['dest']] = insn
-                        # newBlock = [ x for x in newBlock if x not in remove ]
-            newBlock = [ x for x in newBlock if x not in remove ]
+        live = set(liveOut[block[0]['label']])
+        newBlock = []
+        for insn in reversed(block):
+            if 'dest' in insn:
+                if insn['dest'] not in live and insn['op'] != 'call':
+                    continue
+                live.discard(insn['dest'])
+            if 'args' in insn:
+                live.update(insn['args'])
+            newBlock.append(insn)
+        newBlock.reverse()
         newBlocks.append(newBlock)
     return newBlocks
 
+@instrument.stage('tdce')
+def tdce(func):
+    insns = tdce_opt1(func)
+    basicBlocks = cfg.formBasicBlocks(insns)
+    basicBlocks = tdce_opt2(basicBlocks)
+    func['instrs'] = list(itertools.chain(*basicBlocks))
+
 def main():
-    program = json.load(sys.stdin)
-    for func in program['functions']:
-        insns = tdce_opt1(func)
-        basicBlocks = cfg.formBasicBlocks(insns)
-        basicBlocks = tdce_opt2(basicBlocks)
-        func['instrs'] = list(itertools.chain(*basicBlocks))
-    json.dump(program, sys.stdout, indent=2, sort_keys=True)
+    reader = stream.reader(sys.stdin)
+    writer = stream.writer(sys.stdout)
+    for func in reader:
+        tdce(func)
+        writer.write(func)
+    writer.close(reader.extra)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import random
+import sys
+import time
+import bitvector as bv
+
+'''
+Times both backends of BitVectorWorklist on synthetic functions,
+to pick the NUMPY_* constants in bitvector.py.
+
+    chain:  every block falls through to the next one and 1 in 5
+            also branches back to a random earlier block, so nearly
+            every RPO level holds a single block
+    switch: a loop around a binary tree of branches dispatching to
+            `blocks` cases, so the levels get very wide
+
+    gen/kill are random bitsets over `facts` facts. Times only cover
+    solving, the CFG is built beforehand.
+
+    python bench_bitvector.py [seed]
+'''
+
+CHAINS = [500, 1000, 2000, 4000]
+SWITCHES = [256, 1024, 4096, 16384]
+FACTS = [64, 512, 4096]
+
+def chain(blocks, rng):
+  instrs = []
+  for b in range(blocks):
+    instrs.append({'label': 'b'+str(b)})
+    if b == blocks - 1:
+      instrs.append({'op': 'ret', 'args': []})
+    elif rng.random() < 0.2:
+      instrs.append({'op': 'br', 'args': ['c'], 'labels': ['b'+str(rng.randrange(b + 1)), 'b'+str(b + 1)]})
+  return {'name': 'main', 'args': [{'name': 'c', 'type': 'bool'}], 'instrs': instrs}
+
+def switch(cases, rng):
+  instrs = [{'label': 'entry'}, {'label': 'loop'}]
+  pending = [('t', cases)]
+  while len(pending) != 0:
+    label, size = pending.pop()
+    instrs.append({'label': label})
+    if size == 1:
+      instrs.append({'op': 'jmp', 'labels': ['latch']})
+    else:
+      instrs.append({'op': 'br', 'args': ['c'], 'labels': [label+'l', label+'r']})
+      pending.append((label+'r', size - size // 2))
+      pending.append((label+'l', size // 2))
+  instrs.append({'label': 'latch'})
+  instrs.append({'op': 'br', 'args': ['c'], 'labels': ['loop', 'exit']})
+  instrs.append({'label': 'exit'})
+  instrs.append({'op': 'ret', 'args': []})
+  return {'name': 'main', 'args': [{'name': 'c', 'type': 'bool'}], 'instrs': instrs}
+
+def solve(func, facts, rng):
+  worklist = bv.BitVectorWorklist(func, 0, None, None)
+  worklist.setup()
+  gens = {}
+  kills = {}
+  for label in worklist.order:
+    gens[label] = rng.getrandbits(facts) & rng.getrandbits(facts)
+    kills[label] = rng.getrandbits(facts) & rng.getrandbits(facts)
+
+  start = time.perf_counter()
+  scalar = worklist.scalarWorklist(gens, kills, 0)
+  scalarTime = time.perf_counter() - start
+  levels = worklist.levels()
+  worklist.sweeps = 0
+  start = time.perf_counter()
+  vectorized = worklist.numpyWorklist(gens, kills, facts, 0, levels)
+  numpyTime = time.perf_counter() - start
+  assert scalar == vectorized
+  width = len(worklist.order) / len(levels)
+  return [len(worklist.order), facts, round(width), round(scalarTime*1000, 1), round(numpyTime*1000, 1), worklist.sweeps]
+
+def main():
+  seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+  rng = random.Random(seed)
+  print('| shape | blocks | facts | blocks per level | scalar (ms) | numpy (ms) | sweeps |')
+  print('|---|---|---|---|---|---|---|')
+  for shape, sizes in (('chain', CHAINS), ('switch', SWITCHES)):
+    for size in sizes:
+      func = chain(size, rng) if shape == 'chain' else switch(size, rng)
+      for facts in FACTS:
+        row = solve(func, facts, rng)
+        print('| '+shape+' | '+' | '.join(str(x) for x in row)+' |')
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,191 @@
+from enum import Enum
+import worklist as w
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# When the NumPy backend pays off, picked with bench_bitvector.py (see
+# the README). Python ints already OR/AND 64 facts per machine word, so
+# the matrices only win by skipping the per-block interpreter overhead:
+# that takes thousands of blocks, a few hundred of them per RPO level,
+# and bitsets small enough that the int <-> matrix copies stay cheap.
+NUMPY_MIN_BLOCKS = 8000
+NUMPY_MIN_LEVEL_WIDTH = 400
+NUMPY_MAX_FACTS = 512
+
+class Meet(Enum):
+  UNION = 1
+  INTERSECTION = 2
+
+class BitVectorWorklist(w.Worklist):
+  '''
+    Solver for forward gen/kill problems, OUT = gen | (IN & ~kill).
+
+      init: int bitset flowing into the entry block
+      gen:  b_label -> int bitset
+      kill: b_label -> int bitset
+      meet: Meet.UNION (may problems) or Meet.INTERSECTION (must problems)
+
+    Most functions run round-robin RPO sweeps over int bitsets. Large,
+    wide functions (and NumPy installed, see NUMPY_MIN_BLOCKS) store
+    IN/OUT as bit matrices instead, one row per block, and every sweep
+    evaluates a whole RPO level at once: the blocks of a level have no
+    forward edges between them, so their INs are a single reduce over
+    the OUT rows of their predecessors. worklist() returns int bitsets
+    either way.
+  '''
+  def __init__(self, function, init, gen, kill, meet=Meet.UNION, backend=None):
+      super().__init__(function, init, None, None, w.Direction.FORWARD)
+      self.gen = gen
+      self.kill = kill
+      self.meet = meet
+      self.backend = backend      # 'numpy', 'scalar' or None to pick by size
+      self.sweeps = 0
+
+  def chooseBackend(self, nfacts):
+    '''
+      Returns 'scalar', or 'numpy' and the RPO levels it will sweep.
+    '''
+    if self.backend == 'scalar' or nfacts == 0:
+      return 'scalar', None
+    if self.backend is None:
+      if np is None or len(self.order) < NUMPY_MIN_BLOCKS or nfacts > NUMPY_MAX_FACTS:
+        return 'scalar', None
+    levels = self.levels()
+    if self.backend is None and len(self.order) < NUMPY_MIN_LEVEL_WIDTH * len(levels):
+      return 'scalar', None
+    return 'numpy', levels
+
+  def scalarWorklist(self, gens, kills, top):
+    ins = {}
+    outs = {}
+    for label in self.order:
+      ins[label] = top
+      outs[label] = top
+
+    # Round-robin sweeps in RPO, same as the NumPy backend below. With
+    # lots of back edges a worklist keeps revisiting the early blocks of
+    # every loop before the later ones settle.
+    changed = True
+    while changed:
+      changed = False
+      self.sweeps += 1
+      for i, b_label in enumerate(self.order):
+        joined = self.init if i == 0 else top
+        for pred in self.getPredecessors(b_label):
+          if self.meet == Meet.UNION:
+            joined |= outs[pred]
+          else:
+            joined &= outs[pred]
+        ins[b_label] = joined
+        newOut = gens[b_label] | (joined & ~kills[b_label])
+        if newOut != outs[b_label]:
+          outs[b_label] = newOut
+          changed = True
+    return ins, outs
+
+  def levels(self):
+    '''
+      Splits the RPO into levels: a block's level is one more than the
+      deepest of its predecessors, ignoring back edges (the edges that
+      go up the RPO).
+    '''
+    rank = {}
+    for i, label in enumerate(self.order):
+      rank[label] = i
+    depths = []
+    levels = []
+    for i, label in enumerate(self.order):
+      depth = 0
+      for pred in self.getPredecessors(label):
+        p = rank[pred]
+        if p < i and depths[p] >= depth:
+          depth = depths[p] + 1
+      depths.append(depth)
+      if depth == len(levels):
+        levels.append([])
+      levels[depth].append(label)
+    return levels
+
+  def toMatrix(self, bitsets, words):
+    # Row i holds bitset i as little-endian 64-bit words, so every
+    # element covers 64 facts and int <-> row is a plain byte copy
+    packed = b''.join(bits.to_bytes(words * 8, 'little') for bits in bitsets)
+    return np.frombuffer(packed, dtype='<u8').reshape(len(bitsets), words).copy()
+
+  def fromMatrix(self, matrix):
+    return [int.from_bytes(row.tobytes(), 'little') for row in matrix]
+
+  def numpyWorklist(self, gens, kills, nfacts, top, levels):
+    # Number the blocks level by level, so the rows of a level are one
+    # contiguous slice of every matrix
+    blocks = [label for level in levels for label in level]
+    index = {}
+    for i, label in enumerate(blocks):
+      index[label] = i
+    n = len(blocks)
+    words = (nfacts + 63) // 64
+    reduce = np.bitwise_or.reduceat if self.meet == Meet.UNION else np.bitwise_and.reduceat
+
+    gen = self.toMatrix([gens[label] for label in blocks], words)
+    keep = ~self.toMatrix([kills[label] for label in blocks], words)
+    # Row n is a pseudo-predecessor of the entry block holding init
+    outs = self.toMatrix([top] * n + [self.init], words)
+
+    # Per level: its slice of rows, the rows of its blocks' preds laid
+    # out block after block, and where each block's preds start
+    plan = []
+    first = 0
+    for level in levels:
+      preds = []
+      starts = []
+      for label in level:
+        starts.append(len(preds))
+        preds.extend([index[pred] for pred in self.getPredecessors(label)])
+      if first == 0:
+        preds.append(n)         # the entry block is alone in level 0
+      last = first + len(level)
+      plan.append((first, last, np.array(preds), np.array(starts)))
+      first = last
+
+    changed = True
+    while changed:
+      self.sweeps += 1
+      before = outs.copy()
+      for first, last, preds, starts in plan:
+        levelOuts = reduce(outs[preds], starts, axis=0)
+        levelOuts &= keep[first:last]
+        levelOuts |= gen[first:last]
+        outs[first:last] = levelOuts
+      changed = not np.array_equal(before, outs)
+
+    ins = np.empty((n, words), dtype='<u8')
+    for first, last, preds, starts in plan:
+      ins[first:last] = reduce(outs[preds], starts, axis=0)
+    inBits = self.fromMatrix(ins)
+    outBits = self.fromMatrix(outs[:n])
+    return dict(zip(blocks, inBits)), dict(zip(blocks, outBits))
+
+  def worklist(self):
+    self.setup()
+    gens = {}
+    kills = {}
+    for label in self.order:
+      gens[label] = self.gen(label)
+      kills[label] = self.kill(label)
+    full = self.init
+    for label in self.order:
+      full |= gens[label] | kills[label]
+    nfacts = full.bit_length()
+    top = 0 if self.meet == Meet.UNION else (1 << nfacts) - 1
+
+    self.sweeps = 0
+    backend, levels = self.chooseBackend(nfacts)
+    if backend == 'numpy':
+      ins, outs = self.numpyWorklist(gens, kills, nfacts, top, levels)
+    else:
+      ins, outs = self.scalarWorklist(gens, kills, top)
+    # Report blocks in CFG order like Worklist does
+    return {label: ins[label] for label in self.cfg}, {label: outs[label] for label in self.cfg}
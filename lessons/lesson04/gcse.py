@@ -0,0 +1,230 @@
+import itertools
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
+import bitvector as bv
+import instrument
+import stream
+
+'''
+Global common subexpression elimination
+
+    Available expressions, solved with an intersection meet. A fact is
+    a pair (expression, var holding it) and every pair computed in the
+    function gets a bit. An expression is its op and canonical operands:
+    a var copied from another var (id) or set by a const is looked
+    through, as long as the source hasn't been redefined, so `sub v12 v13`
+    and `sub v18 v19` match when both read const 0 and b.
+
+    A recomputation of an available expression reads the var that holds
+    it instead, and later uses in the block are rewritten to that var so
+    the copy usually ends up dead (run tdce afterwards).
+
+    Example:
+    .entry:                                 .entry:
+        x: int = mul a b;                       x: int = mul a b;
+        br c .left .right;                      br c .left .right;
+    .left:                                  .left:
+        y: int = add a one;                     y: int = add a one;
+        jmp .join;                  --->        jmp .join;
+    .right:                                 .right:
+        jmp .join;                              jmp .join;
+    .join:                                  .join:
+        z: int = mul b a;                       z: int = id x;
+        print z;                                print x;
+'''
+
+PURE = ('add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or',
+        'fadd', 'fsub', 'fmul', 'fdiv', 'feq', 'flt', 'fgt', 'fle', 'fge',
+        'ceq', 'clt', 'cgt', 'cle', 'cge', 'char2int', 'int2char', 'ptradd')
+COMMUTATIVE = ('add', 'mul', 'eq', 'and', 'or', 'fadd', 'fmul', 'feq', 'ceq')
+
+class Expressions:
+  '''
+    Numbers the (expression, holder) facts of a function and keeps the
+    canonical expression of every pure instruction, keyed by
+    (block label, index in block).
+  '''
+  def __init__(self, blocks):
+    self.keys = {}          # map from (label, index) -> expression
+    self.factIds = {}       # map from (expression, holder) -> fact ID
+    self.facts = []         # fact ID -> (expression, holder)
+    self.mentions = {}      # map from varName -> bitset of facts it invalidates
+    for block in blocks:
+      label = block[0]['label']
+      copies = Copies()
+      for i, insn in enumerate(block):
+        if 'dest' not in insn:
+          continue
+        key = None
+        if insn['op'] in PURE and 'args' in insn and 'funcs' not in insn:
+          key = expression(insn, copies)
+          self.keys[(label, i)] = key
+        copies.define(insn)
+        if key is not None and not mentions(key, insn['dest']):
+          self.addFact(key, insn['dest'])
+
+  def addFact(self, key, holder):
+    if (key, holder) in self.factIds:
+      return
+    factId = len(self.facts)
+    self.factIds[(key, holder)] = factId
+    self.facts.append((key, holder))
+    for var in [holder] + [arg for arg in key[1:] if isinstance(arg, str)]:
+      self.mentions[var] = self.mentions.get(var, 0) | (1 << factId)
+
+  def killedBy(self, var):
+    return self.mentions.get(var, 0)
+
+  def generated(self, label, index, insn):
+    '''
+      Fact set up by insn, or None.
+    '''
+    key = self.keys.get((label, index))
+    if key is None or mentions(key, insn['dest']):
+      return None
+    return self.factIds[(key, insn['dest'])]
+
+class Copies:
+  '''
+    Block-local map from a var to the var it copies or the const it
+    holds. Redefining either side drops the entry.
+  '''
+  def __init__(self):
+    self.source = {}        # map from varName -> varName or ('const', type, value)
+    self.copiesOf = {}      # map from varName -> set of vars copying it
+
+  def resolve(self, var):
+    return self.source.get(var, var)
+
+  def define(self, insn):
+    dest = insn['dest']
+    self.forget(dest)
+    for copy in self.copiesOf.pop(dest, set()):
+      self.source.pop(copy, None)
+    if insn['op'] == 'const':
+      self.source[dest] = ('const', insn['type'], insn['value'])
+    elif insn['op'] == 'id' and self.resolve(insn['args'][0]) != dest:
+      source = self.resolve(insn['args'][0])
+      self.source[dest] = source
+      if isinstance(source, str):
+        self.copiesOf.setdefault(source, set()).add(dest)
+
+  def forget(self, var):
+    source = self.source.pop(var, None)
+    if isinstance(source, str):
+      self.copiesOf[source].discard(var)
+
+def expression(insn, copies):
+  args = [copies.resolve(arg) for arg in insn['args']]
+  if insn['op'] in COMMUTATIVE:
+    args.sort(key=repr)
+  return (insn['op'],) + tuple(args)
+
+def mentions(key, var):
+  return var in key[1:]
+
+def gen(b):
+  generated = 0
+  for i, insn in enumerate(worklist.getBasicBlock(b)):
+    if 'dest' in insn:
+      generated &= ~exprs.killedBy(insn['dest'])
+      factId = exprs.generated(b, i, insn)
+      if factId is not None:
+        generated |= 1 << factId
+  return generated
+
+def kill(b):
+  killed = 0
+  for insn in worklist.getBasicBlock(b):
+    if 'dest' in insn:
+      killed |= exprs.killedBy(insn['dest'])
+  return killed
+
+def availableHolders(available):
+  holders = {}      # map from expression -> set of vars holding it
+  factId = 0
+  while available:
+    if available & 1:
+      key, holder = exprs.facts[factId]
+      holders.setdefault(key, set()).add(holder)
+    available >>= 1
+    factId += 1
+  return holders
+
+def eliminate(b, ins):
+  '''
+    Rewrites block b, given the facts available on entry. Returns the
+    new block and how many instructions it rewrote.
+  '''
+  holders = availableHolders(ins)
+  renamed = {}      # map from varName -> var to read instead
+  newBlock = []
+  rewrites = 0
+  for i, insn in enumerate(worklist.getBasicBlock(b)):
+    if 'args' in insn:
+      insn['args'] = [renamed.get(arg, arg) for arg in insn['args']]
+    if 'dest' not in insn:
+      newBlock.append(insn)
+      continue
+    dest = insn['dest']
+    key = exprs.keys.get((b, i))
+    holder = None
+    if key is not None and key in holders:
+      holder = dest if dest in holders[key] else min(holders[key])
+      holder = renamed.get(holder, holder)
+
+    # dest changes: anything it held, fed or was renamed to is stale
+    renamed.pop(dest, None)
+    for var in [var for var, target in renamed.items() if target == dest]:
+      del renamed[var]
+    for key2 in list(holders):
+      if mentions(key2, dest):
+        del holders[key2]
+      else:
+        holders[key2].discard(dest)
+        if not holders[key2]:
+          del holders[key2]
+
+    if holder is None:
+      newBlock.append(insn)
+    elif holder != dest:
+      newBlock.append({'op': 'id', 'type': insn['type'], 'args': [holder], 'dest': dest})
+      renamed[dest] = holder
+      rewrites += 1
+    else:
+      rewrites += 1         # dest already holds the value
+    if key is not None and not mentions(key, dest):
+      holders.setdefault(key, set()).add(dest)
+  return newBlock, rewrites
+
+@instrument.stage('gcse')
+def gcse(func):
+  global worklist, exprs
+  worklist = bv.BitVectorWorklist(func, 0, gen, kill, bv.Meet.INTERSECTION)
+  worklist.setup()
+  exprs = Expressions(worklist.basicBlocks)
+  ins, outs = worklist.worklist()
+  newBlocks = []
+  rewrites = 0
+  for block in worklist.basicBlocks:
+    label = block[0]['label']
+    if label in ins:
+      block, count = eliminate(label, ins[label])
+      rewrites += count
+    newBlocks.append(block)
+  func['instrs'] = list(itertools.chain(*newBlocks))
+  return rewrites
+
+def main():
+  reader = stream.reader(sys.stdin)
+  writer = stream.writer(sys.stdout)
+  for func in reader:
+    rewrites = gcse(func)
+    if '-s' in sys.argv:
+      print(func['name']+": "+str(rewrites)+" recomputations removed", file=sys.stderr)
+    writer.write(func)
+  writer.close(reader.extra)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,176 @@
+import sys
+import time
+import worklist as w
+import stream
+from lattice import INF, IntervalLattice, MapLattice
+
+'''
+Interval (range) analysis over Bril ints
+
+    Tracks an integer range [lo, hi] for every int variable. Booleans are
+    tracked as ranges over {0, 1} so comparisons whose outcome is known
+    show up as [0, 0] or [1, 1]. The interval lattice has infinite
+    ascending chains, so the worklist widens at loop heads and narrows
+    afterwards. A counter that widening left open ([1, inf]) may wrap on
+    its next add, so it becomes [-inf, inf].
+
+    Example:
+        br c .left .right;
+    .left:
+        d: int = const 2;                   d: [2, 2]
+        jmp .join;
+    .right:
+        d: int = const 5;                   d: [5, 5]
+    .join:                                  d: [2, 5]
+        q: int = div x d;                   divisor d is never 0
+'''
+
+MIN_INT = -2**63
+MAX_INT = 2**63 - 1
+
+intervals = IntervalLattice()
+TOP = intervals.top()
+
+def clamp(lo, hi):
+    # Bril ints wrap around, so anything that may overflow is unknown. Only
+    # widening makes a bound infinite; arithmetic on it may wrap, so an
+    # infinite bound coming out of add/sub/mul/div is an overflow too.
+    if lo < MIN_INT or hi > MAX_INT:
+        return TOP
+    return (lo, hi)
+
+def mul(x, y):
+    if x == 0 or y == 0:
+        return 0
+    return x * y
+
+def truncDiv(x, y):
+    if x in (INF, -INF):
+        return x if y > 0 else -x
+    if y in (INF, -INF):
+        return 0
+    quotient = abs(x) // abs(y)
+    return quotient if (x < 0) == (y < 0) else -quotient
+
+def containsZero(a):
+    return a[0] <= 0 <= a[1]
+
+def evaluate(op, args):
+    match op:
+        case 'add':
+            return clamp(args[0][0] + args[1][0], args[0][1] + args[1][1])
+        case 'sub':
+            return clamp(args[0][0] - args[1][1], args[0][1] - args[1][0])
+        case 'mul':
+            products = [mul(x, y) for x in args[0] for y in args[1]]
+            return clamp(min(products), max(products))
+        case 'div':
+            if containsZero(args[1]):
+                return TOP
+            quotients = [truncDiv(x, y) for x in args[0] for y in args[1]]
+            return clamp(min(quotients), max(quotients))
+        case 'eq':
+            if args[0][0] == args[0][1] == args[1][0] == args[1][1]:
+                return (1, 1)
+            if args[0][1] < args[1][0] or args[1][1] < args[0][0]:
+                return (0, 0)
+        case 'lt':
+            return compare(args[0][1] < args[1][0], args[0][0] >= args[1][1])
+        case 'gt':
+            return compare(args[0][0] > args[1][1], args[0][1] <= args[1][0])
+        case 'le':
+            return compare(args[0][1] <= args[1][0], args[0][0] > args[1][1])
+        case 'ge':
+            return compare(args[0][0] >= args[1][1], args[0][1] < args[1][0])
+        case 'not':
+            return (1 - args[0][1], 1 - args[0][0])
+        case 'and':
+            return (min(args[0][0], args[1][0]), min(args[0][1], args[1][1]))
+        case 'or':
+            return (max(args[0][0], args[1][0]), max(args[0][1], args[1][1]))
+        case 'id':
+            return args[0]
+    return (0, 1)
+
+def compare(alwaysTrue, alwaysFalse):
+    if alwaysTrue:
+        return (1, 1)
+    if alwaysFalse:
+        return (0, 0)
+    return (0, 1)
+
+def transferInsn(insn, env):
+    if 'dest' not in insn:
+        return
+    dest = insn['dest']
+    if insn['type'] not in ('int', 'bool'):
+        env.pop(dest, None)
+    elif insn['op'] == 'const':
+        value = int(insn['value'])
+        env[dest] = (value, value)
+    elif insn['op'] in ('add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or', 'id'):
+        args = [envLattice.get(env, arg) for arg in insn['args']]
+        if None in args:
+            env.pop(dest, None)     # some arg is undefined along every path so far
+        else:
+            env[dest] = evaluate(insn['op'], args)
+    elif insn['type'] == 'bool':
+        env[dest] = (0, 1)
+    else:
+        env[dest] = TOP
+
+def transfer(b, ins):
+    env = dict(ins)
+    for insn in worklist.getBasicBlock(b):
+        transferInsn(insn, env)
+    return env
+
+def entryEnv(func):
+    env = {}
+    if 'args' in func:
+        for arg in func['args']:
+            if arg['type'] == 'int':
+                env[arg['name']] = TOP
+            elif arg['type'] == 'bool':
+                env[arg['name']] = (0, 1)
+    return env
+
+def facts(b, env):
+    '''
+        Re-walk block b from its IN state and report the divisions
+        that can't trap and the comparisons with a known outcome.
+    '''
+    env = dict(env)
+    found = []
+    for insn in worklist.getBasicBlock(b):
+        if 'op' in insn and insn['op'] == 'div':
+            divisor = envLattice.get(env, insn['args'][1])
+            if divisor is not None and not containsZero(divisor):
+                found.append(insn['dest']+": divisor "+insn['args'][1]+" is never 0")
+        transferInsn(insn, env)
+        if 'op' in insn and insn['op'] in ('eq', 'lt', 'gt', 'le', 'ge'):
+            result = env.get(insn['dest'])
+            if result in ((0, 0), (1, 1)):
+                found.append(insn['dest']+": always "+("true" if result[0] else "false"))
+    return found
+
+def formatEnv(env):
+    return ", ".join(var+": ["+str(lo)+", "+str(hi)+"]" for var, (lo, hi) in sorted(env.items()))
+
+envLattice = MapLattice(intervals)
+direction = w.Direction.FORWARD
+
+program = stream.load(sys.stdin)
+for func in program['functions']:
+  worklist = w.Worklist(func, entryEnv(func), None, transfer, direction, lattice=envLattice)
+  start = time.perf_counter()
+  ins, outs = worklist.worklist()
+  elapsed = time.perf_counter() - start
+  print(func['name']+' function\n')
+  for key, value in ins.items():
+    print(key+": "+formatEnv(value))
+    for fact in facts(key, value):
+      print("  "+fact)
+  if '-t' in sys.argv:
+    print('\nsolved in '+str(round(elapsed*1000, 3))+' ms')
+  print('----------------------------------------------\n')
@@ -0,0 +1,105 @@
+INF = float('inf')
+
+class Lattice:
+  '''
+    Interface for the abstract domains handed to Worklist.
+
+    Finite-height domains only need bottom, join and leq. Domains with
+    infinite ascending chains (intervals) also override widen, which
+    Worklist applies at loop heads, and narrow, which it applies during
+    the bounded narrowing passes afterwards.
+  '''
+  def bottom(self):
+    raise NotImplementedError
+
+  def join(self, a, b):
+    raise NotImplementedError
+
+  def leq(self, a, b):
+    raise NotImplementedError
+
+  def widen(self, old, new):
+    return self.join(old, new)
+
+  def narrow(self, old, new):
+    return old
+
+class IntervalLattice(Lattice):
+  '''
+    Integer ranges [lo, hi], where lo/hi may be -INF/INF.
+    Bottom (the empty range) is None.
+  '''
+  def bottom(self):
+    return None
+
+  def top(self):
+    return (-INF, INF)
+
+  def join(self, a, b):
+    if a is None:
+      return b
+    if b is None:
+      return a
+    return (min(a[0], b[0]), max(a[1], b[1]))
+
+  def leq(self, a, b):
+    if a is None:
+      return True
+    if b is None:
+      return False
+    return b[0] <= a[0] and a[1] <= b[1]
+
+  def widen(self, old, new):
+    if old is None:
+      return new
+    if new is None:
+      return old
+    lo = old[0] if new[0] >= old[0] else -INF
+    hi = old[1] if new[1] <= old[1] else INF
+    return (lo, hi)
+
+  def narrow(self, old, new):
+    if old is None or new is None:
+      return new
+    lo = new[0] if old[0] == -INF else old[0]
+    hi = new[1] if old[1] == INF else old[1]
+    return (lo, hi)
+
+class MapLattice(Lattice):
+  '''
+    Environment lattice: map from variable name to an element of an
+    inner lattice, compared pointwise. Missing variables are bottom.
+  '''
+  def __init__(self, inner):
+    self.inner = inner
+
+  def bottom(self):
+    return {}
+
+  def get(self, env, var):
+    if var not in env:
+      return self.inner.bottom()
+    return env[var]
+
+  def pointwise(self, a, b, op):
+    result = {}
+    for var in set(a) | set(b):
+      value = op(self.get(a, var), self.get(b, var))
+      if value != self.inner.bottom():
+        result[var] = value
+    return result
+
+  def join(self, a, b):
+    return self.pointwise(a, b, self.inner.join)
+
+  def leq(self, a, b):
+    for var, value in a.items():
+      if not self.inner.leq(value, self.get(b, var)):
+        return False
+    return True
+
+  def widen(self, old, new):
+    return self.pointwise(old, new, self.inner.widen)
+
+  def narrow(self, old, new):
+    return self.pointwise(old, new, self.inner.narrow)
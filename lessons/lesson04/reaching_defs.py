@@ -1,42 +1,69 @@
-import json
 import sys
-import worklist as w
-
-def merge(mergeList):
-  mergeDict = {}
-  for dict in mergeList:
-    for key, value in dict.items():
-      if key in mergeDict:
-        mergeDict[key].extend(value)
-      else:
-        mergeDict[key] = value.copy()
-  return mergeDict
-
-def transfer(b, ins):
-  transfer = {}
-  kills = worklist.kills(b,ins)
-  defs = worklist.defs(b)
-  for varIn, valueIn in ins.items():
-    if varIn not in kills:
-      transfer[varIn] = valueIn
-  for varDef, valueDef in defs.items():
-    transfer[varDef] = [valueDef]
-
-  return transfer
-
-init = {}
-direction = w.Direction.FORWARD
-
-program = json.load(sys.stdin)
+import bitvector as bv
+import stream
+
+'''
+Reaching definitions
+
+    Every definition site gets an integer ID (see Worklist.numberDefinitions)
+    and the facts are int bitsets over those IDs, so identical defs in
+    different blocks stay distinct and merge is a single bitwise or.
+    The problem is solved by BitVectorWorklist, which moves very large
+    functions onto NumPy bit matrices (see bitvector.py).
+'''
+
+def gen(b):
+  return worklist.defs(b)
+
+def kill(b):
+  return worklist.kills(b)
+
+def describe(defs):
+  described = []
+  defId = 0
+  while defs:
+    if defs & 1:
+      described.append(worklist.describeDefinition(defId))
+    defs >>= 1
+    defId += 1
+  return described
+
+def useDefChains(b, ins):
+  '''
+    For every use in block b, the bitset of definitions it may read.
+  '''
+  chains = []
+  reaching = ins
+  if b == worklist.basicBlocks[0][0]['label']:
+    # the args are defined on the way into the entry block
+    reaching |= worklist.argDefs
+  for i, insn in enumerate(worklist.getBasicBlock(b)):
+    if 'args' in insn:
+      for arg in insn['args']:
+        chains.append((i, arg, reaching & worklist.varDefs.get(arg, 0)))
+    if 'dest' in insn:
+      defId = worklist.defIds[(b, i)]
+      reaching = (reaching & ~worklist.varDefs[insn['dest']]) | (1 << defId)
+  return chains
+
+init = 0
+
+program = stream.load(sys.stdin)
 for func in program['functions']:
-  worklist = w.Worklist(func, init, merge, transfer, direction)
+  worklist = bv.BitVectorWorklist(func, init, gen, kill, bv.Meet.UNION)
   ins, outs = worklist.worklist()
   print('ins\n')
   for key, value in ins.items():
-    print(key+":"+str(value))
+    print(key+":"+str(describe(value)))
     print('\n')
   print('outs\n')
   for key, value in outs.items():
-    print(key+":"+str(value))
+    print(key+":"+str(describe(value)))
+    print('\n')
+  if '-u' in sys.argv:
+    print('use-def chains\n')
+    for key, value in ins.items():
+      for i, arg, defs in useDefChains(key, value):
+        print(key+"["+str(i)+"] "+arg+" <- "+str(describe(defs)))
     print('\n')
-  print('----------------------------------------------\n')
\ No newline at end of file
+  print('----------------------------------------------\n')
@@ -1,6 +1,8 @@
+from collections import deque
 from enum import Enum
+import os
 import sys
-sys.path.append("../library")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
 import cfg
 
 class Direction(Enum):
@@ -8,20 +10,68 @@ class Direction(Enum):
   BACKWARD = 2
 
 class Worklist:
-  def __init__(self, function, init, merge, transfer, direction):
+  '''
+    Passing a lattice (see lattice.py) instead of a merge function makes
+    the solver join with lattice.join, widen at the heads of back edges and
+    then run up to `narrowing` narrowing passes. init is the value flowing
+    into the entry block in that mode.
+  '''
+  def __init__(self, function, init, merge, transfer, direction, lattice=None, narrowing=2):
       self.init = init
       self.merge = merge
       self.transfer = transfer
       self.direction = direction
       self.function = function
+      self.lattice = lattice
+      self.narrowing = narrowing
       self.basicBlocks = []
       self.cfg = {}
       self.predecessors = {}
+      self.order = []
+      self.backEdges = set()
+      self.defSites = None
 
   def setup(self):
     self.basicBlocks = cfg.formBasicBlocks(self.function['instrs'])
+    self.blockMap = {}
+    for block in self.basicBlocks:
+      self.blockMap[block[0]['label']] = block
     self.cfg = cfg.createCFG(self.function['instrs'])
     self.predecessors = self.buildPredecessorList()
+    self.order, self.backEdges = self.depthFirstOrder()
+
+  def depthFirstOrder(self):
+    '''
+      Returns (reverse postorder of the CFG, set of back edges (u, v))
+      where a back edge targets a block still on the DFS stack.
+    '''
+    entry = list(self.cfg.keys())[0]
+    postorder = []
+    backEdges = set()
+    onStack = {entry}
+    visited = {entry}
+    stack = [(entry, iter(self.getSuccessors(entry)))]
+    while len(stack) != 0:
+      label, successors = stack[-1]
+      pushed = False
+      for s in successors:
+        if s in onStack:
+          backEdges.add((label, s))
+        elif s not in visited:
+          visited.add(s)
+          onStack.add(s)
+          stack.append((s, iter(self.getSuccessors(s))))
+          pushed = True
+          break
+      if not pushed:
+        stack.pop()
+        onStack.discard(label)
+        postorder.append(label)
+    postorder.reverse()
+    return postorder, backEdges
+
+  def getWideningPoints(self):
+    return set(v for u, v in self.backEdges)
 
   def buildPredecessorList(self):
     predecessors = {}
@@ -33,25 +83,69 @@ class Worklist:
           predecessors[successor] = [label]
     return predecessors
 
+  def numberDefinitions(self):
+    '''
+      Gives every definition site a unique integer ID. Sets of
+      definitions are then int bitsets with bit i standing for
+      self.defSites[i] = (block label, index in block, insn). Function
+      arg k is defined at index -1 - k of the entry block, before its
+      first insn.
+    '''
+    self.defSites = []
+    self.defIds = {}        # map from (label, index) -> def ID
+    self.varDefs = {}       # map from varName -> bitset of all its defs
+    self.blockDefs = {}     # map from label -> {varName: ID of last def in block}
+    self.argDefs = 0        # bitset of the args' defs
+    entry = self.basicBlocks[0][0]['label']
+    if 'args' in self.function:
+      for k, arg in enumerate(self.function['args']):
+        self.addDefinition(entry, -1 - k, {'dest': arg['name'], 'op': 'arg'})
+        self.argDefs |= 1 << self.defIds[(entry, -1 - k)]
+    for block in self.basicBlocks:
+      label = block[0]['label']
+      for i, insn in enumerate(block):
+        if 'dest' in insn:
+          self.addDefinition(label, i, insn)
+
+  def addDefinition(self, label, index, insn):
+    defId = len(self.defSites)
+    self.defSites.append((label, index, insn))
+    self.defIds[(label, index)] = defId
+    var = insn['dest']
+    self.varDefs[var] = self.varDefs.get(var, 0) | (1 << defId)
+    if label not in self.blockDefs:
+      self.blockDefs[label] = {}
+    self.blockDefs[label][var] = defId
+
   def defs(self, b_label):
-    defs = {}
-    block = self.getBasicBlock(b_label)
-    for insn in block:
-      if 'dest' in insn:
-        if 'value' in insn:
-          defs[insn['dest']] = (insn['op'], insn['value'])
-        else:
-          defs[insn['dest']] = (insn['op'], insn['args'])
+    '''
+      Bitset of the definitions in b_label that reach its end.
+    '''
+    if self.defSites is None:
+      self.numberDefinitions()
+    defs = 0
+    for var, defId in self.blockDefs.get(b_label, {}).items():
+      defs |= 1 << defId
     return defs
 
-  def kills(self, b_label, avail):
-    kills = {}
-    defs = self.defs(b_label)
-    for var, value in defs.items():
-      if var in avail:
-        kills[var] = avail[var]
+  def kills(self, b_label):
+    '''
+      Bitset of every definition of a variable that b_label redefines.
+    '''
+    if self.defSites is None:
+      self.numberDefinitions()
+    kills = 0
+    for var in self.blockDefs.get(b_label, {}):
+      kills |= self.varDefs[var]
     return kills
 
+  def describeDefinition(self, defId):
+    label, index, insn = self.defSites[defId]
+    if insn['op'] == 'arg':
+      return insn['dest']+" = arg ("+label+")"
+    value = insn['value'] if 'value' in insn else " ".join(insn.get('args', []))
+    return insn['dest']+" = "+insn['op']+" "+str(value)+" ("+label+", "+str(index)+")"
+
   def getSuccessors(self, block):
     if block not in self.cfg:
       return []
@@ -63,22 +157,61 @@ class Worklist:
     return self.predecessors[block]
 
   def getBasicBlock(self, b_label):
-    for block in self.basicBlocks:
-      if block[0]['label'] == b_label:
-        return block
-    return None
-
-  def removeDupDefs(self, d):
-    for key, value in d.items():
-      for var, l in value.items():
-        newList = []
-        for x in l:
-          if x not in newList:
-            newList.append(x)
-        value[var] = newList
+    if b_label not in self.blockMap:
+      return None
+    return self.blockMap[b_label]
+
+  def joinPredecessors(self, b_label, outs):
+    joined = self.init if b_label == self.order[0] else self.lattice.bottom()
+    for pred in self.getPredecessors(b_label):
+      joined = self.lattice.join(joined, outs[pred])
+    return joined
+
+  def latticeWorklist(self):
+    ins = {}
+    outs = {}
+    for label in self.cfg:
+      ins[label] = self.lattice.bottom()
+      outs[label] = self.lattice.bottom()
+    wideningPoints = self.getWideningPoints()
+
+    # Ascending phase, widening at loop heads so it terminates
+    worklist = deque(self.order)
+    onWorklist = set(self.order)
+    while len(worklist) != 0:
+      b_label = worklist.popleft()
+      onWorklist.discard(b_label)
+      newIn = self.joinPredecessors(b_label, outs)
+      if b_label in wideningPoints:
+        newIn = self.lattice.widen(ins[b_label], newIn)
+      ins[b_label] = newIn
+      newOut = self.transfer(b_label, newIn)
+      if not self.lattice.leq(newOut, outs[b_label]):
+        outs[b_label] = self.lattice.join(outs[b_label], newOut)
+        for s in self.getSuccessors(b_label):
+          if s not in onWorklist:
+            onWorklist.add(s)
+            worklist.append(s)
+
+    # Descending phase, recovering the bounds widening threw away
+    for i in range(self.narrowing):
+      changed = False
+      for b_label in self.order:
+        newIn = self.joinPredecessors(b_label, outs)
+        if b_label in wideningPoints:
+          newIn = self.lattice.narrow(ins[b_label], newIn)
+        if newIn != ins[b_label]:
+          changed = True
+        ins[b_label] = newIn
+        outs[b_label] = self.transfer(b_label, newIn)
+      if not changed:
+        break
+    return ins, outs
 
   def worklist(self):
     self.setup()
+    if self.lattice is not None:
+      return self.latticeWorklist()
     ins = {}
     outs = {}
     worklist = []
@@ -99,6 +232,4 @@ class Worklist:
         for s in self.getSuccessors(b_label):
           if s not in worklist:
             worklist.append(s)
-    self.removeDupDefs(ins)
-    self.removeDupDefs(outs)
     return ins, outs
\ No newline at end of file
@@ -1,5 +1,6 @@
+import os
 import sys
-sys.path.append("../library")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
 import json
 import cfg
 import graph
@@ -0,0 +1,156 @@
+import itertools
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
+import cfg
+import dominators
+import instrument
+import stream
+
+'''
+Aggressive dead code elimination
+
+    Everything is dead until proven live. Instructions with side effects
+    (print, ret, call, store, free, ...) are live, and so is:
+        - every def of a var read by a live instruction
+        - the branch a live block is control dependent on, i.e. every
+          block in the live block's post-dominance frontier
+    A branch that stays dead becomes a jmp to the closest live
+    post-dominator, and blocks no longer reachable from the entry are
+    dropped. Unlike tdce, this removes loops and branches that only
+    compute values nobody reads.
+
+    Example:
+        i: int = const 0;                   print n;
+        s: int = const 0;                   ret;
+    .loop:
+        c: bool = lt i n;
+        br c .body .done;       --->
+    .body:
+        s: int = add s i;
+        i: int = add i one;
+        jmp .loop;
+    .done:
+        print n;
+        ret;
+'''
+
+EXIT = '__exit__'
+NOT_ROOTS = ('br', 'jmp', 'nop', 'label')
+
+def isRoot(insn):
+    if 'label' in insn or insn['op'] in NOT_ROOTS:
+        return False
+    return 'dest' not in insn or insn['op'] == 'call'
+
+@instrument.stage('post-dominators')
+def postDominators(blocks, successors):
+    '''
+        input: basic blocks, CFG (reachable blocks only)
+        output: map: label -> set of labels that post-dominate it,
+                map: label -> labels of its successors on the reversed CFG
+                (None, None) if some block can't reach the exit
+    '''
+    reverse = {EXIT: []}        # reversed CFG, rooted at a virtual exit
+    reversePreds = {}           # map from label -> successors in the CFG
+    for block in blocks:
+        label = block[0]['label']
+        if label not in successors:
+            continue
+        reverse[label] = []
+        reversePreds[label] = list(successors[label])
+        if len(successors[label]) == 0:
+            reverse[EXIT].append(label)
+            reversePreds[label].append(EXIT)
+    for label in successors:
+        for succ in successors[label]:
+            reverse[succ].append(label)
+    if len(cfg.dfs(set(), reverse, EXIT, set())) != len(reverse):
+        return None, None       # infinite loop, post-dominance is undefined
+    return dominators.getDominators(reverse, reversePreds), reversePreds
+
+def immediatePostDominator(label, pdom):
+    # The strict post-dominators form a chain, the closest one has the most
+    strict = [p for p in pdom[label] if p != label]
+    return max(strict, key=lambda p: len(pdom[p]))
+
+@instrument.stage('adce')
+def adce(func):
+    '''
+        input: function
+        output: number of instructions removed, number of blocks removed
+    '''
+    blocks = cfg.formBasicBlocks(func['instrs'])
+    if len(blocks) == 0:
+        return 0, 0
+    before = sum(len(block) - 1 for block in blocks)
+    successors = cfg.createCFG(list(itertools.chain(*blocks)))
+    reachable = [block for block in blocks if block[0]['label'] in successors]
+    pdom, reversePreds = postDominators(reachable, successors)
+    frontier = {}
+    if pdom is not None:
+        frontier = dominators.getDominanceFrontier(pdom, reversePreds)
+
+    defs = {}           # map from varName -> (label, index) of each def
+    for block in reachable:
+        for i, insn in enumerate(block):
+            if 'dest' in insn:
+                defs.setdefault(insn['dest'], []).append((block[0]['label'], i))
+
+    code = {block[0]['label']: block for block in reachable}
+    marked = set()      # (label, index) of live instructions
+    liveBlocks = set()
+    worklist = []
+    for label, block in code.items():
+        for i, insn in enumerate(block):
+            if isRoot(insn) or (pdom is None and insn.get('op') == 'br'):
+                worklist.append((label, i))
+    while len(worklist) != 0:
+        site = worklist.pop()
+        if site in marked:
+            continue
+        marked.add(site)
+        label, i = site
+        for arg in code[label][i].get('args', []):
+            worklist.extend(defs.get(arg, []))
+        if label not in liveBlocks:
+            liveBlocks.add(label)
+            for dependsOn in frontier.get(label, set()):
+                if dependsOn != EXIT:
+                    worklist.append((dependsOn, len(code[dependsOn]) - 1))
+
+    newBlocks = []
+    for label, block in code.items():
+        newBlock = []
+        for i, insn in enumerate(block):
+            if 'label' in insn or (label, i) in marked or insn['op'] == 'jmp':
+                newBlock.append(insn)
+            elif insn['op'] == 'br':
+                target = immediatePostDominator(label, pdom)
+                while target != EXIT and target not in liveBlocks:
+                    target = immediatePostDominator(target, pdom)
+                if target == EXIT:
+                    newBlock.append({'op': 'ret', 'args': []})
+                else:
+                    newBlock.append({'op': 'jmp', 'labels': [target]})
+        newBlocks.append(newBlock)
+
+    # Retargeted branches can leave whole regions unreachable
+    successors = cfg.createCFG(list(itertools.chain(*newBlocks)))
+    newBlocks = [block for block in newBlocks if block[0]['label'] in successors]
+    func['instrs'] = list(itertools.chain(*newBlocks))
+    after = sum(len(block) - 1 for block in newBlocks)
+    return before - after, len(blocks) - len(newBlocks)
+
+def main():
+    reader = stream.reader(sys.stdin)
+    writer = stream.writer(sys.stdout)
+    for func in reader:
+        removed, removedBlocks = adce(func)
+        if '-s' in sys.argv:
+            print(func['name']+": "+str(removed)+" instructions and "+str(removedBlocks)+" blocks removed", file=sys.stderr)
+        writer.write(func)
+    writer.close(reader.extra)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
+import sparse
+import stream
+
+'''
+Sparse constant propagation
+
+    Every SSA name maps to one of:
+        UNDEF       no def of the name has been evaluated yet (top)
+        <constant>  the name always holds this value
+        NAC         not a constant (bottom)
+
+    Example:
+        a.1: int = const 4                  a.1: 4
+        b.1: int = const 2                  b.1: 2
+        c.1: int = add a.1 b.1    --->      c.1: 6
+        d.1: int = call @f c.1              d.1: nac
+'''
+
+UNDEF = 'undef'
+NAC = 'nac'
+
+MAX_INT = 2**63 - 1
+FOLDABLE = ('add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or', 'id')
+
+def wrap(value):
+    # Bril ints are 64-bit two's complement
+    value = value & (2**64 - 1)
+    if value > MAX_INT:
+        value = value - 2**64
+    return value
+
+def fold(op, args):
+    match op:
+        case 'add':
+            return wrap(args[0] + args[1])
+        case 'sub':
+            return wrap(args[0] - args[1])
+        case 'mul':
+            return wrap(args[0] * args[1])
+        case 'div':
+            if args[1] == 0:
+                return NAC
+            quotient = abs(args[0]) // abs(args[1])
+            return wrap(quotient if (args[0] < 0) == (args[1] < 0) else -quotient)
+        case 'eq':
+            return args[0] == args[1]
+        case 'lt':
+            return args[0] < args[1]
+        case 'gt':
+            return args[0] > args[1]
+        case 'le':
+            return args[0] <= args[1]
+        case 'ge':
+            return args[0] >= args[1]
+        case 'not':
+            return not args[0]
+        case 'and':
+            return args[0] and args[1]
+        case 'or':
+            return args[0] or args[1]
+        case 'id':
+            return args[0]
+
+def merge(values):
+    merged = UNDEF
+    for value in values:
+        if value == UNDEF:
+            continue
+        if value == NAC:
+            return NAC
+        if merged == UNDEF:
+            merged = value
+        elif merged != value or type(merged) != type(value):
+            return NAC
+    return merged
+
+def transfer(insn, args):
+    if insn['op'] == 'const':
+        return insn['value']
+    if insn['op'] not in FOLDABLE or NAC in args:
+        return NAC
+    if UNDEF in args:
+        return UNDEF
+    return fold(insn['op'], args)
+
+def constants(func):
+    worklist = sparse.SparseWorklist(func, UNDEF, NAC, merge, transfer)
+    return worklist.worklist()
+
+def main():
+    program = stream.load(sys.stdin)
+    for func in program['functions']:
+        values = constants(func)
+        print(func['name']+' function')
+        for var, value in values.items():
+            print(var+": "+str(value).lower())
+        print('----------------------------------------------\n')
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
+import os
 import sys
-sys.path.append("../library")
-import json
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
 import cfg
 import graph
 import dominators_test
+import instrument
+import stream
 
 '''
     input: CFG
@@ -13,21 +15,29 @@ import dominators_test
             in CFG, A, and set of labels are the nodes
             that dominate A
 '''
+@instrument.stage('dominators')
 def getDominators(c, predecessors):
     dom = {}        # map from label to set
+    entry = list(c.keys())[0]
+    for vertex in c:
+        dom[vertex] = set(c.keys())
+    dom[entry] = {entry}
     changing = True
 
     while changing:
-        prevDom = dom.copy()
+        changing = False
         for vertex in c:
+            if vertex == entry:
+                continue
             dominatorsOfPredecessors = []   # list of sets
             for predecessor in cfg.getPredecessors(vertex,predecessors):
                 if predecessor in dom:
                     dominatorsOfPredecessors.append(dom[predecessor])
             intersection = set.intersection(*dominatorsOfPredecessors) if dominatorsOfPredecessors else set()
             intersection.add(vertex)
-            dom[vertex] = intersection.copy()
-            changing = prevDom == dom
+            if intersection != dom[vertex]:
+                dom[vertex] = intersection
+                changing = True
     return dom
 
 def doesStrictlyDominate(A, B, dom):
@@ -59,8 +69,9 @@ def getDominatorTree(dom):
     return domTree
 
 def inDominanceFrontier(A, B, dom, predecessors):
-    if doesStrictlyDominate(A,B,dom) or A == B:
-        return False  
+    # A == B is allowed: a loop header is in its own dominance frontier
+    if doesStrictlyDominate(A,B,dom):
+        return False
     preds = cfg.getPredecessors(B, predecessors)
 
     # Here, we ran into a weird situation where: 
@@ -72,6 +83,7 @@ def inDominanceFrontier(A, B, dom, predecessors):
             return True
     return False
 
+@instrument.stage('dominance frontier')
 def getDominanceFrontier(dom,predecessors):
     domFrontier = {}
     for A in dom:
@@ -83,7 +95,7 @@ def getDominanceFrontier(dom,predecessors):
     return domFrontier 
 
 def main():
-    program = json.load(sys.stdin)
+    program = stream.load(sys.stdin)
     for func in program['functions']:
         print(func['name']+' function')
         c = cfg.createCFG(func['instrs'])
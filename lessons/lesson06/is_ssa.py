@@ -1,5 +1,7 @@
-import json
+import os
 import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
+import stream
 
 
 def is_ssa(bril):
@@ -19,4 +21,4 @@ def is_ssa(bril):
 
 
 if __name__ == '__main__':
-    print('yes' if is_ssa(json.load(sys.stdin)) else 'no')
\ No newline at end of file
+    print('yes' if is_ssa(stream.load(sys.stdin)) else 'no')
\ No newline at end of file
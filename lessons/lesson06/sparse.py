@@ -0,0 +1,84 @@
+import copy
+from collections import deque
+import ssa
+
+class SparseWorklist:
+  '''
+    Sparse dataflow solver that runs over SSA def-use edges.
+
+    Unlike the dense worklist in lesson04, which pushes a map of every
+    variable through every block, each SSA name holds exactly one lattice
+    value here. When that value changes, only the instructions that use
+    the name are revisited, so the work done scales with the number of
+    uses instead of blocks x variables.
+
+      init:     lattice value every SSA name starts at (top)
+      entry:    lattice value of the function arguments
+      merge:    list of lattice values -> lattice value (used for phis)
+      transfer: (insn, list of arg values) -> lattice value of insn['dest']
+  '''
+  def __init__(self, function, init, entry, merge, transfer):
+    self.init = init
+    self.entry = entry
+    self.merge = merge
+    self.transfer = transfer
+    self.function = function
+    self.basicBlocks = []
+    self.defs = {}      # map from SSA name -> insn that defines it
+    self.uses = {}      # map from SSA name -> list of insns that read it
+
+  def setup(self):
+    # convertToSSA rewrites the function it is given, so work on a copy
+    self.basicBlocks = ssa.convertToSSA(copy.deepcopy(self.function))
+    for block in self.basicBlocks:
+      for insn in block:
+        if 'dest' in insn:
+          self.defs[insn['dest']] = insn
+        if 'args' in insn:
+          for arg in insn['args']:
+            if arg not in self.uses:
+              self.uses[arg] = []
+            self.uses[arg].append(insn)
+
+  def getUses(self, var):
+    if var not in self.uses:
+      return []
+    return self.uses[var]
+
+  def getValue(self, values, var):
+    if var not in values:
+      return self.init
+    return values[var]
+
+  def evaluate(self, insn, values):
+    argValues = []
+    if 'args' in insn:
+      for arg in insn['args']:
+        argValues.append(self.getValue(values, arg))
+    if insn['op'] == 'phi':
+      return self.merge(argValues)
+    return self.transfer(insn, argValues)
+
+  def worklist(self):
+    self.setup()
+    values = {}
+    if 'args' in self.function:
+      for arg in self.function['args']:
+        values[arg['name']] = self.entry
+    for var in self.defs:
+      values[var] = self.init
+
+    worklist = deque(self.defs.values())
+    onWorklist = set(self.defs.keys())
+    while len(worklist) != 0:
+      insn = worklist.popleft()
+      dest = insn['dest']
+      onWorklist.discard(dest)
+      value = self.evaluate(insn, values)
+      if value != values[dest]:
+        values[dest] = value
+        for use in self.getUses(dest):
+          if 'dest' in use and use['dest'] not in onWorklist:
+            onWorklist.add(use['dest'])
+            worklist.append(use)
+    return values
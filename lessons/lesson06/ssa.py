@@ -1,13 +1,18 @@
+import os
 import sys
 import json
 import itertools
-sys.path.append("../library")
-sys.path.append("../lesson05")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'library'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lesson05'))
 import cfg
 # import graph
 import dominators
 import dominators_test
 from stack import Stack
+import instrument
+import stream
+
+ENTRY_LABEL = 'ssa.entry'
 
 def getAllVars(insns):
     vars = set()
@@ -16,10 +21,18 @@ def getAllVars(insns):
             vars.add(insn['dest'])
     return vars
 
+def getVarTypes(insns, args):
+    types = {}  # map from varName to the type it is declared with
+    for arg in args:
+        types[arg['name']] = arg['type']
+    for insn in insns:
+        if 'dest' in insn and insn['dest'] not in types:
+            types[insn['dest']] = insn['type']
+    return types
+
 def getDefBlocks(insns, args):
     defs = {}   # map from varName to set of blocks where var is def'd
-    basicBlocks = cfg.formBasicBlocks(insns)
-    for block in basicBlocks:
+    for block in blocks:
         blockName = block[0]['label']
         for insn in block:
             if 'dest' in insn:
@@ -37,35 +50,94 @@ def getDefBlocks(insns, args):
             defs[argName].add(list(c.keys())[0])
     return defs
 
+'''
+    input: CFG, function args
+
+    output: map: label -> set of vars
+            where the set holds every variable that is
+            def'd along at least one path from the entry
+            to the end of the block
+'''
+def getMaybeDefinedOut(args):
+    defined = {}
+    for label in c:
+        defined[label] = set()
+        for insn in getBlock(label):
+            if 'dest' in insn:
+                defined[label].add(insn['dest'])
+    entry = list(c.keys())[0]
+    for arg in args:
+        defined[entry].add(arg['name'])
+
+    changing = True
+    while changing:
+        changing = False
+        for label in c:
+            for pred in cfg.getPredecessors(label, predecessors):
+                if not defined[pred] <= defined[label]:
+                    defined[label] |= defined[pred]
+                    changing = True
+    return defined
+
+'''
+    input: CFG
+
+    output: map: label -> set of vars
+            where the set holds every variable that is
+            live on entry to the block
+'''
+def getLiveIn():
+    uses = {}
+    kills = {}
+    for label in c:
+        uses[label] = set()
+        kills[label] = set()
+        for insn in getBlock(label):
+            if 'args' in insn:
+                for arg in insn['args']:
+                    if arg not in kills[label]:
+                        uses[label].add(arg)
+            if 'dest' in insn:
+                kills[label].add(insn['dest'])
+
+    live = {}
+    for label in c:
+        live[label] = set(uses[label])
+    changing = True
+    while changing:
+        changing = False
+        for label in reversed(list(c.keys())):
+            for succ in cfg.getSuccessors(label, c):
+                newLive = live[succ] - kills[label]
+                if not newLive <= live[label]:
+                    live[label] |= newLive
+                    changing = True
+    return live
+
 def getBlock(block):
-    for b in blocks:
-         if b[0]['label'] == block:
-             return b
+    return blockMap[block]
 
 def getValidPredecessors(var,block):
-    validPredecessors = predecessors[block]
-    allPaths = []
-    dominators_test.getPaths(c, list(c.keys())[0], block, allPaths)
-    break_flag = False
-    for path in allPaths:
-        break_flag = False
-        for node in path:
-            for insn in getBlock(node):
-                if 'dest' in insn and insn['dest'] == var:
-                    break_flag = True
-                    break
-            if break_flag:
-                break
-        if not break_flag:
-            validPredecessors.remove(path[-2])
-
+    # A phi only needs an argument for the predecessors that var can
+    # actually reach. Along every other edge var is undefined, and the
+    # phi leaves its destination undefined as well.
+    validPredecessors = []
+    for pred in cfg.getPredecessors(block, predecessors):
+        if var in maybeDefined[pred]:
+            validPredecessors.append(pred)
     return validPredecessors
 
 def addPhiNode(var,block):
+    # Only variables that are live into the block need a phi
+    if var not in liveIn[block]:
+        return False
     preds = getValidPredecessors(var,block)
-    phiNode = {'args': [var]*len(preds), 'dest': var, 'labels': preds, 'op': 'phi', 'type': 'int'} # don't hardcode int type
+    if not preds:
+        return False
+    phiNode = {'args': [var]*len(preds), 'dest': var, 'labels': preds, 'op': 'phi', 'type': types[var]}
     b = getBlock(block)
     b.insert(1,phiNode)
+    return True
 
 def usesVar(block,var):
     b = getBlock(block)
@@ -78,18 +150,20 @@ def usesVar(block,var):
 def insertPhiNodes():
     phis = {} # l0: [a,b,c] , l1: [a] , ...
     for v in vars:
-        for d in defs[v]:
-            if d in domFrontier:
-                for block in domFrontier[d]:
-                    if usesVar(block,v):
-                        if block not in phis:
-                            phis[block] = set()
-                            phis[block].add(v)
-                            addPhiNode(v,block)
-                        else:
-                            if v not in phis[block]:
-                                phis[block].add(v)
-                                addPhiNode(v,block)
+        # A phi is itself a def of v, so the blocks that receive one
+        # have to be processed as well (iterated dominance frontier).
+        worklist = list(defs[v])
+        while worklist:
+            d = worklist.pop()
+            if d not in domFrontier:
+                continue
+            for block in domFrontier[d]:
+                if block not in phis:
+                    phis[block] = set()
+                if v not in phis[block]:
+                    phis[block].add(v)
+                    if addPhiNode(v,block) and block not in defs[v]:
+                        worklist.append(block)
 
 def rename(block):
     label = block[0]['label']
@@ -104,15 +178,15 @@ def rename(block):
             insn['args'] = newArgs
 
         if 'dest' in insn:
-            dest = insn['dest']     
+            dest = insn['dest']
             newDestName = dest+'.'+str(newNames[dest])
             insn['dest'] = newDestName
 
             if dest in pops:
                 pops[dest] += 1
             else:
-                pops[dest] = 1 
-            
+                pops[dest] = 1
+
             newNames[dest] = newNames[dest]+1
             stack[dest].push(newDestName)
 
@@ -122,15 +196,10 @@ def rename(block):
         for insn in succBlock:
             if 'op' in insn:
                 if insn['op'] == 'phi':
-                    labelIndex = -1
                     for i, succLabel in enumerate(insn['labels']):
                         if succLabel == label:
-                            labelIndex = i
-                    if 'args' in insn:
-                        for i in range(len(insn['args'])):
-                            if i == labelIndex:
-                                insn['args'][i] = stack[insn['args'][i]].peek()
-    
+                            insn['args'][i] = stack[insn['args'][i]].peek()
+
     if label in domTree:
         immediatelyDominated = domTree[label]
         for b in immediatelyDominated:
@@ -141,10 +210,12 @@ def rename(block):
             stack[dest].pop()
             pops[dest] -= 1
 
+@instrument.stage('from ssa')
 def fromSSA():
     numSSA = 0
     for block in blocks:
         currentLabel = block[0]['label']
+        copies = {}     # map from pred label -> list of (dest, var, type)
         for insn in block:
             if 'op' in insn:
                 if insn['op'] == 'phi':
@@ -156,22 +227,9 @@ def fromSSA():
                     # method #2
                     for i, label in enumerate(insn['labels']):
                         var = insn['args'][i]
-
-                        # Insert a copy in the predecessor block, before the
-                        # terminator.
-                        preds = cfg.getPredecessors(label, predecessors)
-                        preds = [] if preds == [] else preds[0]
-                        pred = getBlock(preds) if preds else getBlock(label)
-                        pred.insert(-1, {
-                            'op': 'id',
-                            'type': type,
-                            'args': [var],
-                            'dest': dest,
-                        })
-
-                        # Remove all phis.
-                        new_block = [i for i in block if i.get('op') != 'phi']
-                        block[:] = new_block
+                        if label not in copies:
+                            copies[label] = []
+                        copies[label].append((dest, var, type))
 
                     # method #1
                     # for i,label in enumerate(labels):
@@ -179,7 +237,28 @@ def fromSSA():
                     #     addPredsToNewBlock(label,numSSA,currentLabel)
                     #     numSSA = numSSA + 1
                     # block.remove(insn)
-                        
+
+        # Insert the copies in each predecessor block, before the
+        # terminator. The phis of a block read their args in parallel, so
+        # an arg that is also the dest of a sibling phi is saved first.
+        for label, moves in copies.items():
+            dests = set(dest for dest, var, type in moves)
+            newInsns = []
+            for dest, var, type in moves:
+                if var in dests:
+                    newInsns.insert(0, {'op': 'id', 'type': type, 'args': [var], 'dest': var+'.copy'})
+                    var = var+'.copy'
+                newInsns.append({'op': 'id', 'type': type, 'args': [var], 'dest': dest})
+            pred = getBlock(label)
+            if 'op' in pred[-1] and pred[-1]['op'] in ('br', 'jmp', 'ret'):
+                pred[-1:-1] = newInsns
+            else:
+                pred.extend(newInsns)
+
+    # Remove all phis.
+    for block in blocks:
+        block[:] = [i for i in block if i.get('op') != 'phi']
+
 
 def addPredsToNewBlock(predLabel, currentNum, oldLabel):
     toLabel = 'ssaLabel_'+str(currentNum)
@@ -207,43 +286,90 @@ def addNewBlock(destVar,idVar,type,labelTo,num):
     blocks.append(newBlock)
 
 
+@instrument.stage('to ssa')
 def toSSA():
     insertPhiNodes()
     rename(blocks[0])
 
-program = json.load(sys.stdin)
-# file = open('C:\\Users\\rubio\\Documents\\personal\\School\\CS6120\\lessons\\CS6120_Lessons\\lesson06\\test3.json')
-# file = open('C:\\Users\\rubio\\Documents\\personal\\School\\CS6120\\lessons\\CS6120_Lessons\\lesson06\\test\\benchmarks\\core\\armstrong.json')
-# program = json.load(file)
-for func in program['functions']:
+@instrument.stage('ssa setup')
+def setup(func):
+    '''
+        Build the CFG, dominance information and renaming stacks
+        for func. Every pass in this file works off of these globals.
+    '''
+    global stack, newNames, vars, types, c, blocks, blockMap, predecessors
+    global doms, defs, maybeDefined, liveIn, domFrontier, domTree
+
+    args = []
+    if 'args' in func:
+        args = func['args']
+
+    # Phis can't live in the entry block since it has no predecessor
+    # to name, so give loops that branch back to the top a fresh entry.
+    c = cfg.createCFG(func['instrs'])
+    predecessors = cfg.buildPredecessorList(c)
+    if cfg.getPredecessors(list(c.keys())[0], predecessors):
+        func['instrs'].insert(0, {'label': ENTRY_LABEL})
+        c = cfg.createCFG(func['instrs'])
+        predecessors = cfg.buildPredecessorList(c)
+
     stack = {}                                                          # stack[v] stack of names for var v
     newNames = {}                                                       # {x:1,y:1,z:2,a:5} means that the next var for x is x1, z is z5, etc.
     vars = getAllVars(func['instrs'])                                   # set of all variables in func
-    funcArgs = set()
-    if 'args' in func:
-        for arg in func['args']:
-            vars.add(arg['name'])
+    for arg in args:
+        vars.add(arg['name'])
     for v in vars:
         stack[v] = Stack()
         stack[v].push(v)
         newNames[v] = 1
+    types = getVarTypes(func['instrs'], args)                           # map from varName -> type
 
-    c = cfg.createCFG(func['instrs'])
-    blocks = cfg.formBasicBlocks(func['instrs'])
-    predecessors = cfg.buildPredecessorList(c)
-    doms = dominators.getDominators(c, predecessors)
+    # Unreachable blocks are never renamed, so drop them up front
+    blocks = [b for b in cfg.formBasicBlocks(func['instrs']) if b[0]['label'] in c]
+    blockMap = {}
+    for block in blocks:
+        blockMap[block[0]['label']] = block
 
-    args = []
-    if 'args' in func:
-        args = func['args']
-    defs = getDefBlocks(func['instrs'],args)                                 # map from varName -> set of blocks where varName is defined
+    doms = dominators.getDominators(c, predecessors)
+    defs = getDefBlocks(func['instrs'],args)                            # map from varName -> set of blocks where varName is defined
+    maybeDefined = getMaybeDefinedOut(args)                             # map from block, b, -> set of vars that may be def'd at the end of b
+    liveIn = getLiveIn()                                                # map from block, b, -> set of vars live on entry to b
     domFrontier = dominators.getDominanceFrontier(doms, predecessors)   # map from block, b, -> set of blocks in b's dominance frontier
     domTree = dominators.getDominatorTree(doms)
+
+def convertToSSA(func):
+    '''
+        Rewrite func into SSA form in place and return
+        its basic blocks (each headed by a label).
+    '''
+    setup(func)
+    toSSA()
+    func['instrs'] = list(itertools.chain(*blocks))
+    return blocks
+
+@instrument.stage('ssa')
+def roundTrip(func):
+    '''
+        Convert func into SSA form and back out again, in place.
+    '''
+    setup(func)
     toSSA()
     fromSSA()
     func['instrs'] = list(itertools.chain(*blocks))
-    c = cfg.createCFG(func['instrs'])                   # UPDATED CFG
-    #graph.createGraph(c,func['name']+"CFG")
-    #graph.createGraph(dominators.getDominatorTree(doms),func['name']+"DomTree")
 
-json.dump(program, sys.stdout, indent=2, sort_keys=True)
\ No newline at end of file
+def main():
+    reader = stream.reader(sys.stdin)
+    writer = stream.writer(sys.stdout)
+    # file = open('C:\\Users\\rubio\\Documents\\personal\\School\\CS6120\\lessons\\CS6120_Lessons\\lesson06\\test3.json')
+    # file = open('C:\\Users\\rubio\\Documents\\personal\\School\\CS6120\\lessons\\CS6120_Lessons\\lesson06\\test\\benchmarks\\core\\armstrong.json')
+    # program = json.load(file)
+    for func in reader:
+        roundTrip(func)
+        writer.write(func)
+        #graph.createGraph(c,func['name']+"CFG")
+        #graph.createGraph(dominators.getDominatorTree(doms),func['name']+"DomTree")
+
+    writer.close(reader.extra)
+
+if __name__ == "__main__":
+    main()
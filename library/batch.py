@@ -0,0 +1,277 @@
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+import binary
+import bril2json
+import cache
+import instrument
+import pipeline
+import stream
+
+'''
+Compiles many programs at once on a pool of worker processes
+
+    python batch.py [--passes tdce,lvn,...] [--rv32 [-x]] [-j N] [-o DIR]
+                    [--binary] [--cache] [-v] PATH...
+
+    Every PATH is a .bril/.json file, a directory (searched recursively
+    for .bril files) or a glob. Each worker imports the passes (and the
+    rv32 backend) once, then takes files off the queue: it parses them,
+    runs the passes in order (see pipeline.PASSES) and, with --rv32,
+    lowers them to RISC-V. The result goes next to the input, or under
+    DIR with the same relative path, as <name>.opt.json (<name>.opt.bin
+    with --binary, <name>.asm with --rv32). -j defaults to the number of
+    cores.
+
+    With --cache (see cache.py) functions compiled before are taken from
+    the cache instead of being run through the passes or the backend.
+
+    An unknown option, or a PATH that matches no file, stops the batch
+    before it starts. A file that fails doesn't stop the batch; it is
+    listed with its error at the end. The summary gives the time spent in every stage summed
+    over all files and the wall time and throughput of the whole batch.
+    -v also prints one line per file.
+
+    Example:
+    python batch.py --passes lvn,tdce -o out ../test/benchmarks
+'''
+
+RV32 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rv32_backend')
+USAGE = 'usage: python batch.py [--passes tdce,lvn,...] [--rv32 [-x]] [-j N] [-o DIR] [--binary] [--cache] [-v] PATH...'
+# Options of batch.py and of the modules it runs (instrument.py, cache.py)
+FLAGS = ('--rv32', '-x', '--binary', '--cache', '--cache-stats', '-v', '--time-passes', '--mem-passes')
+TAKES_VALUE = ('--passes', '-j', '-o', '--cache-dir', '--cache-size', '--pass-report')
+
+passes = []         # (name, module, run) for the worker's pipeline
+backend = None      # rv32 util.util module when lowering
+store = None        # cache.Cache with --cache
+
+def cacheDirectories(names, rv32):
+    directories = {os.path.dirname(os.path.abspath(__file__))}
+    for name in names:
+        directories.add(os.path.dirname(os.path.join(pipeline.LESSONS, pipeline.PASSES[name][0])))
+    if rv32:
+        directories.add(RV32)
+    return directories
+
+def initWorker(names, rv32):
+    '''
+        Runs once in every worker: loads the passes and the backend so
+        the files don't pay for the imports.
+    '''
+    global backend, store
+    for name in names:
+        script, run = pipeline.PASSES[name]
+        passes.append((name, pipeline.loadPass(script), run))
+    if rv32:
+        sys.path.insert(0, RV32)
+        import util.util
+        backend = util.util
+    store = cache.fromArgs(cacheDirectories(names, rv32))
+
+def outputPath(path, root, outdir, rv32, binaryOut):
+    stem = os.path.splitext(path)[0]
+    if outdir is not None:
+        stem = os.path.join(outdir, os.path.relpath(stem, root))
+    if rv32:
+        return stem + '.asm'
+    return stem + ('.opt.bin' if binaryOut else '.opt.json')
+
+def compileFile(path, output, x_regs, binaryOut):
+    '''
+        input: source path, output path
+        output: (path, map from stage -> seconds, instructions before,
+                instructions after, error message or None, cache stats
+                for this file or None)
+    '''
+    times = {}
+    before = after = None
+    counts = store.stats() if store is not None else None
+    try:
+        start = time.perf_counter()
+        with open(path, 'rb') as file:
+            data = file.read()
+        if binary.isBinary(data[:1]):
+            program = binary.loads(data)
+        else:
+            # Some of the checked-in programs were saved as UTF-16
+            text = data.decode('utf-16' if data[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8')
+            if bril2json.isText(text.lstrip().encode('utf-8')[:6]):
+                program = bril2json.parse(text)
+            else:
+                program = json.loads(text)
+        times['parse'] = time.perf_counter() - start
+        before = instrument.countInstructions(program)
+
+        functions = program['functions']
+        todo = functions
+        if store is not None and len(passes) != 0:
+            start = time.perf_counter()
+            keys, missed = store.lookup(functions, ','.join(name for name, _, _ in passes))
+            todo = [functions[i] for i in missed]
+            times['cache'] = time.perf_counter() - start
+
+        for name, module, run in passes:
+            start = time.perf_counter()
+            for func in todo:
+                run(module, func)
+            times[name] = time.perf_counter() - start
+        after = instrument.countInstructions(program)
+
+        if store is not None and len(passes) != 0:
+            start = time.perf_counter()
+            store.save(functions, keys, missed)
+            times['cache'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        if backend is not None:
+            backend.reset_labels()
+            with open(output, 'w') as file:
+                for func in program['functions']:
+                    for insn in backend.lower_cached(func, x_regs, store):
+                        file.write(insn + '\n')
+            times['rv32'] = time.perf_counter() - start
+        elif binaryOut:
+            with open(output, 'wb') as file:
+                file.write(binary.dumps(program))
+            times['write'] = time.perf_counter() - start
+        else:
+            with open(output, 'w') as file:
+                writer = stream.FunctionWriter(file)
+                for func in program['functions']:
+                    writer.write(func)
+                writer.close({key: program[key] for key in program if key != 'functions'})
+            times['write'] = time.perf_counter() - start
+    except Exception as e:
+        return path, times, before, after, type(e).__name__+': '+str(e), delta(counts)
+    return path, times, before, after, None, delta(counts)
+
+def delta(counts):
+    if counts is None:
+        return None
+    return {name: value - counts[name] for name, value in store.stats().items()}
+
+def collect(paths):
+    '''
+        input: files, directories and globs
+        output: sorted list of files, without duplicates
+    '''
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, '**', '*.bril'), recursive=True)
+        elif os.path.isfile(path):
+            found = [path]
+        else:
+            found = glob.glob(path, recursive=True)
+        if len(found) == 0:
+            raise SystemExit(path+': no such file, or no .bril files under it')
+        files.update(found)
+    return sorted(files)
+
+def option(name, default=None):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+def arguments():
+    '''
+        output: the PATH arguments. Anything else that starts with -
+                has to be one of FLAGS or TAKES_VALUE, so a typo isn't
+                taken for a batch with nothing to do.
+    '''
+    paths = []
+    i = 1
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+        if arg in TAKES_VALUE:
+            if i + 1 == len(sys.argv):
+                raise SystemExit(arg+' needs a value\n'+USAGE)
+            i += 2
+            continue
+        if arg.startswith('-'):
+            if arg not in FLAGS:
+                raise SystemExit('unknown option '+arg+'\n'+USAGE)
+        else:
+            paths.append(arg)
+        i += 1
+    return paths
+
+def ms(seconds):
+    return str(round(seconds * 1000, 1))
+
+def summary(results, workers, wall, shared):
+    stages = []         # stage names in the order they first ran
+    totals = {}         # map from stage -> (seconds, files)
+    for _, times, _, _, _, _ in results:
+        for stage, seconds in times.items():
+            if stage not in totals:
+                stages.append(stage)
+                totals[stage] = (0.0, 0)
+            total, count = totals[stage]
+            totals[stage] = (total + seconds, count + 1)
+
+    rows = [('stage', 'files', 'total (ms)', 'mean (ms)')]
+    for stage in stages:
+        total, count = totals[stage]
+        rows.append((stage, str(count), ms(total), ms(total / count)))
+    busy = sum(total for total, _ in totals.values())
+    rows.append(('all', str(len(results)), ms(busy), ms(busy / max(len(results), 1))))
+    widths = [max(len(row[i]) for row in rows) for i in range(4)]
+    for row in rows:
+        print('  '.join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(row)))
+
+    failed = [(path, error) for path, _, _, _, error, _ in results if error is not None]
+    before = sum(r[2] for r in results if r[4] is None and r[2] is not None)
+    after = sum(r[3] for r in results if r[4] is None and r[3] is not None)
+    print()
+    print('files       '+str(len(results))+' ('+str(len(failed))+' failed)')
+    print('workers     '+str(workers))
+    print('wall        '+ms(wall)+' ms')
+    print('throughput  '+str(round(len(results) / wall, 1))+' files/s')
+    print('insns       '+str(before)+' -> '+str(after))
+    if shared is not None:
+        for _, _, _, _, _, counts in results:
+            shared.add(counts)
+        shared.evict()
+        shared.report(sys.stdout)
+    for path, error in failed:
+        print('FAILED '+path+': '+error)
+
+def main():
+    names = option('--passes', '')
+    names = [name for name in names.split(',') if name != '']
+    for name in names:
+        if name not in pipeline.PASSES:
+            raise SystemExit('unknown pass '+name+', expected one of: '+', '.join(pipeline.PASSES))
+    rv32 = '--rv32' in sys.argv
+    workers = int(option('-j', os.cpu_count() or 1))
+    outdir = option('-o')
+    files = collect(arguments())
+    if len(files) == 0:
+        raise SystemExit(USAGE)
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+
+    binaryOut = '--binary' in sys.argv
+    outputs = [outputPath(os.path.abspath(f), root, outdir, rv32, binaryOut) for f in files]
+    # A few chunks per worker: fewer round trips than one file at a time,
+    # small enough that a slow file doesn't leave the other workers idle
+    chunksize = max(1, len(files) // (workers * 4))
+
+    start = time.perf_counter()
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=initWorker, initargs=(names, rv32)) as pool:
+        n = len(files)
+        for result in pool.map(compileFile, files, outputs, ['-x' in sys.argv] * n, [binaryOut] * n, chunksize=chunksize):
+            results.append(result)
+            if '-v' in sys.argv:
+                path, times, before, after, error, _ = result
+                print(path+'  '+('FAILED' if error else ms(sum(times.values()))+' ms  '+str(before)+' -> '+str(after)+' insns'))
+    summary(results, workers, time.perf_counter() - start, cache.fromArgs(()))
+
+if __name__ == "__main__":
+    main()
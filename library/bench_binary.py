@@ -0,0 +1,65 @@
+import glob
+import json
+import os
+import sys
+import time
+import binary
+
+'''
+Compares the binary format from binary.py with pretty-printed JSON
+
+    python bench_binary.py [prog.json ...]
+
+    For every program (by default the .json benchmarks checked in under
+    lessons/) prints its size both ways and how long encoding and
+    decoding take, best of a few runs, as a markdown table.
+'''
+
+RUNS = 5
+
+def best(fn, arg):
+    seconds = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = fn(arg)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return result, seconds
+
+def dumpJson(program):
+    return json.dumps(program, indent=2, sort_keys=True).encode('utf-8')
+
+def loadJson(data):
+    return json.loads(data)
+
+def ms(seconds):
+    return str(round(seconds * 1000, 2))
+
+def main():
+    paths = sys.argv[1:]
+    if len(paths) == 0:
+        root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lessons')
+        paths = sorted(glob.glob(os.path.join(root, 'lesson03', 'test', 'benchmarks', '**', '*.json'), recursive=True))
+
+    print('| program | JSON bytes | binary bytes | JSON dump (ms) | binary dump (ms) | JSON load (ms) | binary load (ms) |')
+    print('|---|---|---|---|---|---|---|')
+    totals = [0, 0, 0.0, 0.0, 0.0, 0.0]
+    for path in paths:
+        with open(path, 'rb') as file:
+            raw = file.read()
+        # Some of the checked-in benchmarks were saved as UTF-16
+        program = json.loads(raw.decode('utf-16' if raw[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8'))
+        text, jsonDump = best(dumpJson, program)
+        data, binaryDump = best(binary.dumps, program)
+        decoded, jsonLoad = best(loadJson, text)
+        decoded, binaryLoad = best(binary.loads, data)
+        if decoded != program:
+            raise SystemExit(path+': binary round trip changed the program')
+        row = [len(text), len(data), jsonDump, binaryDump, jsonLoad, binaryLoad]
+        totals = [a + b for a, b in zip(totals, row)]
+        name = os.path.splitext(os.path.basename(path))[0]
+        print('| '+name+' | '+' | '.join(str(x) for x in row[:2])+' | '+' | '.join(ms(x) for x in row[2:])+' |')
+    print('| total | '+' | '.join(str(x) for x in totals[:2])+' | '+' | '.join(ms(x) for x in totals[2:])+' |')
+
+if __name__ == "__main__":
+    main()
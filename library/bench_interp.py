@@ -0,0 +1,67 @@
+import glob
+import io
+import os
+import re
+import sys
+import time
+import brili
+import bril2json
+import jit
+
+'''
+Compares the two tiers of brili.py
+
+    python bench_interp.py [prog.bril ...]
+
+    Runs every program (by default test/benchmarks/core/*.bril) with
+    the arguments from its "# ARGS:" line through the decoding
+    interpreter (brili.run) and the compiled tier (jit.run), best of a
+    few runs, checks that both print the same and count the same
+    total_dyn_inst, and prints a markdown table. The jit column
+    includes generating and compiling the Python source.
+'''
+
+RUNS = 3
+
+def best(tier, program, args):
+    seconds = None
+    for _ in range(RUNS):
+        out = io.StringIO()
+        start = time.perf_counter()
+        result = tier(program, args, out)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return out.getvalue(), result.count, seconds
+
+def ms(seconds):
+    return str(round(seconds * 1000, 1))
+
+def main():
+    paths = sys.argv[1:]
+    if len(paths) == 0:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(glob.glob(os.path.join(root, 'test', 'benchmarks', 'core', '*.bril')))
+
+    print('| program | total_dyn_inst | interpreter (ms) | jit (ms) | speedup |')
+    print('|---|---|---|---|---|')
+    totals = [0, 0.0, 0.0]
+    for path in paths:
+        try:
+            with open(path) as file:
+                text = file.read()
+        except UnicodeDecodeError:
+            continue
+        program = bril2json.parse(text)
+        match = re.search(r'ARGS:(.*)', text)
+        args = match.group(1).split() if match else []
+        out, count, interpreted = best(brili.run, program, args)
+        jitOut, jitCount, compiled = best(jit.run, program, args)
+        if (out, count) != (jitOut, jitCount):
+            raise SystemExit(path+': the tiers disagree')
+        totals = [totals[0] + count, totals[1] + interpreted, totals[2] + compiled]
+        name = os.path.splitext(os.path.basename(path))[0]
+        print('| '+name+' | '+str(count)+' | '+ms(interpreted)+' | '+ms(compiled)+' | '+str(round(interpreted / compiled, 1))+'x |')
+    print('| total | '+str(totals[0])+' | '+ms(totals[1])+' | '+ms(totals[2])+' | '+str(round(totals[1] / totals[2], 1))+'x |')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import bril2json
+
+'''
+Compares parsing Bril text in-process with running bril2json
+
+    python bench_parse.py [prog.bril ...]
+
+    For every program (by default test/benchmarks/*/*.bril) prints how
+    long bril2json.parse() takes, best of a few runs, against the time
+    to spawn the external bril2json and json.loads its output, which is
+    what every pass pays when a pipeline starts with bril2json. The
+    second column is left out when bril2json isn't on the PATH.
+'''
+
+RUNS = 5
+
+def best(fn, arg):
+    seconds = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = fn(arg)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    return result, seconds
+
+def external(text):
+    output = subprocess.run(['bril2json'], input=text, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def ms(seconds):
+    return str(round(seconds * 1000, 2))
+
+def main():
+    paths = sys.argv[1:]
+    if len(paths) == 0:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        paths = sorted(glob.glob(os.path.join(root, 'test', 'benchmarks', '*', '*.bril')))
+    compare = shutil.which('bril2json') is not None
+
+    print('| program | lines | parse (ms) |'+(' bril2json (ms) |' if compare else ''))
+    print('|---|---|---|'+('---|' if compare else ''))
+    totals = [0, 0.0, 0.0]
+    for path in paths:
+        try:
+            with open(path) as file:
+                text = file.read()
+        except UnicodeDecodeError:
+            continue
+        program, parse = best(bril2json.parse, text)
+        row = [text.count('\n'), parse]
+        if compare:
+            expected, spawn = best(external, text)
+            if expected != program:
+                raise SystemExit(path+': parse() and bril2json disagree')
+            row.append(spawn)
+        totals = [a + b for a, b in zip(totals, row)]
+        name = os.path.splitext(os.path.basename(path))[0]
+        print('| '+name+' | '+str(row[0])+' | '+' | '.join(ms(x) for x in row[1:])+' |')
+    print('| total | '+str(totals[0])+' | '+' | '.join(ms(x) for x in totals[1:len(row)])+' |')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import copy
+import math
+import os
+import sys
+import time
+import tracemalloc
+import cfg
+import pipeline
+import synth
+
+'''
+How the analyses and the rv32 lowering scale with function size
+
+    python bench_scaling.py [--sizes 100,200,...] [--limit SECONDS]
+                            [--plot FILE] [synth.py knobs]
+
+    Generates one function per size with synth.py (--sizes are block
+    counts; --seed, --depth, --branches, --loops and --vars are passed
+    through) and runs every stage in STAGES on a fresh copy of it, once
+    for time and once under tracemalloc for peak memory. It prints both
+    as markdown tables, one column per stage, with a last row giving
+    the slope of log(time or memory) against log(blocks): about 1 for
+    a linear stage, 2 for a quadratic one. A stage that took more than --limit
+    seconds (default 10) is not run at the larger sizes.
+
+    --plot FILE also draws both on log-log axes (needs matplotlib).
+'''
+
+SIZES = [100, 200, 400, 800, 1600]
+RV32 = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rv32_backend')
+
+def runPass(name):
+    def run(func):
+        script, run = pipeline.PASSES[name]
+        run(pipeline.loadPass(script), func)
+    return run
+
+def buildCfg(func):
+    successors = cfg.createCFG(func['instrs'])
+    cfg.buildPredecessorList(successors)
+
+def dominators(func):
+    module = pipeline.loadPass('lesson06/dominators.py')
+    successors = module.cfg.createCFG(func['instrs'])
+    predecessors = module.cfg.buildPredecessorList(successors)
+    dom = module.getDominators(successors, predecessors)
+    module.getDominatorTree(dom)
+    module.getDominanceFrontier(dom, predecessors)
+
+def reachingDefinitions(func):
+    bv = pipeline.loadPass('lesson04/bitvector.py')
+    worklist = bv.BitVectorWorklist(func, 0, lambda b: worklist.defs(b), lambda b: worklist.kills(b), bv.Meet.UNION)
+    worklist.worklist()
+
+def lower(func):
+    if RV32 not in sys.path:
+        sys.path.insert(0, RV32)
+    import util.util
+    util.util.reset_labels()
+    util.util.lower_cached(func, False)
+
+# (name, function run on a copy of the Bril function)
+STAGES = [
+    ('cfg', buildCfg),
+    ('dominators', dominators),
+    ('reaching defs', reachingDefinitions),
+    ('lvn', runPass('lvn')),
+    ('ebb-lvn', runPass('ebb-lvn')),
+    ('tdce', runPass('tdce')),
+    ('gcse', runPass('gcse')),
+    ('adce', runPass('adce')),
+    ('ssa', runPass('ssa')),
+    ('rv32 lower', lower),
+]
+
+def measure(stage, func):
+    '''
+        output: (seconds, peak bytes allocated)
+    '''
+    work = copy.deepcopy(func)
+    start = time.perf_counter()
+    stage(work)
+    seconds = time.perf_counter() - start
+
+    work = copy.deepcopy(func)
+    tracemalloc.start()
+    stage(work)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def slope(points):
+    '''
+        Least squares slope of log(y) over log(x)
+    '''
+    points = [(math.log(x), math.log(y)) for x, y in points if y > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    den = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / den if den != 0 else None
+
+def table(title, sizes, results, scale):
+    names = [name for name, _ in STAGES]
+    print('| '+title+' | '+' | '.join(names)+' |')
+    print('|---'*(len(names) + 1)+'|')
+    for size in sizes:
+        cells = []
+        for name in names:
+            cell = results[name].get(size)
+            cells.append(str(round(cell * scale, 1)) if cell is not None else '-')
+        print('| '+str(size)+' | '+' | '.join(cells)+' |')
+    exponents = []
+    for name in names:
+        s = slope(sorted(results[name].items()))
+        exponents.append(str(round(s, 2)) if s is not None else '-')
+    print('| slope | '+' | '.join(exponents)+' |')
+    print()
+
+def plot(path, times, peaks):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        raise SystemExit('--plot needs matplotlib')
+    figure, (left, right) = plt.subplots(1, 2, figsize=(12, 5))
+    for name, _ in STAGES:
+        for axes, results in ((left, times), (right, peaks)):
+            points = sorted(results[name].items())
+            if len(points) != 0:
+                axes.plot([x for x, _ in points], [y for _, y in points], marker='o', label=name)
+    for axes, label in ((left, 'seconds'), (right, 'peak bytes')):
+        axes.set_xscale('log')
+        axes.set_yscale('log')
+        axes.set_xlabel('blocks')
+        axes.set_ylabel(label)
+    left.legend(fontsize='small')
+    figure.tight_layout()
+    figure.savefig(path)
+
+def main():
+    sizes = [int(n) for n in synth.option('--sizes', ','.join(str(n) for n in SIZES)).split(',')]
+    limit = synth.option('--limit', 10.0)
+    knobs = {'seed': synth.option('--seed', 0), 'depth': synth.option('--depth', 3),
+             'branches': synth.option('--branches', 0.3), 'loops': synth.option('--loops', 0.2),
+             'vars': synth.option('--vars', 16)}
+    times = {name: {} for name, _ in STAGES}
+    peaks = {name: {} for name, _ in STAGES}
+    slow = set()        # stages over the time limit
+    # Imports the passes, so the first size isn't charged for them
+    small = synth.generate(blocks=10, **knobs)['functions'][0]
+    for _, stage in STAGES:
+        stage(copy.deepcopy(small))
+    for size in sizes:
+        func = synth.generate(blocks=size, **knobs)['functions'][0]
+        for name, stage in STAGES:
+            if name in slow:
+                continue
+            seconds, peak = measure(stage, func)
+            times[name][size] = seconds
+            peaks[name][size] = peak
+            if seconds > limit:
+                slow.add(name)
+        print('blocks '+str(size)+': '+str(sum(1 for insn in func['instrs'] if 'op' in insn))+' instructions', file=sys.stderr)
+
+    table('blocks \\ time (ms)', sizes, times, 1000)
+    table('blocks \\ peak (KB)', sizes, peaks, 1 / 1024)
+    path = synth.option('--plot', '')
+    if path != '':
+        plot(path, times, peaks)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import io
+import json
+import struct
+import sys
+
+'''
+Compact binary encoding of Bril programs
+
+    python binary.py < prog.json > prog.bin
+    python binary.py -d < prog.bin > prog.json
+
+    -d decodes, printing JSON the way bril2json does.
+
+    Layout (all integers are unsigned LEB128 varints unless noted):
+
+        magic       b'BRLB' and a version byte
+        strings     count, then each string as byte length + UTF-8
+        extra       string id of the JSON for other top-level keys, or 0
+        index       function count, then for each function its name id
+                    and the offset and length of its body, as 8-byte
+                    little-endian ints relative to the end of the index
+        bodies      the functions, back to back
+
+    Names (vars, labels, functions, ops outside OPS, types) are stored
+    once in the string table and referred to by id; id 0 is reserved for
+    "absent". An instruction is its opcode (index into OPS, see below),
+    a bitmask of the fields it has, then those fields. The index lets a
+    reader decode only the functions it asks for, straight out of an
+    mmap if it wants.
+
+    Decoding gives back exactly the dicts that were encoded: ints, floats
+    and bools stay distinct, and keys outside the Bril spec are kept as
+    JSON strings.
+'''
+
+MAGIC = b'BRLB\x01'
+
+# Opcode 0 is a label, 1 an op spelled out in the string table
+OPS = [None, None, 'const', 'id', 'add', 'sub', 'mul', 'div', 'eq', 'lt', 'gt', 'le', 'ge',
+       'not', 'and', 'or', 'jmp', 'br', 'call', 'ret', 'print', 'nop', 'phi',
+       'fadd', 'fsub', 'fmul', 'fdiv', 'feq', 'flt', 'fgt', 'fle', 'fge',
+       'alloc', 'free', 'store', 'load', 'ptradd',
+       'ceq', 'clt', 'cgt', 'cle', 'cge', 'char2int', 'int2char']
+OPCODES = {op: code for code, op in enumerate(OPS) if op is not None}
+LABEL = 0
+NAMED_OP = 1
+KNOWN = ('label', 'op', 'dest', 'type', 'args', 'funcs', 'labels', 'value')
+
+# Field bits of an instruction
+DEST, TYPE, ARGS, FUNCS, LABELS, VALUE, EXTRA = (1 << i for i in range(7))
+
+# Value tags
+INT, FALSE, TRUE, FLOAT, STRING = range(5)
+
+INDEX_ENTRY = struct.Struct('<QQ')
+
+def isBinary(head):
+    return head[:1] == MAGIC[:1]
+
+class Writer:
+    '''
+        Encodes functions one at a time. Bodies are kept encoded until
+        close(), since the string table has to come first.
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.strings = {}       # map from string -> id
+        self.names = []         # function name ids, in order
+        self.bodies = []        # encoded functions
+
+    def string(self, s):
+        if s not in self.strings:
+            self.strings[s] = len(self.strings) + 1
+        return self.strings[s]
+
+    def type(self, out, type):
+        # Plain types by name, parameterized ones ({'ptr': 'int'}) as JSON
+        if isinstance(type, str):
+            varint(out, self.string(type) << 1)
+        else:
+            varint(out, self.string(json.dumps(type, sort_keys=True)) << 1 | 1)
+
+    def nameList(self, out, names):
+        varint(out, len(names))
+        for name in names:
+            varint(out, self.string(name))
+
+    def instruction(self, out, insn):
+        if 'label' in insn:
+            out.append(LABEL)
+            varint(out, self.string(insn['label']))
+            extra = {key: insn[key] for key in insn if key != 'label'}
+            varint(out, self.string(json.dumps(extra, sort_keys=True)) if extra else 0)
+            return
+        op = insn.get('op')
+        code = OPCODES.get(op, NAMED_OP)
+        varint(out, code)
+        if code == NAMED_OP:
+            varint(out, self.string(op) if op is not None else 0)
+        fields = 0
+        for key, bit in (('dest', DEST), ('type', TYPE), ('args', ARGS), ('funcs', FUNCS), ('labels', LABELS), ('value', VALUE)):
+            if key in insn:
+                fields |= bit
+        extra = {key: insn[key] for key in insn if key not in KNOWN}
+        if extra:
+            fields |= EXTRA
+        varint(out, fields)
+        if fields & DEST:
+            varint(out, self.string(insn['dest']))
+        if fields & TYPE:
+            self.type(out, insn['type'])
+        if fields & ARGS:
+            self.nameList(out, insn['args'])
+        if fields & FUNCS:
+            self.nameList(out, insn['funcs'])
+        if fields & LABELS:
+            self.nameList(out, insn['labels'])
+        if fields & VALUE:
+            self.value(out, insn['value'])
+        if fields & EXTRA:
+            varint(out, self.string(json.dumps(extra, sort_keys=True)))
+
+    def value(self, out, value):
+        if value is True or value is False:
+            out.append(TRUE if value else FALSE)
+        elif isinstance(value, int):
+            out.append(INT)
+            varint(out, value << 1 if value >= 0 else ((-value) << 1) - 1)
+        elif isinstance(value, float):
+            out.append(FLOAT)
+            out += struct.pack('<d', value)
+        else:
+            out.append(STRING)
+            varint(out, self.string(json.dumps(value)))
+
+    def write(self, func):
+        out = bytearray()
+        varint(out, len(func.get('args', [])) + 1 if 'args' in func else 0)
+        for arg in func.get('args', []):
+            varint(out, self.string(arg['name']))
+            self.type(out, arg['type'])
+        if 'type' in func:
+            out.append(1)
+            self.type(out, func['type'])
+        else:
+            out.append(0)
+        extra = {key: func[key] for key in func if key not in ('name', 'args', 'type', 'instrs')}
+        varint(out, self.string(json.dumps(extra, sort_keys=True)) if extra else 0)
+        varint(out, len(func['instrs']))
+        for insn in func['instrs']:
+            self.instruction(out, insn)
+        self.names.append(self.string(func['name']))
+        self.bodies.append(bytes(out))
+
+    def close(self, extra=None):
+        head = bytearray(MAGIC)
+        extraId = self.string(json.dumps(extra, sort_keys=True)) if extra else 0
+        varint(head, len(self.strings))
+        for s in self.strings:
+            data = s.encode('utf-8')
+            varint(head, len(data))
+            head += data
+        varint(head, extraId)
+        varint(head, len(self.bodies))
+        offset = 0
+        for name, body in zip(self.names, self.bodies):
+            varint(head, name)
+            head += INDEX_ENTRY.pack(offset, len(body))
+            offset += len(body)
+        self.file.write(bytes(head))
+        for body in self.bodies:
+            self.file.write(body)
+
+def varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+class Reader:
+    '''
+        Reads a binary program from bytes (or an mmap). Iterating gives
+        every function as a Bril JSON dict; function(i) decodes just one.
+    '''
+    def __init__(self, data):
+        self.data = data
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError('not a binary Bril program')
+        self.pos = len(MAGIC)
+        self.strings = [None]
+        for _ in range(self.varint()):
+            length = self.varint()
+            self.strings.append(bytes(data[self.pos:self.pos + length]).decode('utf-8'))
+            self.pos += length
+        extraId = self.varint()
+        self.extra = json.loads(self.strings[extraId]) if extraId else {}
+        self.names = []         # function names, in order
+        self.spans = []         # (offset, length) of each body
+        for _ in range(self.varint()):
+            self.names.append(self.strings[self.varint()])
+            self.spans.append(INDEX_ENTRY.unpack_from(data, self.pos))
+            self.pos += INDEX_ENTRY.size
+        self.bodies = self.pos
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        byte = data[pos]
+        pos += 1
+        n = byte & 0x7f
+        shift = 7
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def nameList(self):
+        count = self.varint()
+        strings = self.strings
+        return [strings[self.varint()] for _ in range(count)]
+
+    def type(self):
+        n = self.varint()
+        if n & 1:
+            return json.loads(self.strings[n >> 1])
+        return self.strings[n >> 1]
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == INT:
+            n = self.varint()
+            return n >> 1 if n & 1 == 0 else -((n + 1) >> 1)
+        if tag == FALSE or tag == TRUE:
+            return tag == TRUE
+        if tag == FLOAT:
+            self.pos += 8
+            return struct.unpack_from('<d', self.data, self.pos - 8)[0]
+        return json.loads(self.strings[self.varint()])
+
+    def instruction(self):
+        strings = self.strings
+        code = self.varint()
+        if code == LABEL:
+            insn = {'label': strings[self.varint()]}
+            extraId = self.varint()
+            if extraId:
+                insn.update(json.loads(strings[extraId]))
+            return insn
+        insn = {}
+        if code == NAMED_OP:
+            opId = self.varint()
+            if opId:
+                insn['op'] = strings[opId]
+        else:
+            insn['op'] = OPS[code]
+        fields = self.varint()
+        if fields & DEST:
+            insn['dest'] = strings[self.varint()]
+        if fields & TYPE:
+            insn['type'] = self.type()
+        if fields & ARGS:
+            insn['args'] = self.nameList()
+        if fields & FUNCS:
+            insn['funcs'] = self.nameList()
+        if fields & LABELS:
+            insn['labels'] = self.nameList()
+        if fields & VALUE:
+            insn['value'] = self.value()
+        if fields & EXTRA:
+            insn.update(json.loads(strings[self.varint()]))
+        return insn
+
+    def function(self, i):
+        offset, length = self.spans[i]
+        self.pos = self.bodies + offset
+        func = {'name': self.names[i]}
+        nargs = self.varint()
+        if nargs:
+            func['args'] = []
+            for _ in range(nargs - 1):
+                name = self.strings[self.varint()]
+                func['args'].append({'name': name, 'type': self.type()})
+        hasType = self.data[self.pos]
+        self.pos += 1
+        if hasType:
+            func['type'] = self.type()
+        extraId = self.varint()
+        if extraId:
+            func.update(json.loads(self.strings[extraId]))
+        func['instrs'] = [self.instruction() for _ in range(self.varint())]
+        return func
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __iter__(self):
+        for i in range(len(self.spans)):
+            yield self.function(i)
+
+def dumps(program):
+    out = io.BytesIO()
+    writer = Writer(out)
+    for func in program['functions']:
+        writer.write(func)
+    writer.close({key: program[key] for key in program if key != 'functions'})
+    return out.getvalue()
+
+def loads(data):
+    reader = Reader(data)
+    program = dict(reader.extra)
+    program['functions'] = list(reader)
+    return program
+
+def main():
+    data = sys.stdin.buffer.read()
+    if '-d' in sys.argv:
+        json.dump(loads(data), sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        sys.stdout.buffer.write(dumps(json.loads(data)))
+
+if __name__ == "__main__":
+    main()
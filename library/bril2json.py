@@ -0,0 +1,325 @@
+import bisect
+import json
+import re
+import sys
+import stream
+
+'''
+Bril text (.bril) to Bril JSON, without the external bril2json
+
+    python bril2json.py [-p] [--binary] < prog.bril > prog.json
+
+    Produces the same program as bril-txt's bril2json: -p adds "pos"
+    ({row, col}, 1-based) to functions and instructions, --binary writes
+    the format from binary.py instead of JSON. Passes that read through
+    stream.reader() accept Bril text directly, so the conversion can be
+    dropped from a pipeline:
+
+        python tdce.py < prog.bril | brili -p
+
+    parse() returns the whole program, functions() yields one function
+    at a time. Syntax errors raise BrilSyntaxError with the row and
+    column of the offending token.
+'''
+
+# Token kinds, tried in this order at every position
+TOKEN = re.compile(r'''
+    (?P<space>[ \t\r\n]+|\#[^\n]*)
+  | (?P<float>[+-]?(?:\d+\.\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?\d+[eE][+-]?\d+)
+  | (?P<int>[+-]?\d+)
+  | (?P<func>@[A-Za-z_%][\w%.]*)
+  | (?P<label>\.[A-Za-z_%][\w%.]*)
+  | (?P<ident>[A-Za-z_%][\w%.]*|-inf)
+  | (?P<char>'(?:\\[0abtnvfr]|[^'\\])')
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<punct>[(){}:;=,<>])
+''', re.VERBOSE)
+
+ESCAPES = {'0': '\0', 'a': '\a', 'b': '\b', 't': '\t', 'n': '\n', 'v': '\v', 'f': '\f', 'r': '\r'}
+SPECIAL_FLOATS = {'nan': float('nan'), 'inf': float('inf'), '-inf': float('-inf')}
+END = ('end', '', -1)
+
+class BrilSyntaxError(ValueError):
+    pass
+
+def tokenize(text):
+    '''
+        input: Bril text
+        output: list of (kind, text, offset) tuples, punctuation has
+                itself as its kind, comments and whitespace are dropped
+    '''
+    tokens = []
+    pos = 0
+    match = TOKEN.match
+    while pos < len(text):
+        m = match(text, pos)
+        if m is None:
+            raise BrilSyntaxError('unexpected character '+repr(text[pos])+' at '+location(text, pos))
+        kind = m.lastgroup
+        if kind != 'space':
+            value = m.group(kind)
+            tokens.append((value if kind == 'punct' else kind, value, pos))
+        pos = m.end()
+    tokens.append(END)
+    return tokens
+
+def location(text, offset):
+    row = text.count('\n', 0, offset) + 1
+    return 'line '+str(row)+', column '+str(offset - text.rfind('\n', 0, offset))
+
+class Parser:
+    def __init__(self, text, positions=False):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.i = 0
+        self.positions = positions
+        self.imports = []
+        self.lines = [0] + [m.end() for m in re.finditer('\n', text)] if positions else None
+
+    def peek(self, ahead=0):
+        return self.tokens[min(self.i + ahead, len(self.tokens) - 1)][0]
+
+    def next(self):
+        token = self.tokens[self.i]
+        if token is not END:
+            self.i += 1
+        return token
+
+    def expect(self, kind):
+        token = self.next()
+        if token[0] != kind:
+            self.error(token, 'expected '+repr(kind))
+        return token[1]
+
+    def error(self, token, message):
+        found = 'end of input' if token is END else repr(token[1])
+        where = location(self.text, len(self.text) if token is END else token[2])
+        raise BrilSyntaxError(message+', found '+found+' at '+where)
+
+    def pos(self, offset):
+        row = bisect.bisect_right(self.lines, offset)
+        return {'row': row, 'col': offset - self.lines[row - 1] + 1}
+
+    def type(self):
+        '''
+            type: ident | ident '<' type '>'
+        '''
+        name = self.expect('ident')
+        if self.peek() != '<':
+            return name
+        self.next()
+        inner = self.type()
+        self.expect('>')
+        return {name: inner}
+
+    def functions(self):
+        while self.peek() != 'end':
+            if self.peek() == 'ident' and self.tokens[self.i][1] == 'from':
+                self.imports.append(self.importFrom())
+            elif self.peek() == 'ident' and self.tokens[self.i][1] == 'struct':
+                self.error(self.tokens[self.i], 'struct definitions are not supported')
+            else:
+                yield self.function()
+
+    def importFrom(self):
+        '''
+            import: 'from' string 'import' func ['as' func] {',' func ['as' func]} ';'
+        '''
+        self.next()
+        path = json.loads(self.expect('string'))
+        token = self.next()
+        if token[1] != 'import':
+            self.error(token, "expected 'import'")
+        functions = []
+        while True:
+            imported = {'name': self.expect('func')[1:]}
+            if self.peek() == 'ident' and self.tokens[self.i][1] == 'as':
+                self.next()
+                imported['alias'] = self.expect('func')[1:]
+            functions.append(imported)
+            if self.peek() != ',':
+                break
+            self.next()
+        self.expect(';')
+        return {'path': path, 'functions': functions}
+
+    def function(self):
+        '''
+            function: func ['(' [arg {',' arg}] ')'] [':' type] '{' {instr} '}'
+        '''
+        token = self.next()
+        if token[0] != 'func':
+            self.error(token, 'expected a function')
+        func = {'name': token[1][1:]}
+        if self.positions:
+            func['pos'] = self.pos(token[2])
+        if self.peek() == '(':
+            self.next()
+            args = []
+            while self.peek() != ')':
+                if len(args) != 0:
+                    self.expect(',')
+                name = self.expect('ident')
+                self.expect(':')
+                args.append({'name': name, 'type': self.type()})
+            self.next()
+            if len(args) != 0:
+                func['args'] = args
+        if self.peek() == ':':
+            self.next()
+            func['type'] = self.type()
+        self.expect('{')
+        instrs = []
+        while self.peek() != '}':
+            start = self.tokens[self.i]
+            rule = INSTRUCTION.get((self.peek(), self.peek(1)), INSTRUCTION.get(self.peek()))
+            if rule is None:
+                self.error(start, 'expected an instruction or label')
+            insn = rule(self)
+            if self.positions:
+                insn['pos'] = self.pos(start[2])
+            instrs.append(insn)
+        self.next()
+        func['instrs'] = instrs
+        return func
+
+    def label(self):
+        '''
+            label: label ':'
+        '''
+        insn = {'label': self.next()[1][1:]}
+        self.next()
+        return insn
+
+    def typedValue(self):
+        '''
+            instr: ident ':' type '=' (const literal | op {operand}) ';'
+        '''
+        dest = self.next()[1]
+        self.next()
+        type = self.type()
+        self.expect('=')
+        insn = self.operation()
+        insn['dest'] = dest
+        insn['type'] = type
+        return insn
+
+    def untypedValue(self):
+        '''
+            instr: ident '=' op {operand} ';'
+        '''
+        dest = self.next()[1]
+        self.next()
+        insn = self.operation()
+        insn['dest'] = dest
+        return insn
+
+    def effect(self):
+        '''
+            instr: op {operand} ';'
+        '''
+        return self.operation()
+
+    def operation(self):
+        op = self.expect('ident')
+        insn = {'op': op}
+        if op == 'const':
+            insn['value'] = self.literal()
+            self.expect(';')
+            return insn
+        args, funcs, labels = [], [], []
+        while True:
+            token = self.next()
+            kind, text, _ = token
+            if kind == 'ident':
+                args.append(text)
+            elif kind == 'func':
+                funcs.append(text[1:])
+            elif kind == 'label':
+                labels.append(text[1:])
+            elif kind == ';':
+                break
+            else:
+                self.error(token, 'expected an argument or \';\'')
+        if len(args) != 0:
+            insn['args'] = args
+        if len(funcs) != 0:
+            insn['funcs'] = funcs
+        if len(labels) != 0:
+            insn['labels'] = labels
+        return insn
+
+    def literal(self):
+        token = self.next()
+        kind, text, _ = token
+        if kind == 'int':
+            return int(text)
+        if kind == 'float':
+            return float(text)
+        if kind == 'char':
+            return ESCAPES[text[2]] if text[1] == '\\' else text[1]
+        if kind == 'ident':
+            if text == 'true' or text == 'false':
+                return text == 'true'
+            if text in SPECIAL_FLOATS:
+                return SPECIAL_FLOATS[text]
+        self.error(token, 'expected a literal')
+
+# Instruction rules, looked up by the next two tokens, then the next one
+INSTRUCTION = {
+    ('label', ':'): Parser.label,
+    ('ident', ':'): Parser.typedValue,
+    ('ident', '='): Parser.untypedValue,
+    'ident': Parser.effect,
+}
+
+def functions(text, positions=False):
+    '''
+        input: Bril text
+        output: generator of Bril JSON functions
+    '''
+    return Parser(text, positions).functions()
+
+def parse(text, positions=False):
+    '''
+        input: Bril text
+        output: Bril JSON program
+    '''
+    parser = Parser(text, positions)
+    program = {'functions': list(parser.functions())}
+    if len(parser.imports) != 0:
+        program['imports'] = parser.imports
+    return program
+
+class Reader:
+    '''
+        Same interface as stream.FunctionReader, for Bril text.
+    '''
+    def __init__(self, text):
+        self.text = text
+        self.extra = {}
+
+    def __iter__(self):
+        parser = Parser(self.text)
+        yield from parser.functions()
+        if len(parser.imports) != 0:
+            self.extra['imports'] = parser.imports
+
+def isText(head):
+    '''
+        True if a program whose first bytes, after any whitespace, are
+        head is Bril text rather than JSON or binary.
+    '''
+    return head[:1] in (b'@', b'#') or head[:6] == b'struct'
+
+def main():
+    parser = Parser(sys.stdin.read(), '-p' in sys.argv)
+    writer = stream.writer(sys.stdout)
+    for func in parser.functions():
+        writer.write(func)
+    writer.close({'imports': parser.imports} if len(parser.imports) != 0 else None)
+    if '--binary' not in sys.argv:
+        sys.stdout.write('\n')     # like bril-txt's bril2json
+
+if __name__ == "__main__":
+    main()
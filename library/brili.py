@@ -0,0 +1,412 @@
+import sys
+import stream
+from runtime import MAX_INT, MIN_INT, BrilError, Pointer, Result, constant, divide, fdivide, format, parseArgument, wrap
+
+'''
+Bril interpreter
+
+    python brili.py [-p] [--jit] [--profile FILE] [ARG...] < prog.bril
+
+    Runs @main with the given arguments, like the reference brili. -p
+    prints "total_dyn_inst: N" to stderr, counting the same instructions
+    brili -p does (every executed instruction, not labels), so it can
+    stand in for brili -p in brench configs. Covers core, mem, float and
+    char Bril, and SSA phis.
+
+    Before running, every function is decoded once: each instruction
+    becomes a tuple starting with an opcode number, variables are
+    replaced by slots in a per-call frame list and labels by the index
+    of the instruction they point to. The interpreter loop then never
+    looks at strings or dicts. Calls push the caller on an explicit
+    stack, so deep recursion doesn't hit Python's recursion limit.
+    --jit runs the program through the compiling tier in jit.py instead.
+    --profile FILE runs it there too, counting blocks and edges into
+    FILE (see profiles.py).
+
+    Example:
+        result = brili.run(program, ['10'], sys.stdout)
+        print(result.count)
+'''
+
+# Opcodes, most frequent first since the dispatch tests them in order
+(CONST, ADD, BR, JMP, LT, ID, EQ, SUB, MUL, LOAD, PTRADD, STORE, GT, LE, GE, DIV, CALL, RET, PRINT,
+ NOT, AND, OR, FADD, FSUB, FMUL, FDIV, FEQ, FLT, FGT, FLE, FGE, ALLOC, FREE, NOP, PHI, LABEL, END,
+ CEQ, CLT, CGT, CLE, CGE, CHAR2INT, INT2CHAR) = range(44)
+
+OPCODES = {
+    'const': CONST, 'id': ID, 'add': ADD, 'sub': SUB, 'mul': MUL, 'div': DIV,
+    'eq': EQ, 'lt': LT, 'gt': GT, 'le': LE, 'ge': GE, 'not': NOT, 'and': AND, 'or': OR,
+    'jmp': JMP, 'br': BR, 'call': CALL, 'ret': RET, 'print': PRINT, 'nop': NOP, 'phi': PHI,
+    'fadd': FADD, 'fsub': FSUB, 'fmul': FMUL, 'fdiv': FDIV,
+    'feq': FEQ, 'flt': FLT, 'fgt': FGT, 'fle': FLE, 'fge': FGE,
+    'alloc': ALLOC, 'free': FREE, 'store': STORE, 'load': LOAD, 'ptradd': PTRADD,
+    'ceq': CEQ, 'clt': CLT, 'cgt': CGT, 'cle': CLE, 'cge': CGE, 'char2int': CHAR2INT, 'int2char': INT2CHAR,
+}
+BINARY = {ADD, SUB, MUL, DIV, EQ, LT, GT, LE, GE, AND, OR, FADD, FSUB, FMUL, FDIV, FEQ, FLT, FGT, FLE, FGE,
+          PTRADD, CEQ, CLT, CGT, CLE, CGE}
+UNARY = {ID, NOT, LOAD, ALLOC, CHAR2INT, INT2CHAR}
+
+class Function:
+    '''
+        A decoded function.
+
+        code        list of instruction tuples, (opcode, operands...)
+        slots       map from variable name -> frame index
+        params      frame indices of the arguments, in order
+        returns     True if the function has a return type
+    '''
+    def __init__(self, func):
+        self.name = func['name']
+        self.slots = {}
+        self.params = [self.slot(arg['name']) for arg in func.get('args', [])]
+        self.returns = 'type' in func
+        self.func = func
+
+    def slot(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.slots)
+        return self.slots[name]
+
+    def decode(self, functions):
+        '''
+            functions: map from name -> Function, for call targets
+        '''
+        instrs = self.func['instrs']
+        # Labels are only needed at run time for phis, otherwise they
+        # are dropped and branches go straight to the next instruction
+        keepLabels = any(insn.get('op') == 'phi' for insn in instrs)
+        targets = {}
+        index = 0
+        for insn in instrs:
+            if 'label' in insn:
+                targets[insn['label']] = index
+                if keepLabels:
+                    index += 1
+            else:
+                index += 1
+
+        def target(label):
+            if label not in targets:
+                raise BrilError('label '+label+' not found in @'+self.name)
+            return targets[label]
+
+        code = []
+        for insn in instrs:
+            if 'label' in insn:
+                if keepLabels:
+                    code.append((LABEL, insn['label']))
+                continue
+            op = insn['op']
+            if op not in OPCODES:
+                raise BrilError('unknown instruction '+op+' in @'+self.name)
+            opcode = OPCODES[op]
+            args = [self.slot(arg) for arg in insn.get('args', [])]
+            dest = self.slot(insn['dest']) if 'dest' in insn else -1
+            if opcode == CONST:
+                code.append((CONST, dest, constant(insn['value'], insn.get('type'))))
+            elif opcode in BINARY:
+                code.append((opcode, dest, args[0], args[1]))
+            elif opcode in UNARY:
+                code.append((opcode, dest, args[0]))
+            elif opcode == BR:
+                code.append((BR, args[0], target(insn['labels'][0]), target(insn['labels'][1])))
+            elif opcode == JMP:
+                code.append((JMP, target(insn['labels'][0])))
+            elif opcode == CALL:
+                name = insn['funcs'][0]
+                if name not in functions:
+                    raise BrilError('function @'+name+' not found')
+                code.append((CALL, dest, functions[name], tuple(args)))
+            elif opcode == RET:
+                code.append((RET, args[0] if len(args) != 0 else -1))
+            elif opcode == PRINT:
+                code.append((PRINT, tuple(args)))
+            elif opcode == STORE:
+                code.append((STORE, args[0], args[1]))
+            elif opcode == FREE:
+                code.append((FREE, args[0]))
+            elif opcode == PHI:
+                code.append((PHI, dest, tuple(insn.get('labels', [])), tuple(args)))
+            else:
+                code.append((NOP,))
+        # Falling off the end returns; it isn't an instruction brili counts
+        code.append((END,))
+        self.code = code
+
+def decode(program):
+    '''
+        output: map from function name -> decoded Function
+    '''
+    functions = {func['name']: Function(func) for func in program['functions']}
+    for function in functions.values():
+        function.decode(functions)
+    return functions
+
+def run(program, args, out):
+    '''
+        input: Bril JSON program, @main's arguments as strings, file to
+               print to
+        output: Result
+    '''
+    functions = decode(program)
+    if 'main' not in functions:
+        raise BrilError('no main function')
+    main = functions['main']
+    mainArgs = main.func.get('args', [])
+    if len(args) != len(mainArgs):
+        raise BrilError('@main expects '+str(len(mainArgs))+' arguments, got '+str(len(args)))
+    frame = [None] * len(main.slots)
+    for arg, text, slot in zip(mainArgs, args, main.params):
+        frame[slot] = parseArgument(text, arg['type'])
+    return execute(main, frame, out)
+
+def execute(function, frame, out):
+    write = out.write
+    code = function.code
+    pc = 0
+    count = 0
+    stack = []              # (function, code, frame, pc, dest, last, cur) of the callers
+    last = cur = None       # labels for phi, like brili's lastlabel/curlabel
+    heap = set()            # live allocations, by id
+
+    try:
+        while True:
+            insn = code[pc]
+            pc += 1
+            count += 1
+            op = insn[0]
+            if op == CONST:
+                frame[insn[1]] = insn[2]
+            elif op == ADD:
+                n = frame[insn[2]] + frame[insn[3]]
+                frame[insn[1]] = n if MIN_INT <= n <= MAX_INT else wrap(n)
+            elif op == BR:
+                cond = frame[insn[1]]
+                if cond is None:
+                    raise undefined(function, frame, insn)
+                pc = insn[2] if cond else insn[3]
+            elif op == JMP:
+                pc = insn[1]
+            elif op == LT:
+                frame[insn[1]] = frame[insn[2]] < frame[insn[3]]
+            elif op == ID:
+                value = frame[insn[2]]
+                if value is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = value
+            elif op == EQ:
+                a = frame[insn[2]]
+                b = frame[insn[3]]
+                if a is None or b is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = a == b
+            elif op == SUB:
+                n = frame[insn[2]] - frame[insn[3]]
+                frame[insn[1]] = n if MIN_INT <= n <= MAX_INT else wrap(n)
+            elif op == MUL:
+                n = frame[insn[2]] * frame[insn[3]]
+                frame[insn[1]] = n if MIN_INT <= n <= MAX_INT else wrap(n)
+            elif op == LOAD:
+                pointer = frame[insn[2]]
+                if id(pointer.cells) not in heap or not 0 <= pointer.offset < len(pointer.cells):
+                    raise BrilError('load from an invalid pointer')
+                value = pointer.cells[pointer.offset]
+                if value is None:
+                    raise BrilError('load from uninitialized memory')
+                frame[insn[1]] = value
+            elif op == PTRADD:
+                pointer = frame[insn[2]]
+                frame[insn[1]] = Pointer(pointer.cells, pointer.offset + frame[insn[3]])
+            elif op == STORE:
+                pointer = frame[insn[1]]
+                if id(pointer.cells) not in heap or not 0 <= pointer.offset < len(pointer.cells):
+                    raise BrilError('store to an invalid pointer')
+                value = frame[insn[2]]
+                if value is None:
+                    raise undefined(function, frame, insn)
+                pointer.cells[pointer.offset] = value
+            elif op == GT:
+                frame[insn[1]] = frame[insn[2]] > frame[insn[3]]
+            elif op == LE:
+                frame[insn[1]] = frame[insn[2]] <= frame[insn[3]]
+            elif op == GE:
+                frame[insn[1]] = frame[insn[2]] >= frame[insn[3]]
+            elif op == DIV:
+                frame[insn[1]] = divide(frame[insn[2]], frame[insn[3]])
+            elif op == CALL:
+                callee = insn[2]
+                calleeFrame = [None] * len(callee.slots)
+                for slot, arg in zip(callee.params, insn[3]):
+                    value = frame[arg]
+                    if value is None:
+                        raise undefined(function, frame, insn)
+                    calleeFrame[slot] = value
+                stack.append((function, code, frame, pc, insn[1], last, cur))
+                function = callee
+                code = callee.code
+                frame = calleeFrame
+                pc = 0
+                last = cur = None
+            elif op == RET or op == END:
+                if op == END:
+                    count -= 1
+                    value = None
+                elif insn[1] >= 0:
+                    value = frame[insn[1]]
+                    if value is None:
+                        raise undefined(function, frame, insn)
+                else:
+                    value = None
+                if len(stack) == 0:
+                    if len(heap) != 0:
+                        raise BrilError('some memory locations have not been freed by end of execution')
+                    return Result(value, count)
+                function, code, frame, pc, dest, last, cur = stack.pop()
+                if dest >= 0:
+                    frame[dest] = value
+            elif op == PRINT:
+                values = [frame[arg] for arg in insn[1]]
+                if None in values:
+                    raise undefined(function, frame, insn)
+                write(' '.join([format(value) for value in values]) + '\n')
+            elif op == NOT:
+                a = frame[insn[2]]
+                if a is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = not a
+            elif op == AND:
+                a = frame[insn[2]]
+                b = frame[insn[3]]
+                if a is None or b is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = a and b
+            elif op == OR:
+                a = frame[insn[2]]
+                b = frame[insn[3]]
+                if a is None or b is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = a or b
+            elif op == FADD:
+                frame[insn[1]] = frame[insn[2]] + frame[insn[3]]
+            elif op == FSUB:
+                frame[insn[1]] = frame[insn[2]] - frame[insn[3]]
+            elif op == FMUL:
+                frame[insn[1]] = frame[insn[2]] * frame[insn[3]]
+            elif op == FDIV:
+                frame[insn[1]] = fdivide(frame[insn[2]], frame[insn[3]])
+            elif op == FEQ or op == CEQ:
+                a = frame[insn[2]]
+                b = frame[insn[3]]
+                if a is None or b is None:
+                    raise undefined(function, frame, insn)
+                frame[insn[1]] = a == b
+            elif op == FLT or op == CLT:
+                frame[insn[1]] = frame[insn[2]] < frame[insn[3]]
+            elif op == FGT or op == CGT:
+                frame[insn[1]] = frame[insn[2]] > frame[insn[3]]
+            elif op == FLE or op == CLE:
+                frame[insn[1]] = frame[insn[2]] <= frame[insn[3]]
+            elif op == FGE or op == CGE:
+                frame[insn[1]] = frame[insn[2]] >= frame[insn[3]]
+            elif op == ALLOC:
+                size = frame[insn[2]]
+                if size <= 0:
+                    raise BrilError('cannot allocate '+str(size)+' cells')
+                cells = [None] * size
+                heap.add(id(cells))
+                frame[insn[1]] = Pointer(cells, 0)
+            elif op == FREE:
+                pointer = frame[insn[1]]
+                if pointer.offset != 0 or id(pointer.cells) not in heap:
+                    raise BrilError('freeing a pointer that is not the start of a live allocation')
+                heap.remove(id(pointer.cells))
+            elif op == CHAR2INT:
+                frame[insn[1]] = ord(frame[insn[2]])
+            elif op == INT2CHAR:
+                frame[insn[1]] = chr(frame[insn[2]])
+            elif op == LABEL:
+                count -= 1
+                last, cur = cur, insn[1]
+            elif op == PHI:
+                labels = insn[2]
+                if last in labels:
+                    frame[insn[1]] = frame[insn[3][labels.index(last)]]
+                else:
+                    frame[insn[1]] = None
+            elif op == NOP:
+                pass
+    except (TypeError, AttributeError):
+        # Arithmetic, comparisons, chars and memory on None fail in Python;
+        # the checks in the loop are for the ops where None would go through
+        error = undefined(function, frame, insn)
+        if error is None:
+            raise
+        raise error from None
+
+def undefined(function, frame, insn):
+    '''
+        output: the BrilError for insn reading a variable that has no
+                value, or None if all of its operands have one
+    '''
+    op = insn[0]
+    if op in BINARY:
+        slots = insn[2:4]
+    elif op in UNARY:
+        slots = insn[2:3]
+    elif op == CALL:
+        slots = insn[3]
+    elif op == PRINT:
+        slots = insn[1]
+    elif op == STORE:
+        slots = insn[1:3]
+    elif op in (BR, FREE, RET):
+        slots = [slot for slot in insn[1:2] if slot >= 0]
+    else:
+        slots = []
+    for slot in slots:
+        if frame[slot] is None:
+            return BrilError('undefined variable '+name(function, slot))
+    return None
+
+def name(function, slot):
+    for var, index in function.slots.items():
+        if index == slot:
+            return var
+    return '?'
+
+def main():
+    program = stream.load(sys.stdin)
+    args = []
+    flags = sys.argv[1:]
+    while len(flags) != 0:
+        arg = flags.pop(0)
+        if arg == '--profile':
+            flags = flags[1:]
+        elif arg not in ('-p', '--jit'):
+            args.append(arg)
+    try:
+        if '--profile' in sys.argv:
+            import jit
+            import os
+            import profiles
+            path = profiles.option('--profile')
+            if path is None:
+                raise SystemExit('--profile needs a file name')
+            profile = profiles.load(path) if os.path.exists(path) else profiles.Profile()
+            result = jit.run(program, args, sys.stdout, profile)
+            profiles.save(profile, path)
+        elif '--jit' in sys.argv:
+            import jit
+            result = jit.run(program, args, sys.stdout)
+        else:
+            result = run(program, args, sys.stdout)
+    except BrilError as e:
+        sys.stdout.flush()
+        print('error: '+str(e), file=sys.stderr)
+        sys.exit(2)
+    if '-p' in sys.argv:
+        sys.stdout.flush()
+        print('total_dyn_inst: '+str(result.count), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import glob
+import hashlib
+import json
+import os
+import sys
+
+'''
+Content-addressed on-disk cache of compiled functions
+
+    A function's entry is found by a SHA-256 of its canonical JSON (keys
+    sorted, no whitespace), the stage that produced the entry (the pass
+    list, or "rv32" and its options) and the tool version, which is a hash
+    of the source of every module the stage runs. Editing a pass, or the
+    function, gives a different key; nothing has to be invalidated by
+    hand. Entries are JSON files under the cache directory, two levels
+    deep by key prefix, and are written atomically so several processes
+    can share a directory.
+
+    Scripts that support it take
+
+        --cache                 cache in $BRIL_CACHE, else ~/.cache/bril
+        --cache-dir DIR         cache in DIR (implies --cache)
+        --cache-size MB         keep at most MB megabytes (default 256)
+        --cache-stats           print hits, misses and evictions to stderr
+
+    Reading an entry refreshes its mtime, and close() deletes the least
+    recently used entries until the directory fits in the size limit.
+
+    Example:
+        store = cache.fromArgs([LESSONS])
+        keys, missed = store.lookup(program['functions'], 'lvn,tdce')
+        for i in missed:
+            optimize(program['functions'][i])
+        store.save(program['functions'], keys, missed)
+        store.close()
+'''
+
+DEFAULT_SIZE = 256          # MB
+
+def canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+def toJson(func):
+    # ir.Function and friends convert themselves
+    return func.toJson() if hasattr(func, 'toJson') else func
+
+def sourceVersion(directories):
+    '''
+        input: list of directories
+        output: hash of every .py file under them, names and contents
+    '''
+    digest = hashlib.sha256()
+    for directory in sorted(directories):
+        for path in sorted(glob.glob(os.path.join(directory, '**', '*.py'), recursive=True)):
+            digest.update(os.path.relpath(path, directory).encode('utf-8') + b'\0')
+            with open(path, 'rb') as file:
+                digest.update(file.read())
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+class Cache:
+    def __init__(self, directory=None, version='', limit=DEFAULT_SIZE << 20):
+        if directory is None:
+            directory = os.environ.get('BRIL_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'bril')
+        self.directory = directory
+        self.version = version
+        self.limit = limit          # bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def key(self, func, stage):
+        '''
+            input: Bril JSON function as it goes into the stage, name of
+                   the stage (pass list and options)
+            output: hex key
+        '''
+        digest = hashlib.sha256()
+        for part in (self.version, stage, canonical(func)):
+            digest.update(part.encode('utf-8') + b'\0')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        '''
+            Returns the value stored under key, or None.
+        '''
+        path = self.path(key)
+        try:
+            with open(path) as file:
+                value = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = path+'.'+str(os.getpid())+'.tmp'
+        with open(temp, 'w') as file:
+            file.write(canonical(value))
+        os.replace(temp, path)
+        self.stores += 1
+
+    def lookup(self, functions, stage, load=None):
+        '''
+            Replaces every function of the list that is in the cache by
+            its cached result (passed through load, if given).
+
+            output: key of every function, indices of the ones that
+                    weren't found
+        '''
+        keys = [self.key(toJson(func), stage) for func in functions]
+        missed = []
+        for i, key in enumerate(keys):
+            cached = self.get(key)
+            if cached is None:
+                missed.append(i)
+            else:
+                functions[i] = load(cached) if load is not None else cached
+        return keys, missed
+
+    def save(self, functions, keys, missed):
+        '''
+            Stores the functions lookup() didn't find, once compiled.
+        '''
+        for i in missed:
+            self.put(keys[i], toJson(functions[i]))
+
+    def evict(self):
+        '''
+            Deletes the least recently used entries until the cache is no
+            bigger than its limit.
+        '''
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(self.directory, '*', '*')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        return total
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+
+    def add(self, stats):
+        '''
+            Adds counts from another process's stats() to this one's.
+        '''
+        self.hits += stats['hits']
+        self.misses += stats['misses']
+        self.stores += stats['stores']
+        self.evictions += stats['evictions']
+
+    def report(self, file=sys.stderr):
+        lookups = self.hits + self.misses
+        rate = str(round(100 * self.hits / lookups, 1)) if lookups != 0 else '-'
+        print('cache '+self.directory+': '+str(self.hits)+' hits, '+str(self.misses)+' misses ('+rate+'% hit rate), '
+              +str(self.stores)+' stored, '+str(self.evictions)+' evicted', file=file)
+
+    def close(self):
+        self.evict()
+        if '--cache-stats' in sys.argv:
+            self.report()
+
+def option(name):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+def fromArgs(directories):
+    '''
+        Cache configured by the command line flags above, versioned by
+        the source under directories, or None when caching isn't turned
+        on.
+    '''
+    directory = option('--cache-dir')
+    if '--cache' not in sys.argv and directory is None:
+        return None
+    size = option('--cache-size')
+    return Cache(directory, sourceVersion(directories), int(float(size) * (1 << 20)) if size is not None else DEFAULT_SIZE << 20)
@@ -32,12 +32,15 @@ def removeEmptyBasicBlocks(basicBlocks):
     return newBasicBlocks
 
 def dfs(visited, graph, node, nodes):
-    if node not in visited:
-        nodes.add(node)
-        visited.add(node)
-        if node in graph:
-            for child in graph[node]:
-                dfs(visited,graph,child,nodes)
+    # Explicit stack, machine-generated CFGs can be deeper than the recursion limit
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node not in visited:
+            nodes.add(node)
+            visited.add(node)
+            if node in graph:
+                stack.extend(reversed(graph[node]))
     return nodes
 
 def getNumNodes(graph):
@@ -0,0 +1,171 @@
+import atexit
+import functools
+import json
+import sys
+import time
+import tracemalloc
+
+'''
+Per-pass timing and memory instrumentation
+
+    Passes mark their stages with a decorator:
+
+        @instrument.stage('lvn')
+        def optimize(func, ...):
+
+    and any script importing them then accepts
+
+        --time-passes           wall and CPU time per stage and function
+        --mem-passes            tracemalloc peak per stage and function
+        --pass-report out.json  write the report as JSON instead of a table
+
+    The report goes to stderr when the program exits, with instruction
+    counts before and after every stage. A stage takes its function name
+    from its first argument if that is a Bril function, otherwise from the
+    stage it runs in. When neither flag is given stage() hands back the
+    undecorated function, so instrumentation costs nothing; the flags have
+    to be set (or enable() called) before the passes are imported.
+
+    Example:
+    python lvn.py --time-passes < prog.json > /dev/null
+    function  stage   calls  wall (ms)  cpu (ms)  insns before  insns after
+    main      lvn         1       0.41      0.41            35           35
+    main      tdce        1       0.12      0.12            35           21
+'''
+
+timing = '--time-passes' in sys.argv
+memory = '--mem-passes' in sys.argv
+records = {}        # map from (function, stage) -> Record
+order = []          # (function, stage) in the order they first ran
+frames = []         # stages currently running, innermost last
+
+class Record:
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.before = None      # instruction count going into the first call
+        self.after = None       # instruction count coming out of the last call
+
+class Frame:
+    def __init__(self, function):
+        self.function = function
+        self.peak = 0           # highest traced memory seen while running
+        self.base = 0           # traced memory when the stage started
+
+def enabled():
+    return timing or memory
+
+def enable(times=True, mem=False):
+    global timing, memory
+    timing = timing or times
+    memory = memory or mem
+
+def countInstructions(ir):
+    '''
+        input: program, function, list of blocks or list of instructions
+        output: number of instructions, not counting labels (None if ir
+                isn't one of those)
+    '''
+    if isinstance(ir, dict):
+        if 'functions' in ir:
+            return sum(countInstructions(func) for func in ir['functions'])
+        if 'instrs' in ir:
+            return countInstructions(ir['instrs'])
+        return None
+    if not isinstance(ir, list):
+        return None
+    count = 0
+    for item in ir:
+        if isinstance(item, list):
+            count += countInstructions(item)
+        elif not (isinstance(item, dict) and 'label' in item):
+            count += 1
+    return count
+
+def functionName(args):
+    if len(args) != 0 and isinstance(args[0], dict) and 'instrs' in args[0]:
+        return args[0].get('name', '-')
+    if len(frames) != 0:
+        return frames[-1].function
+    return '-'
+
+def stage(name):
+    def decorate(fn):
+        if not enabled():
+            return fn
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        @functools.wraps(fn)
+        def measured(*args, **kwargs):
+            frame = Frame(functionName(args))
+            key = (frame.function, name)
+            if key not in records:
+                records[key] = Record()
+                order.append(key)
+            before = countInstructions(args[0]) if len(args) != 0 else None
+            if memory:
+                current, peak = tracemalloc.get_traced_memory()
+                if len(frames) != 0:
+                    frames[-1].peak = max(frames[-1].peak, peak)
+                frame.base = current
+                tracemalloc.reset_peak()
+            frames.append(frame)
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                cpu = time.process_time() - cpu
+                wall = time.perf_counter() - wall
+                frames.pop()
+                if memory:
+                    frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+                    if len(frames) != 0:
+                        frames[-1].peak = max(frames[-1].peak, frame.peak)
+            after = countInstructions(result)
+            if after is None and len(args) != 0:
+                after = countInstructions(args[0])
+
+            record = records[key]
+            record.calls += 1
+            record.wall += wall
+            record.cpu += cpu
+            record.peak = max(record.peak, frame.peak - frame.base)
+            if record.before is None:
+                record.before = before
+            record.after = after
+            return result
+        return measured
+    return decorate
+
+def report():
+    if len(records) == 0:
+        return
+    rows = []
+    for function, name in order:
+        record = records[(function, name)]
+        row = {'function': function, 'stage': name, 'calls': record.calls}
+        if timing:
+            row['wall (ms)'] = round(record.wall * 1000, 3)
+            row['cpu (ms)'] = round(record.cpu * 1000, 3)
+        if memory:
+            row['peak (KiB)'] = round(record.peak / 1024, 1)
+        row['insns before'] = record.before
+        row['insns after'] = record.after
+        rows.append(row)
+
+    if '--pass-report' in sys.argv and sys.argv.index('--pass-report') + 1 < len(sys.argv):
+        with open(sys.argv[sys.argv.index('--pass-report') + 1], 'w') as file:
+            json.dump(rows, file, indent=2)
+        return
+    columns = list(rows[0].keys())
+    cells = [[str('' if row[c] is None else row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(line[i]) for line in cells)) for i, c in enumerate(columns)]
+    print('  '.join(c.ljust(widths[i]) if i < 2 else c.rjust(widths[i]) for i, c in enumerate(columns)), file=sys.stderr)
+    for line in cells:
+        print('  '.join(x.ljust(widths[i]) if i < 2 else x.rjust(widths[i]) for i, x in enumerate(line)), file=sys.stderr)
+
+atexit.register(report)
@@ -0,0 +1,206 @@
+import json
+import sys
+
+'''
+Slot-based Bril IR
+
+    Every instruction is an Instruction with one slot per Bril field
+    instead of a dict, and var, label, function and op names are interned
+    so equal names share one string object. A field Bril leaves out of an
+    instruction holds None. Fields this module doesn't know about (source
+    positions, extensions) are kept in `extra`, so JSON -> IR -> JSON gives
+    back the same program.
+
+    Instructions still behave like the dicts the passes were written
+    against: 'dest' in insn, insn['args'], insn.get('value'),
+    insn['args'] = [...], del insn['args'] and insn.pop('value', None)
+    all work, so a pass can take IR without changes and move over to the
+    attributes (insn.dest, insn.args) one function at a time. toJson()
+    accepts plain dicts mixed into the instruction lists, for passes that
+    still build new instructions as dicts.
+
+    Unlike dicts, two instructions are only equal if they are the same
+    object, so `x not in remove` style filtering checks identity.
+
+    Example:
+        program = ir.load(sys.stdin)
+        for func in program.functions:
+            for insn in func.instrs:
+                if insn.op == 'const':
+                    ...
+        ir.dump(program, sys.stdout)
+'''
+
+FIELDS = ('label', 'op', 'dest', 'type', 'args', 'funcs', 'labels', 'value')
+
+def intern(name):
+    return sys.intern(name) if isinstance(name, str) else name
+
+def internAll(names):
+    return None if names is None else [sys.intern(name) for name in names]
+
+class Node:
+    '''
+        Dict adapter shared by Instruction, Function and Program: the
+        names in FIELDS map to slots (None when absent), any other key
+        lives in `extra`.
+    '''
+    __slots__ = ()
+    FIELDS = ()
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key) is not None
+        return self.extra is not None and key in self.extra
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self.FIELDS:
+            setattr(self, key, None)
+        else:
+            del self.extra[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def keys(self):
+        return [key for key in self.FIELDS if getattr(self, key) is not None] + list(self.extra or ())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return type(self).__name__+'('+repr(self.toJson())+')'
+
+class Instruction(Node):
+    __slots__ = FIELDS + ('extra',)
+    FIELDS = FIELDS
+
+    def __init__(self, op=None, dest=None, type=None, args=None, funcs=None, labels=None, value=None, label=None, extra=None):
+        self.label = intern(label)
+        self.op = intern(op)
+        self.dest = intern(dest)
+        self.type = intern(type)
+        self.args = internAll(args)
+        self.funcs = internAll(funcs)
+        self.labels = internAll(labels)
+        self.value = value
+        self.extra = extra          # map from key -> value for any other field
+
+    @classmethod
+    def fromJson(cls, insn):
+        extra = None
+        for key in insn:
+            if key not in FIELDS:
+                if extra is None:
+                    extra = {}
+                extra[key] = insn[key]
+        return cls(insn.get('op'), insn.get('dest'), insn.get('type'), insn.get('args'), insn.get('funcs'),
+                   insn.get('labels'), insn.get('value'), insn.get('label'), extra)
+
+    def toJson(self):
+        insn = {}
+        for key in FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                insn[key] = value
+        if self.extra is not None:
+            insn.update(self.extra)
+        return insn
+
+    def __setitem__(self, key, value):
+        if key in ('args', 'funcs', 'labels'):
+            value = internAll(value)
+        elif key in FIELDS and key != 'value':
+            value = intern(value)
+        Node.__setitem__(self, key, value)
+
+class Function(Node):
+    __slots__ = ('name', 'args', 'type', 'instrs', 'extra')
+    FIELDS = ('name', 'args', 'type', 'instrs')
+
+    def __init__(self, name, args=None, type=None, instrs=None, extra=None):
+        self.name = intern(name)
+        self.args = args            # list of {'name', 'type'} dicts, or None
+        self.type = type
+        self.instrs = instrs if instrs is not None else []
+        self.extra = extra
+
+    @classmethod
+    def fromJson(cls, func):
+        args = None
+        if 'args' in func:
+            args = [dict(arg, name=sys.intern(arg['name'])) for arg in func['args']]
+        extra = {key: func[key] for key in func if key not in cls.FIELDS}
+        instrs = [Instruction.fromJson(insn) for insn in func.get('instrs', [])]
+        return cls(func['name'], args, func.get('type'), instrs, extra or None)
+
+    def toJson(self):
+        func = {'name': self.name, 'instrs': [toJson(insn) for insn in self.instrs]}
+        if self.args is not None:
+            func['args'] = self.args
+        if self.type is not None:
+            func['type'] = self.type
+        if self.extra is not None:
+            func.update(self.extra)
+        return func
+
+class Program(Node):
+    __slots__ = ('functions', 'extra')
+    FIELDS = ('functions',)
+
+    def __init__(self, functions=None, extra=None):
+        self.functions = functions if functions is not None else []
+        self.extra = extra
+
+    @classmethod
+    def fromJson(cls, program):
+        extra = {key: program[key] for key in program if key != 'functions'}
+        return cls([Function.fromJson(func) for func in program['functions']], extra or None)
+
+    def toJson(self):
+        program = {'functions': [func.toJson() for func in self.functions]}
+        if self.extra is not None:
+            program.update(self.extra)
+        return program
+
+def toJson(insn):
+    '''
+        input: Instruction or Bril JSON dict
+        output: Bril JSON dict
+    '''
+    return insn.toJson() if isinstance(insn, Instruction) else insn
+
+def load(file):
+    return Program.fromJson(json.load(file))
+
+def dump(program, file):
+    json.dump(program.toJson(), file, indent=2, sort_keys=True)
@@ -0,0 +1,421 @@
+import re
+import sys
+from runtime import BrilError, Pointer, Result, constant, divide, fdivide, format, parseArgument
+
+'''
+Compiling tier for brili.py: Bril functions to Python source
+
+    python brili.py --jit [-p] [ARG...] < prog.bril
+
+    Every Bril function becomes one Python function, generated as source
+    and exec'd once for the whole program. Variables are Python locals
+    (v0, v1, ... by first appearance), and the body is a `while True`
+    loop over the function's basic blocks: `b` holds the id of the next
+    block and a binary tree of `if b < k` tests picks it. Each block
+    adds its instruction count to a local counter when it starts, and
+    the function adds that to the program total when it returns, so
+    total_dyn_inst comes out the same as brili's without counting
+    instructions one by one.
+
+    compileProgram(program) returns the source, for debugging:
+
+        print(jit.compileProgram(program))
+
+    run(program, args, out, profile) also counts how many times every
+    block ran and every br went each way, into a profiles.Profile.
+'''
+
+MAX_INT = (1 << 63) - 1
+MIN_INT = -(1 << 63)
+OVERFLOW = ' > '+str(MAX_INT)+' or {0} < '+str(MIN_INT)
+
+COMPARISONS = {'eq': '==', 'lt': '<', 'gt': '>', 'le': '<=', 'ge': '>=',
+               'feq': '==', 'flt': '<', 'fgt': '>', 'fle': '<=', 'fge': '>=',
+               'ceq': '==', 'clt': '<', 'cgt': '>', 'cle': '<=', 'cge': '>='}
+FLOAT_MATH = {'fadd': '+', 'fsub': '-', 'fmul': '*'}
+INT_MATH = {'add': '+', 'sub': '-', 'mul': '*'}
+TERMINATORS = ('jmp', 'br', 'ret')
+
+class Heap:
+    '''
+        The mem extension's allocations, with brili's checks.
+    '''
+    def __init__(self):
+        self.live = set()       # ids of the live allocations
+
+    def alloc(self, size):
+        if size <= 0:
+            raise BrilError('cannot allocate '+str(size)+' cells')
+        cells = [None] * size
+        self.live.add(id(cells))
+        return Pointer(cells, 0)
+
+    def free(self, pointer):
+        if pointer.offset != 0 or id(pointer.cells) not in self.live:
+            raise BrilError('freeing a pointer that is not the start of a live allocation')
+        self.live.remove(id(pointer.cells))
+
+    def check(self, pointer):
+        if id(pointer.cells) not in self.live or not 0 <= pointer.offset < len(pointer.cells):
+            raise BrilError('access through an invalid pointer')
+
+    def load(self, pointer):
+        self.check(pointer)
+        value = pointer.cells[pointer.offset]
+        if value is None:
+            raise BrilError('load from uninitialized memory')
+        return value
+
+    def store(self, pointer, value):
+        self.check(pointer)
+        pointer.cells[pointer.offset] = value
+
+def wrap(n):
+    return ((n - MIN_INT) & ((1 << 64) - 1)) + MIN_INT
+
+def formBlocks(instrs):
+    '''
+        input: list of instructions
+        output: list of (labels, instructions) blocks; a block starts at
+                a label or after a terminator, so it has at most one
+                label and the blocks are the ones cfg.formBasicBlocks
+                finds
+    '''
+    blocks = []
+    labels = []
+    body = []
+    for insn in instrs:
+        if 'label' in insn:
+            if len(labels) != 0 or len(body) != 0:
+                blocks.append((labels, body))
+                labels, body = [], []
+            labels.append(insn['label'])
+            continue
+        body.append(insn)
+        if insn['op'] in TERMINATORS:
+            blocks.append((labels, body))
+            labels, body = [], []
+    if len(labels) != 0 or len(body) != 0:
+        blocks.append((labels, body))
+    return blocks
+
+def literal(value, type):
+    value = constant(value, type)
+    if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+        return 'float('+repr(repr(value))+')'
+    return repr(value)
+
+def blockNames(blocks):
+    '''
+        Names the blocks by their label, and the unlabeled ones label_0,
+        label_1, ... like cfg.addLabels does
+    '''
+    names = []
+    num = 0
+    for labels, _ in blocks:
+        if len(labels) != 0:
+            names.append(labels[0])
+        else:
+            names.append('label_'+str(num))
+            num += 1
+    return names
+
+class FunctionCompiler:
+    def __init__(self, func, names, base=None):
+        self.func = func
+        self.names = names          # map from Bril function name -> Python name
+        self.base = base            # index of the first block in hits/taken when profiling
+        self.vars = {}              # map from Bril variable -> Python local
+        self.lines = []
+
+    def var(self, name):
+        if name not in self.vars:
+            self.vars[name] = 'v'+str(len(self.vars))
+        return self.vars[name]
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def compile(self):
+        func = self.func
+        params = [self.var(arg['name']) for arg in func.get('args', [])]
+        blocks = formBlocks(func['instrs'])
+        self.blockIds = {}
+        for i, (labels, _) in enumerate(blocks):
+            for label in labels:
+                self.blockIds[label] = i
+        self.phis = any(insn.get('op') == 'phi' for insn in func['instrs'])
+        self.predecessors = [0] * len(blocks)
+        self.predecessors[0] = 1                # the call
+        for i in range(len(blocks)):
+            for j in self.successors(blocks, i):
+                self.predecessors[j] += 1
+
+        self.emit(0, 'def '+self.names[func['name']]+'('+', '.join(params)+'):')
+        self.emit(1, 'n = 0')
+        if len(blocks) == 0:
+            self.emit(1, 'return None')
+            return self.lines
+        if self.phis:
+            self.emit(1, 'last = cur = None')
+        self.emit(1, 'b = 0')
+        self.emit(1, 'while True:')
+        self.tree(blocks, 0, len(blocks), 2)
+        return self.lines
+
+    def tree(self, blocks, lo, hi, depth):
+        '''
+            Dispatch on b for blocks lo..hi-1
+        '''
+        if hi - lo == 1:
+            self.block(blocks, lo, depth)
+            return
+        mid = (lo + hi) // 2
+        self.emit(depth, 'if b < '+str(mid)+':')
+        self.tree(blocks, lo, mid, depth + 1)
+        self.emit(depth, 'else:')
+        self.tree(blocks, mid, hi, depth + 1)
+
+    def successors(self, blocks, i):
+        body = blocks[i][1]
+        if len(body) != 0 and body[-1]['op'] in ('jmp', 'br'):
+            return [int(self.target(label)) for label in body[-1]['labels']]
+        if len(body) != 0 and body[-1]['op'] == 'ret':
+            return []
+        return [i + 1] if i + 1 < len(blocks) else []
+
+    def block(self, blocks, i, depth, chain=()):
+        '''
+            Emits block i. When it always goes on to a block that nothing
+            else reaches, that block's code follows inline instead of
+            going back through the dispatch.
+        '''
+        labels, body = blocks[i]
+        self.current = i
+        if len(body) != 0:
+            self.emit(depth, 'n += '+str(len(body)))
+        if self.base is not None:
+            self.emit(depth, 'hits['+str(self.base + i)+'] += 1')
+        if self.phis:
+            for label in labels:
+                self.emit(depth, 'last, cur = cur, '+repr(label))
+        for insn in body[:-1]:
+            self.instruction(insn, depth)
+
+        last = body[-1] if len(body) != 0 else None
+        if last is not None and last['op'] in ('br', 'ret'):
+            self.instruction(last, depth)
+            return
+        successors = self.successors(blocks, i)
+        if len(successors) == 0:
+            if last is not None:
+                self.instruction(last, depth)
+            self.emit(depth, 'count[0] += n')
+            self.emit(depth, 'return None')
+            return
+        if last is not None and last['op'] != 'jmp':
+            self.instruction(last, depth)
+        following = successors[0]
+        if self.predecessors[following] == 1 and following not in chain and following != i:
+            self.block(blocks, following, depth, chain + (i,))
+        else:
+            self.emit(depth, 'b = '+str(following))
+
+    def target(self, label):
+        if label not in self.blockIds:
+            raise BrilError('label '+label+' not found in @'+self.func['name'])
+        return str(self.blockIds[label])
+
+    def instruction(self, insn, depth):
+        op = insn['op']
+        args = [self.var(arg) for arg in insn.get('args', [])]
+        dest = self.var(insn['dest']) if 'dest' in insn else None
+        emit = lambda line: self.emit(depth, line)
+
+        if op == 'const':
+            emit(dest+' = '+literal(insn['value'], insn.get('type')))
+        elif op == 'id':
+            emit(dest+' = '+args[0])
+        elif op in INT_MATH:
+            emit(dest+' = '+args[0]+' '+INT_MATH[op]+' '+args[1])
+            emit('if '+dest+OVERFLOW.format(dest)+':')
+            emit('    '+dest+' = wrap('+dest+')')
+        elif op in COMPARISONS:
+            emit(dest+' = '+args[0]+' '+COMPARISONS[op]+' '+args[1])
+        elif op == 'br' and self.base is not None:
+            # Only the true side is counted, the false side is the rest
+            emit('if '+args[0]+':')
+            emit('    taken['+str(self.base + self.current)+'] += 1')
+            emit('    b = '+self.target(insn['labels'][0]))
+            emit('else:')
+            emit('    b = '+self.target(insn['labels'][1]))
+        elif op == 'br':
+            emit('b = '+self.target(insn['labels'][0])+' if '+args[0]+' else '+self.target(insn['labels'][1]))
+        elif op == 'jmp':
+            emit('b = '+self.target(insn['labels'][0]))
+        elif op == 'div':
+            emit(dest+' = divide('+args[0]+', '+args[1]+')')
+        elif op == 'not':
+            emit(dest+' = not '+args[0])
+        elif op == 'and' or op == 'or':
+            emit(dest+' = '+args[0]+' '+op+' '+args[1])
+        elif op in FLOAT_MATH:
+            emit(dest+' = '+args[0]+' '+FLOAT_MATH[op]+' '+args[1])
+        elif op == 'fdiv':
+            emit(dest+' = fdivide('+args[0]+', '+args[1]+')')
+        elif op == 'call':
+            name = insn['funcs'][0]
+            if name not in self.names:
+                raise BrilError('function @'+name+' not found')
+            call = self.names[name]+'('+', '.join(args)+')'
+            emit(dest+' = '+call if dest is not None else call)
+        elif op == 'ret':
+            emit('count[0] += n')
+            emit('return '+(args[0] if len(args) != 0 else 'None'))
+        elif op == 'print':
+            emit('write('+" + ' ' + ".join('format('+arg+')' for arg in args)+(" + '\\n')" if len(args) != 0 else "'\\n')"))
+        elif op == 'alloc':
+            emit(dest+' = heap.alloc('+args[0]+')')
+        elif op == 'free':
+            emit('heap.free('+args[0]+')')
+        elif op == 'load':
+            emit(dest+' = heap.load('+args[0]+')')
+        elif op == 'store':
+            emit('heap.store('+args[0]+', '+args[1]+')')
+        elif op == 'ptradd':
+            emit(dest+' = Pointer('+args[0]+'.cells, '+args[0]+'.offset + '+args[1]+')')
+        elif op == 'char2int':
+            emit(dest+' = ord('+args[0]+')')
+        elif op == 'int2char':
+            emit(dest+' = chr('+args[0]+')')
+        elif op == 'phi':
+            labels = insn.get('labels', [])
+            value = 'None'
+            for label, arg in reversed(list(zip(labels, args))):
+                value = arg+' if last == '+repr(label)+' else '+value
+            emit(dest+' = '+value)
+            # No matching label leaves dest undefined, like brili
+            emit('if '+dest+' is None:')
+            emit('    del '+dest)
+        elif op == 'nop':
+            emit('pass')
+        else:
+            raise BrilError('unknown instruction '+op+' in @'+self.func['name'])
+
+def compileProgram(program, profiling=False):
+    '''
+        input: Bril JSON program, whether to count blocks and branches
+        output: Python source defining one function per Bril function
+
+        When profiling, every block adds one to hits[k] and every br
+        that goes to its first label adds one to taken[k], where k
+        numbers the blocks of all the functions in order.
+    '''
+    names = {func['name']: 'f'+str(i) for i, func in enumerate(program['functions'])}
+    lines = []
+    base = 0
+    for func in program['functions']:
+        lines += FunctionCompiler(func, names, base if profiling else None).compile()
+        lines.append('')
+        base += len(formBlocks(func['instrs']))
+    return '\n'.join(lines)
+
+def edges(program, hits, taken):
+    '''
+        input: program and the counters of a profiling run
+        output: map from function -> list of (block name, count, map from
+                successor name -> times the edge was taken)
+    '''
+    result = {}
+    base = 0
+    for func in program['functions']:
+        blocks = formBlocks(func['instrs'])
+        names = blockNames(blocks)
+        ids = {}
+        for i, (labels, _) in enumerate(blocks):
+            for label in labels:
+                ids[label] = i
+        result[func['name']] = []
+        for i, (_, body) in enumerate(blocks):
+            count = hits[base + i]
+            last = body[-1] if len(body) != 0 else {}
+            successors = {}
+            if last.get('op') == 'br':
+                yes, no = (names[ids[label]] for label in last['labels'])
+                successors[yes] = taken[base + i]
+                successors[no] = successors.get(no, 0) + count - taken[base + i]
+            elif last.get('op') == 'jmp':
+                successors[names[ids[last['labels'][0]]]] = count
+            elif last.get('op') != 'ret' and i + 1 < len(blocks):
+                successors[names[i + 1]] = count
+            result[func['name']].append((names[i], count, successors))
+        base += len(blocks)
+    return result
+
+def undefined(program, error):
+    '''
+        input: program and the NameError its compiled code raised
+        output: the Bril name of the variable that had no value; the
+                innermost compiled frame says which function, and
+                compiling that function again maps its locals back
+    '''
+    local = re.search(r"'(\w+)'", str(error)).group(1)
+    funcs = {'f'+str(i): func for i, func in enumerate(program['functions'])}
+    func = None
+    tb = error.__traceback__
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        if code.co_filename == '<bril>' and code.co_name in funcs:
+            func = funcs[code.co_name]
+        tb = tb.tb_next
+    if func is None:
+        return local
+    compiler = FunctionCompiler(func, {f['name']: name for name, f in funcs.items()})
+    compiler.compile()
+    for var, name in compiler.vars.items():
+        if name == local:
+            return var
+    return local
+
+def run(program, args, out, profile=None):
+    '''
+        Same as brili.run, through the compiled tier. With a
+        profiles.Profile, the block and edge counts of the run are added
+        to it.
+    '''
+    functions = {func['name']: func for func in program['functions']}
+    if 'main' not in functions:
+        raise BrilError('no main function')
+    mainArgs = functions['main'].get('args', [])
+    if len(args) != len(mainArgs):
+        raise BrilError('@main expects '+str(len(mainArgs))+' arguments, got '+str(len(args)))
+    values = [parseArgument(text, arg['type']) for arg, text in zip(mainArgs, args)]
+
+    source = compileProgram(program, profile is not None)
+    heap = Heap()
+    count = [0]
+    blocks = sum(len(formBlocks(func['instrs'])) for func in program['functions'])
+    hits = [0] * blocks
+    taken = [0] * blocks
+    namespace = {'count': count, 'heap': heap, 'write': out.write, 'format': format, 'wrap': wrap,
+                 'divide': divide, 'fdivide': fdivide, 'Pointer': Pointer, 'hits': hits, 'taken': taken}
+    exec(compile(source, '<bril>', 'exec'), namespace)
+    main = namespace['f'+str(list(functions).index('main'))]
+
+    # Bril calls are Python calls; since 3.11 these don't use the C stack
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 1000000))
+    try:
+        value = main(*values)
+    except RecursionError:
+        raise BrilError('call stack too deep')
+    except NameError as e:
+        # A variable read before any assignment (UnboundLocalError)
+        raise BrilError('undefined variable '+undefined(program, e)) from None
+    finally:
+        sys.setrecursionlimit(limit)
+    if len(heap.live) != 0:
+        raise BrilError('some memory locations have not been freed by end of execution')
+    if profile is not None:
+        profile.add(edges(program, hits, taken))
+    return Result(value, count[0])
@@ -0,0 +1,168 @@
+import importlib.util
+import json
+import binary
+import cache
+import ir
+import stream
+import os
+import sys
+import time
+
+'''
+Runs several passes over one program in a single process
+
+    Every pass script reads JSON from stdin and pretty-prints JSON to
+    stdout, so chaining them with pipes parses and serializes the whole
+    program once per pass, on top of starting a new interpreter. This
+    driver parses once, hands the same functions to every pass in order
+    and serializes once at the end. The output is the same as piping the
+    scripts together.
+
+    python pipeline.py --passes lvn,tdce [-t] [--ir] [--binary] [--cache] < prog.json
+
+    Passes are loaded from the lesson directories, see PASSES. -t prints
+    how long parsing, each pass and serializing took to stderr;
+    --time-passes and --mem-passes (see instrument.py) break that down
+    by function and by the stages inside each pass. --ir hands the passes
+    the slot-based IR from ir.py instead of JSON dicts. The input can be
+    JSON, Bril text or the binary format from binary.py, --binary writes
+    the latter.
+
+    With --cache (see cache.py) every function is looked up by its hash,
+    the pass list and the source of the passes first; functions found
+    in the cache are spliced into the output as they were stored and
+    the passes only run on the others.
+'''
+
+LESSONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lessons')
+
+def runTdce(tdce, func):
+    tdce.tdce(func)
+
+def lvnRunner(ebb, fold):
+    def runLvn(lvn, func):
+        lvn.optimize(func, ebb, fold)
+    return runLvn
+
+def runGcse(gcse, func):
+    gcse.gcse(func)
+
+def runAdce(adce, func):
+    adce.adce(func)
+
+def runSsa(ssa, func):
+    ssa.roundTrip(func)
+
+# pass name -> (script, function run on every function of the program)
+PASSES = {
+    'tdce': ('lesson03/tdce.py', runTdce),
+    'lvn': ('lesson03/lvn.py', lvnRunner(False, False)),
+    'lvn-fold': ('lesson03/lvn.py', lvnRunner(False, True)),
+    'ebb-lvn': ('lesson03/lvn.py', lvnRunner(True, True)),
+    'gcse': ('lesson04/gcse.py', runGcse),
+    'adce': ('lesson06/adce.py', runAdce),
+    'ssa': ('lesson06/ssa.py', runSsa),
+}
+
+loaded = {}     # map from script -> module
+
+def loadPass(script):
+    '''
+        Imports a pass script the way running it from its own directory
+        would: its siblings (cfg.py, dominators.py, ...) shadow modules
+        of the same name that other lessons already imported.
+    '''
+    if script in loaded:
+        return loaded[script]
+    path = os.path.join(LESSONS, script)
+    directory = os.path.dirname(path)
+    siblings = [name[:-3] for name in os.listdir(directory) if name.endswith('.py')]
+    shadowed = {}
+    for name in siblings:
+        module = sys.modules.get(name)
+        if module is not None and os.path.dirname(getattr(module, '__file__', '') or '') != directory:
+            shadowed[name] = sys.modules.pop(name)
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location('pass_'+script.replace('/', '_')[:-3], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+        # The pass keeps its own siblings, later passes get the originals back
+        for name in siblings:
+            if name in shadowed:
+                sys.modules[name] = shadowed[name]
+            elif name in sys.modules and os.path.dirname(sys.modules[name].__file__ or '') == directory:
+                del sys.modules[name]
+    loaded[script] = module
+    return module
+
+def openCache(names):
+    '''
+        Cache from the command line, versioned by the source of the
+        passes in names and of this directory, or None.
+    '''
+    directories = {os.path.dirname(os.path.abspath(__file__))}
+    for name in names:
+        directories.add(os.path.dirname(os.path.join(LESSONS, PASSES[name][0])))
+    return cache.fromArgs(directories)
+
+def parsePasses(argv):
+    if '--passes' not in argv or argv.index('--passes') + 1 == len(argv):
+        raise SystemExit('usage: python pipeline.py --passes tdce,lvn,... [-t] [--ir] [--binary] [--cache]\npasses: '+', '.join(PASSES))
+    names = argv[argv.index('--passes') + 1].split(',')
+    for name in names:
+        if name not in PASSES:
+            raise SystemExit('unknown pass '+name+', expected one of: '+', '.join(PASSES))
+    return names
+
+def main():
+    names = parsePasses(sys.argv)
+    timings = []        # (stage, seconds)
+
+    start = time.perf_counter()
+    program = stream.load(sys.stdin)
+    if '--ir' in sys.argv:
+        program = ir.Program.fromJson(program)
+    timings.append(('parse', time.perf_counter() - start))
+
+    functions = program['functions']
+    todo = functions
+    start = time.perf_counter()
+    store = openCache(names)
+    if store is not None:
+        keys, missed = store.lookup(functions, ','.join(names), ir.Function.fromJson if '--ir' in sys.argv else None)
+        todo = [functions[i] for i in missed]
+        timings.append(('cache get', time.perf_counter() - start))
+
+    for name in names:
+        script, run = PASSES[name]
+        module = loadPass(script)
+        start = time.perf_counter()
+        for func in todo:
+            run(module, func)
+        timings.append((name, time.perf_counter() - start))
+
+    if store is not None:
+        start = time.perf_counter()
+        store.save(functions, keys, missed)
+        store.close()
+        timings.append(('cache put', time.perf_counter() - start))
+
+    start = time.perf_counter()
+    if '--ir' in sys.argv:
+        program = program.toJson()
+    if '--binary' in sys.argv:
+        sys.stdout.buffer.write(binary.dumps(program))
+    else:
+        json.dump(program, sys.stdout, indent=2, sort_keys=True)
+    timings.append(('serialize', time.perf_counter() - start))
+
+    if '-t' in sys.argv:
+        for stage, seconds in timings:
+            print(stage.ljust(12)+str(round(seconds * 1000, 2)).rjust(10)+' ms', file=sys.stderr)
+        print('total'.ljust(12)+str(round(sum(s for _, s in timings) * 1000, 2)).rjust(10)+' ms', file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import sys
+
+'''
+Block and edge profiles for profile-guided decisions
+
+    python brili.py --profile prog.profile [ARG...] < prog.bril
+
+    runs the program on the compiled tier (jit.py) and writes how many
+    times every basic block ran and every CFG edge was taken. Blocks are
+    named by their label, unlabeled ones label_0, label_1, ... like
+    cfg.formBasicBlocks names them, so a pass can look up the blocks of
+    its own CFG directly. Running again with the same file adds to the
+    counts, so one profile can cover several inputs.
+
+    The file is text, one line per block that ran, under a line with
+    the function's name; each block line is the label, its count, then
+    every successor it went to with the number of times:
+
+        @main
+        label_0 1 for.cond 1
+        for.cond 11 for.body 10 for.end 1
+        for.body 10 for.cond 10
+        for.end 1
+
+    Passes (and the rv32 backend) read it with fromArgs(), which takes
+    --profile FILE, and ask for counts by function and label:
+
+        profile = profiles.fromArgs()
+        if profile is not None and profile.frequency('main', 'for.body') > 1:
+            ...
+
+    A block or edge that isn't in the profile never ran, and all the
+    queries give 0 for it. python profiles.py FILE lists the hottest
+    blocks of a profile.
+'''
+
+class Profile:
+    def __init__(self):
+        self.blocks = {}            # map from function -> {label: count}
+        self.edges = {}             # map from function -> {(label, successor): count}
+
+    def add(self, counts):
+        '''
+            input: map from function -> list of (label, count, map from
+                   successor -> count), as jit.edges gives it
+        '''
+        for func, blocks in counts.items():
+            funcBlocks = self.blocks.setdefault(func, {})
+            funcEdges = self.edges.setdefault(func, {})
+            for label, count, successors in blocks:
+                if count == 0:
+                    continue
+                funcBlocks[label] = funcBlocks.get(label, 0) + count
+                for successor, taken in successors.items():
+                    if taken != 0:
+                        funcEdges[(label, successor)] = funcEdges.get((label, successor), 0) + taken
+
+    def count(self, func, label):
+        '''
+            Times the block ran
+        '''
+        return self.blocks.get(func, {}).get(label, 0)
+
+    def edge(self, func, label, successor):
+        '''
+            Times control went from the block to successor
+        '''
+        return self.edges.get(func, {}).get((label, successor), 0)
+
+    def calls(self, func):
+        '''
+            Times the function was called: runs of its first block that
+            didn't come from a branch back to it
+        '''
+        blocks = self.blocks.get(func, {})
+        if len(blocks) == 0:
+            return 0
+        entry = next(iter(blocks))
+        back = sum(count for (_, successor), count in self.edges[func].items() if successor == entry)
+        return blocks[entry] - back
+
+    def frequency(self, func, label):
+        '''
+            Times the block runs per call of its function, the weight to
+            give it when deciding spills or layout
+        '''
+        calls = self.calls(func)
+        return self.count(func, label) / calls if calls != 0 else 0.0
+
+    def probability(self, func, label, successor):
+        '''
+            Fraction of the block's runs that went on to successor
+        '''
+        count = self.count(func, label)
+        return self.edge(func, label, successor) / count if count != 0 else 0.0
+
+    def hottest(self, func=None):
+        '''
+            output: list of (count, function, label), most run first,
+                    for one function or the whole program
+        '''
+        functions = [func] if func is not None else list(self.blocks)
+        hot = [(count, f, label) for f in functions for label, count in self.blocks.get(f, {}).items()]
+        hot.sort(key=lambda entry: -entry[0])
+        return hot
+
+    def isHot(self, func, label, fraction=0.01):
+        '''
+            True if the block ran at least fraction as many times as the
+            hottest block of the program
+        '''
+        hot = self.hottest()
+        return len(hot) != 0 and self.count(func, label) >= fraction * hot[0][0]
+
+    def write(self, file):
+        for func, blocks in self.blocks.items():
+            file.write('@'+func+'\n')
+            successors = {}
+            for (label, successor), count in self.edges[func].items():
+                successors.setdefault(label, []).append(successor+' '+str(count))
+            for label, count in blocks.items():
+                file.write(' '.join([label, str(count)] + successors.get(label, []))+'\n')
+
+    def read(self, file):
+        func = None
+        for number, line in enumerate(file, 1):
+            fields = line.split()
+            if len(fields) == 0:
+                continue
+            if fields[0].startswith('@'):
+                func = fields[0][1:]
+                self.blocks.setdefault(func, {})
+                self.edges.setdefault(func, {})
+                continue
+            if func is None or len(fields) % 2 != 0:
+                raise ValueError('line '+str(number)+' of the profile: expected a function or "label count [successor count]..."')
+            label = fields[0]
+            self.blocks[func][label] = self.blocks[func].get(label, 0) + int(fields[1])
+            for i in range(2, len(fields), 2):
+                key = (label, fields[i])
+                self.edges[func][key] = self.edges[func].get(key, 0) + int(fields[i + 1])
+
+def load(path):
+    profile = Profile()
+    with open(path) as file:
+        profile.read(file)
+    return profile
+
+def save(profile, path):
+    with open(path, 'w') as file:
+        profile.write(file)
+
+def option(name):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return sys.argv[sys.argv.index(name) + 1]
+    return None
+
+def fromArgs():
+    '''
+        The profile named by --profile FILE, or None
+    '''
+    path = option('--profile')
+    return load(path) if path is not None else None
+
+def main():
+    if len(sys.argv) < 2:
+        raise SystemExit('usage: python profiles.py FILE [N]')
+    profile = load(sys.argv[1])
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for count, func, label in profile.hottest()[:limit]:
+        print(str(count).rjust(12)+'  @'+func+'.'+label+'  '+str(round(profile.frequency(func, label), 2))+'/call')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import copy
+import glob
+import io
+import json
+import os
+import re
+import sys
+import time
+import bril2json
+import instrument
+import jit
+import pipeline
+from runtime import BrilError
+
+'''
+Benchmark regression suite for the pass pipelines
+
+    python regress.py [--pipeline lvn,tdce ...] [--dirs core,mem,mixed,long]
+                      [--baseline FILE] [--save FILE]
+                      [--time [--runs N] [--time-threshold PCT]] [-v]
+
+    Runs every pipeline (by default PIPELINES; --pipeline, repeatable,
+    picks others) over every .bril program under test/benchmarks/<dir>
+    and records, per program and pipeline:
+
+        insns   static instructions in the output
+        bytes   size of the output as compact JSON
+        dyn     total_dyn_inst running the output with the program's
+                "# ARGS:" (on jit.py)
+        ms      only with --time: time spent in each pass, best of
+                --runs (default 3)
+
+    The unoptimized program is measured too, and every pipeline's output
+    has to print the same thing it does; one that doesn't is a failure.
+
+    The results are compared with the baseline (lessons/lesson03/
+    results_regress.json unless --baseline says otherwise). The counts
+    are deterministic, so a program whose insns, bytes or dyn grew at all
+    is a regression.
+
+    Timings are compared only with --time, and only if the baseline was
+    saved with --time too. Such a run also times calibrate(), a fixed
+    pure-Python workload, and the baseline's pass times are scaled by the
+    ratio of the two calibrations before comparing, so a slower or busier
+    machine doesn't show up as a regression. A pass whose time summed
+    over all the programs both runs have grew by more than
+    --time-threshold percent (default 25) after scaling is a regression.
+
+    The script prints a summary per pipeline and every regression, and
+    exits with status 1 if there was one. --save FILE writes the results
+    as JSON, which is how the baseline is made:
+
+    python regress.py --time --save ../lessons/lesson03/results_regress.json
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, 'test', 'benchmarks')
+BASELINE = os.path.join(ROOT, 'lessons', 'lesson03', 'results_regress.json')
+DIRS = ['core', 'mem', 'mixed', 'long']
+PIPELINES = ['tdce', 'lvn,tdce', 'lvn-fold,tdce', 'ebb-lvn,tdce', 'gcse,tdce', 'ssa,tdce']
+METRICS = ('insns', 'bytes', 'dyn')
+
+def options(name):
+    values = []
+    for i, arg in enumerate(sys.argv[:-1]):
+        if arg == name:
+            values.append(sys.argv[i + 1])
+    return values
+
+def option(name, default=None):
+    values = options(name)
+    return values[-1] if len(values) != 0 else default
+
+def programs(dirs):
+    '''
+        output: list of (name, Bril JSON program, arguments), name being
+                the path under test/benchmarks without .bril
+    '''
+    found = []
+    for directory in dirs:
+        for path in sorted(glob.glob(os.path.join(BENCHMARKS, directory, '*.bril'))):
+            with open(path, 'rb') as file:
+                data = file.read()
+            # Some of the checked-in programs were saved as UTF-16
+            text = data.decode('utf-16' if data[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8')
+            match = re.search(r'ARGS:(.*)', text)
+            name = os.path.splitext(os.path.relpath(path, BENCHMARKS))[0].replace(os.sep, '/')
+            found.append((name, bril2json.parse(text), match.group(1).split() if match else []))
+    return found
+
+def execute(program, args, memo):
+    '''
+        output: (what the program printed, total_dyn_inst), from memo if
+                an identical program already ran
+    '''
+    key = json.dumps(program, sort_keys=True, separators=(',', ':'))
+    if key not in memo:
+        out = io.StringIO()
+        try:
+            memo[key] = (out.getvalue(), jit.run(program, args, out).count)
+        except BrilError as e:
+            memo[key] = (out.getvalue()+'error: '+str(e)+'\n', None)
+    return memo[key]
+
+def size(program):
+    return {'insns': instrument.countInstructions(program),
+            'bytes': len(json.dumps(program, separators=(',', ':')))}
+
+def calibrate(runs=20):
+    '''
+        output: best time in ms of a fixed workload shaped like the
+                passes (tuple keys, dict lookups, list appends), the
+                unit pass times are compared in. Many short runs, since
+                their minimum is what stays put on a busy machine.
+    '''
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        table = {}
+        order = []
+        for i in range(50000):
+            key = ('add', i % 997, i % 13)
+            if key in table:
+                table[key] += 1
+            else:
+                table[key] = 1
+                order.append(key)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3)
+
+def optimize(program, names, runs):
+    '''
+        Runs the passes over fresh copies of the program runs times.
+
+        output: optimized program, map from pass -> best time in ms
+    '''
+    best = {}
+    for _ in range(runs):
+        result = copy.deepcopy(program)
+        for name in names:
+            script, run = pipeline.PASSES[name]
+            module = pipeline.loadPass(script)
+            start = time.perf_counter()
+            for func in result['functions']:
+                run(module, func)
+            elapsed = (time.perf_counter() - start) * 1000
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return result, {name: round(ms, 3) for name, ms in best.items()}
+
+def measure(pipelines, dirs, runs, timed, verbose):
+    results = {}
+    for name, program, args in programs(dirs):
+        memo = {}
+        expected, dyn = execute(program, args, memo)
+        entry = dict(size(program), dyn=dyn, args=args, pipelines={})
+        for names in pipelines:
+            try:
+                optimized, times = optimize(program, names.split(','), runs if timed else 1)
+            except Exception as e:
+                entry['pipelines'][names] = {'error': type(e).__name__+': '+str(e)}
+                continue
+            printed, count = execute(optimized, args, memo)
+            record = dict(size(optimized), dyn=count)
+            if timed:
+                record['ms'] = times
+            if printed != expected:
+                record['error'] = 'output differs from the unoptimized program'
+            entry['pipelines'][names] = record
+        results[name] = entry
+        if verbose:
+            print(name, file=sys.stderr)
+    return {'pipelines': pipelines, 'dirs': dirs, 'programs': results}
+
+def percent(new, old):
+    return 100.0 * (new - old) / old if old else (0.0 if new == old else float('inf'))
+
+def passTimes(results, names, common):
+    totals = {}
+    for program in common:
+        record = results['programs'][program]['pipelines'].get(names, {})
+        for name, ms in record.get('ms', {}).items():
+            totals[name] = totals.get(name, 0.0) + ms
+    return totals
+
+def compare(results, baseline, timeThreshold):
+    '''
+        output: list of regressions, as messages
+    '''
+    regressions = []
+    common = [name for name in results['programs'] if name in baseline['programs']]
+    for program in common:
+        new = results['programs'][program]['pipelines']
+        old = baseline['programs'][program]['pipelines']
+        for names, record in new.items():
+            if 'error' in record:
+                regressions.append(program+' ['+names+']: '+record['error'])
+                continue
+            if names not in old or 'error' in old[names]:
+                continue
+            for metric in METRICS:
+                if record[metric] is None or old[names][metric] is None:
+                    continue
+                if record[metric] > old[names][metric]:
+                    regressions.append(program+' ['+names+']: '+metric+' '+str(old[names][metric])+' -> '
+                                       +str(record[metric])+' (%+.1f%%)' % percent(record[metric], old[names][metric]))
+    if 'calibration' not in results or 'calibration' not in baseline:
+        return regressions
+    # The baseline's times as they would be on this machine
+    scale = results['calibration'] / baseline['calibration']
+    for names in results['pipelines']:
+        if names not in baseline['pipelines']:
+            continue
+        old = passTimes(baseline, names, common)
+        for name, ms in passTimes(results, names, common).items():
+            if name in old and percent(ms, old[name] * scale) > timeThreshold:
+                regressions.append('['+names+'] '+name+' time '+str(round(old[name] * scale, 1))+' -> '+str(round(ms, 1))
+                                   +' ms (%+.1f%%, calibrated)' % percent(ms, old[name] * scale))
+    return regressions
+
+def summary(results):
+    rows = [('pipeline', 'compile (ms)', 'insns', 'dyn', 'failed')]
+    programs = results['programs'].values()
+    baseInsns = sum(p['insns'] for p in programs)
+    baseDyn = sum(p['dyn'] for p in programs if p['dyn'] is not None)
+    rows.append(('(none)', '-', str(baseInsns), str(baseDyn), '-'))
+    for names in results['pipelines']:
+        records = [p['pipelines'][names] for p in programs]
+        ok = [r for r in records if 'error' not in r]
+        ms = sum(sum(r['ms'].values()) for r in ok if 'ms' in r)
+        insns = sum(r['insns'] for r in ok)
+        dyn = sum(r['dyn'] for r in ok if r['dyn'] is not None)
+        rows.append((names, str(round(ms, 1)) if 'calibration' in results else '-', str(insns)+' (%+.1f%%)' % percent(insns, baseInsns),
+                     str(dyn)+' (%+.1f%%)' % percent(dyn, baseDyn), str(len(records) - len(ok))))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print('  '.join(cell.ljust(widths[i]) if i == 0 else cell.rjust(widths[i]) for i, cell in enumerate(row)))
+
+def main():
+    pipelines = options('--pipeline') or PIPELINES
+    for names in pipelines:
+        for name in names.split(','):
+            if name not in pipeline.PASSES:
+                raise SystemExit('unknown pass '+name+', expected one of: '+', '.join(pipeline.PASSES))
+    dirs = option('--dirs', ','.join(DIRS)).split(',')
+    timed = '--time' in sys.argv
+    runs = int(option('--runs', 3))
+    # Calibrating on both sides of the measurement evens out load that
+    # comes and goes while it runs
+    calibration = calibrate() if timed else None
+    results = measure(pipelines, dirs, runs, timed, '-v' in sys.argv)
+    if timed:
+        results['calibration'] = min(calibration, calibrate())
+    print(str(len(results['programs']))+' programs in '+', '.join(dirs))
+    if timed:
+        print('calibration: '+str(results['calibration'])+' ms')
+    summary(results)
+
+    save = option('--save')
+    if save is not None:
+        with open(save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    path = option('--baseline', BASELINE)
+    if not os.path.exists(path):
+        print('no baseline at '+path)
+        return
+    with open(path) as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, float(option('--time-threshold', 25)))
+    print()
+    if timed and 'calibration' not in baseline:
+        print('the baseline has no timings, only the counts were compared')
+    print(str(len(regressions))+' regressions against '+os.path.relpath(path))
+    for regression in regressions:
+        print('  '+regression)
+    if len(regressions) != 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
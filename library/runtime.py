@@ -0,0 +1,93 @@
+'''
+Values and errors shared by brili.py and its compiling tier in jit.py
+
+    Both tiers raise BrilError for a program that goes wrong, build the
+    same Pointers and Results and parse @main's arguments the same way.
+    They live here rather than in brili.py because running brili.py as a
+    script makes it __main__: jit.py importing from brili would load a
+    second copy with its own BrilError, which brili's main can't catch.
+'''
+
+MIN_INT = -(1 << 63)
+MAX_INT = (1 << 63) - 1
+
+class BrilError(Exception):
+    pass
+
+def constant(value, type):
+    if type == 'float':
+        return float(value)
+    if type == 'bool' or isinstance(value, bool):
+        return bool(value)
+    if type == 'char':
+        return value
+    return int(value)
+
+def wrap(n):
+    '''
+        Two's complement wraparound to 64 bits, like brili's BigInt.asIntN(64)
+    '''
+    return ((n - MIN_INT) & ((1 << 64) - 1)) + MIN_INT
+
+def divide(a, b):
+    if b == 0:
+        raise BrilError('division by zero')
+    q = abs(a) // abs(b)
+    return wrap(q if (a < 0) == (b < 0) else -q)
+
+def fdivide(a, b):
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return float('nan')
+        return float('inf') if (a > 0) == (str(b)[0] != '-') else float('-inf')
+
+class Pointer:
+    __slots__ = ('cells', 'offset')
+
+    def __init__(self, cells, offset):
+        self.cells = cells          # the allocation's list of values
+        self.offset = offset
+
+    def __eq__(self, other):
+        return isinstance(other, Pointer) and self.cells is other.cells and self.offset == other.offset
+
+    def __hash__(self):
+        return hash((id(self.cells), self.offset))
+
+def format(value):
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return '%.17f' % value
+    if isinstance(value, Pointer):
+        return '{"loc":'+str(id(value.cells))+',"offset":'+str(value.offset)+'}'
+    return str(value)
+
+def parseArgument(text, type):
+    if type == 'bool':
+        if text not in ('true', 'false'):
+            raise BrilError('expected a bool argument, got '+text)
+        return text == 'true'
+    try:
+        if type == 'float':
+            return float(text)
+        if type == 'char':
+            if len(text) != 1:
+                raise ValueError
+            return text
+        return int(text)
+    except ValueError:
+        raise BrilError('expected '+('an ' if type == 'int' else 'a ')+type+' argument, got '+text) from None
+
+class Result:
+    def __init__(self, value, count):
+        self.value = value          # what @main returned, if anything
+        self.count = count          # total_dyn_inst
@@ -0,0 +1,154 @@
+import json
+import re
+import sys
+import binary
+import bril2json
+
+'''
+Streaming Bril JSON, one function at a time
+
+    json.load keeps the whole program, and everything a pass derives from
+    it, in memory until the end. FunctionReader decodes the `functions`
+    array one element at a time and FunctionWriter writes each function
+    out as soon as the pass is done with it, so peak memory follows the
+    largest function rather than the whole program.
+
+    Example:
+        reader = stream.reader(sys.stdin)
+        writer = stream.writer(sys.stdout)
+        for func in reader:
+            tdce(func)
+            writer.write(func)
+        writer.close(reader.extra)
+
+    The output is byte for byte what json.dump(program, indent=2,
+    sort_keys=True) would write, as long as any other top-level keys sort
+    after "functions".
+
+    reader() also accepts the binary format from binary.py and Bril text
+    (see bril2json.py), told apart by their first bytes, and writer()
+    writes binary when --binary is passed.
+'''
+
+CHUNK = 1 << 16
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+class FunctionReader:
+    '''
+        Iterates over the functions of a Bril JSON program read from file.
+        Other top-level keys end up in `extra` as they are passed (the
+        ones after "functions" only once iteration is finished).
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.extra = {}
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=CHUNK):
+        data = self.file.read(max(size, CHUNK))
+        if data == '':
+            self.eof = True
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        '''
+            Skips whitespace, returns the next character ('' at the end).
+        '''
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('expected '+repr(char)+' at offset '+str(self.pos)+' of the buffered input')
+        self.pos += 1
+
+    def value(self):
+        while True:
+            self.peek()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number running into the end of the buffer may go on
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the buffer geometrically so a large value is decoded
+            # O(log n) times, not once per chunk
+            self.fill(len(self.buffer) - self.pos)
+
+    def __iter__(self):
+        self.expect('{')
+        while self.peek() != '}':
+            if self.peek() == ',':
+                self.pos += 1
+            key = self.value()
+            self.expect(':')
+            if key != 'functions':
+                self.extra[key] = self.value()
+                continue
+            self.expect('[')
+            while self.peek() != ']':
+                if self.peek() == ',':
+                    self.pos += 1
+                yield self.value()
+            self.pos += 1
+        self.pos += 1
+
+class FunctionWriter:
+    '''
+        Writes a Bril JSON program to file one function at a time.
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def write(self, func):
+        text = json.dumps(func, indent=2, sort_keys=True)
+        self.file.write('{\n  "functions": [\n' if self.count == 0 else ',\n')
+        self.file.write('\n'.join('    '+line for line in text.split('\n')))
+        self.count += 1
+
+    def close(self, extra=None):
+        self.file.write('{\n  "functions": []' if self.count == 0 else '\n  ]')
+        for key in sorted(extra or {}):
+            text = json.dumps(extra[key], indent=2, sort_keys=True)
+            self.file.write(',\n  '+json.dumps(key)+': '+text.replace('\n', '\n  '))
+        self.file.write('\n}')
+
+def reader(file):
+    '''
+        FunctionReader for JSON, binary.Reader for the binary format,
+        bril2json.Reader for Bril text.
+    '''
+    raw = getattr(file, 'buffer', None)
+    if raw is not None and hasattr(raw, 'peek'):
+        head = raw.peek(1)
+        if binary.isBinary(head):
+            return binary.Reader(raw.read())
+        if bril2json.isText(head.lstrip()):
+            return bril2json.Reader(file.read())
+    return FunctionReader(file)
+
+def writer(file):
+    if '--binary' in sys.argv:
+        return binary.Writer(file.buffer)
+    return FunctionWriter(file)
+
+def load(file):
+    '''
+        Reads a whole program, JSON or binary, for passes that need all
+        of it at once.
+    '''
+    functions = reader(file)
+    program = {'functions': list(functions)}
+    program.update(functions.extra)
+    return program
@@ -0,0 +1,187 @@
+import json
+import random
+import sys
+
+'''
+Seeded generator of large, valid core Bril programs
+
+    python synth.py [--seed N] [--blocks N] [--depth N] [--branches P]
+                    [--loops P] [--vars N] [--functions N] [--width N] > prog.json
+
+    Every function is built from nested regions until it has about
+    --blocks labeled basic blocks (default 100). A region is a straight
+    block of 2-6 instructions, an if/else diamond (with probability
+    --branches, default 0.3) or a counted loop (--loops, default 0.2),
+    nested at most --depth deep (default 3); the arms and loop bodies
+    are regions again. Instructions compute over a pool of --vars int
+    variables (default 16) that the entry block initializes, so every
+    use is defined on every path.
+
+    There are --functions functions (default 1, @main first). Each one
+    calls --width (default 2) of the functions after it, so the call
+    graph is acyclic. Loops run LOOP_TRIPS times, so every program
+    terminates, though deep nesting and wide call graphs make running
+    it slow. The same seed and knobs always give the same program.
+
+    Example:
+        program = synth.generate(seed=1, blocks=500, depth=4)
+'''
+
+LOOP_TRIPS = 3
+MATH = ['add', 'sub', 'mul']
+COMPARE = ['eq', 'lt', 'gt', 'le', 'ge']
+
+class FunctionGenerator:
+    def __init__(self, rng, name, params, callees, vars, depth, branches, loops):
+        self.rng = rng
+        self.name = name
+        self.params = params        # names of the int arguments
+        self.callees = callees      # (name, number of arguments) this function may call
+        self.pool = ['v'+str(i) for i in range(vars)]
+        self.depth = depth
+        self.branches = branches
+        self.loops = loops
+        self.instrs = []
+        self.labels = 0
+        self.temps = 0
+
+    def label(self, prefix):
+        self.labels += 1
+        return prefix+str(self.labels)
+
+    def temp(self, prefix):
+        self.temps += 1
+        return prefix+str(self.temps)
+
+    def emit(self, insn):
+        self.instrs.append(insn)
+
+    def straight(self):
+        self.emit({'label': self.label('b')})
+        for _ in range(self.rng.randint(2, 6)):
+            dest = self.rng.choice(self.pool)
+            kind = self.rng.random()
+            if kind < 0.15:
+                self.emit({'dest': dest, 'op': 'const', 'type': 'int', 'value': self.rng.randrange(-50, 100)})
+            elif kind < 0.25:
+                self.emit({'dest': dest, 'op': 'id', 'type': 'int', 'args': [self.rng.choice(self.pool)]})
+            elif kind < 0.3 and len(self.callees) != 0:
+                callee, nargs = self.rng.choice(self.callees)
+                args = [self.rng.choice(self.pool) for _ in range(nargs)]
+                self.emit({'dest': dest, 'op': 'call', 'type': 'int', 'funcs': [callee], 'args': args})
+            else:
+                self.emit({'dest': dest, 'op': self.rng.choice(MATH), 'type': 'int',
+                           'args': [self.rng.choice(self.pool), self.rng.choice(self.pool)]})
+
+    def compare(self):
+        dest = self.temp('c')
+        self.emit({'dest': dest, 'op': self.rng.choice(COMPARE), 'type': 'bool',
+                   'args': [self.rng.choice(self.pool), self.rng.choice(self.pool)]})
+        return dest
+
+    def condition(self):
+        cond = self.compare()
+        kind = self.rng.random()
+        if kind < 0.2:
+            dest = self.temp('c')
+            self.emit({'dest': dest, 'op': self.rng.choice(['and', 'or']), 'type': 'bool', 'args': [cond, self.compare()]})
+            cond = dest
+        elif kind < 0.3:
+            dest = self.temp('c')
+            self.emit({'dest': dest, 'op': 'not', 'type': 'bool', 'args': [cond]})
+            cond = dest
+        return cond
+
+    def diamond(self, budget, depth):
+        cond = self.condition()
+        then, other, join = self.label('t'), self.label('f'), self.label('j')
+        self.emit({'op': 'br', 'args': [cond], 'labels': [then, other]})
+        inner = budget - 3
+        left = self.rng.randint(0, inner)
+        self.emit({'label': then})
+        self.region(left, depth)
+        self.emit({'op': 'jmp', 'labels': [join]})
+        self.emit({'label': other})
+        self.region(inner - left, depth)
+        self.emit({'label': join})
+
+    def loop(self, budget, depth):
+        counter = self.temp('i')
+        head, body, exit = self.label('h'), self.label('l'), self.label('x')
+        self.emit({'dest': counter, 'op': 'const', 'type': 'int', 'value': 0})
+        self.emit({'label': head})
+        cond = self.temp('c')
+        self.emit({'dest': cond, 'op': 'lt', 'type': 'bool', 'args': [counter, 'trips']})
+        self.emit({'op': 'br', 'args': [cond], 'labels': [body, exit]})
+        self.emit({'label': body})
+        self.region(budget - 3, depth + 1)
+        self.emit({'dest': counter, 'op': 'add', 'type': 'int', 'args': [counter, 'one']})
+        self.emit({'op': 'jmp', 'labels': [head]})
+        self.emit({'label': exit})
+
+    def region(self, budget, depth):
+        '''
+            Emits about budget labeled blocks
+        '''
+        while budget > 0:
+            kind = self.rng.random()
+            size = self.rng.randint(3, max(3, budget))
+            if kind < self.loops and depth < self.depth and budget >= 3:
+                self.loop(size, depth)
+            elif kind < self.loops + self.branches and budget >= 3:
+                self.diamond(size, depth)
+            else:
+                size = 1
+                self.straight()
+            budget -= size
+
+    def generate(self, blocks):
+        self.emit({'dest': 'one', 'op': 'const', 'type': 'int', 'value': 1})
+        self.emit({'dest': 'trips', 'op': 'const', 'type': 'int', 'value': LOOP_TRIPS})
+        for i, var in enumerate(self.pool):
+            if i < len(self.params):
+                self.emit({'dest': var, 'op': 'id', 'type': 'int', 'args': [self.params[i]]})
+            else:
+                self.emit({'dest': var, 'op': 'const', 'type': 'int', 'value': self.rng.randrange(100)})
+        self.region(blocks - 2, 0)
+        self.emit({'label': self.label('b')})
+        func = {'name': self.name, 'instrs': self.instrs}
+        if self.name == 'main':
+            self.emit({'op': 'print', 'args': self.pool[:4]})
+        else:
+            func['args'] = [{'name': param, 'type': 'int'} for param in self.params]
+            func['type'] = 'int'
+            self.emit({'op': 'ret', 'args': [self.rng.choice(self.pool)]})
+        return func
+
+def generate(seed=0, blocks=100, depth=3, branches=0.3, loops=0.2, vars=16, functions=1, width=2):
+    '''
+        output: Bril JSON program, see the knobs above
+    '''
+    rng = random.Random(seed)
+    names = ['main'] + ['f'+str(i) for i in range(1, functions)]
+    arity = {name: (0 if name == 'main' else rng.randint(1, 3)) for name in names}
+    program = {'functions': []}
+    for i, name in enumerate(names):
+        later = names[i + 1:]
+        callees = rng.sample(later, min(width, len(later)))
+        params = ['a'+str(j) for j in range(arity[name])]
+        generator = FunctionGenerator(rng, name, params, [(callee, arity[callee]) for callee in callees],
+                                      max(vars, len(params), 4), depth, branches, loops)
+        program['functions'].append(generator.generate(blocks))
+    return program
+
+def option(name, default):
+    if name in sys.argv and sys.argv.index(name) + 1 < len(sys.argv):
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+def main():
+    program = generate(option('--seed', 0), option('--blocks', 100), option('--depth', 3),
+                       option('--branches', 0.3), option('--loops', 0.2), option('--vars', 16),
+                       option('--functions', 1), option('--width', 2))
+    json.dump(program, sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+main:
+	addi sp, sp, -16
+	sw x1, 12(sp)
+	sw fp, 8(sp)
+	addi fp, sp, 12
+	addi x6, x0, 1
+	sw x6, -8(fp)
+	lw x5, -8(fp)
+	xori x6, x5, 1
+	sw x6, -12(fp)
+	add x0, x0, x0
+	lw fp, 8(sp)
+	lw x1, 12(sp)
+	addi sp, sp, 16
+	jalr x0, x1, 0 
@@ -1,12 +1,17 @@
-import json
 from util.util import *
+import cache
+import os
+import stream
 
 def main():
-  # Read in source Bril program
-  program = json.load(sys.stdin)
+  # Read in source Bril program one function at a time
+  functions = stream.reader(sys.stdin)
 
-  # Lower to RISC-V
-  lower(program)
+  # Lower to RISC-V, reusing functions lowered before with --cache
+  store = cache.fromArgs([os.path.dirname(os.path.abspath(__file__))])
+  lower_functions(functions, store)
+  if store is not None:
+    store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
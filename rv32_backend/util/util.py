@@ -2,6 +2,8 @@ import json
 import sys
 import util.cfg as cfg
 import itertools
+sys.path.append("../library")
+import instrument
 
 # from BrilInsns import *
 from BrilInsns.BrilLabelInsn import BrilLabelInsn
@@ -47,6 +49,7 @@ from util.prologue import Prologue
 from util.epilogue import Epilogue
 from util.visitor import Visitor
 
+@instrument.stage('rv32 preprocess')
 def preprocess(program):
     insert_labels(program)
     mangle(program)
@@ -98,6 +101,7 @@ def get_temps(func):
                 temps.append(insn['dest'])
     return temps
 
+@instrument.stage('rv32 to RVIR')
 def convert_to_RVIRInsns(lis_BrilInsns, frame_size=0, nargs=0, temps=[],args=[]):
     lis_RVIRInsns = []
     for b_insn in lis_BrilInsns:
@@ -116,7 +120,7 @@ def convert_to_BrilInsn(insn, isFuncName=False):
     if 'op' in insn:
         match insn['op']:
             case 'add' | 'sub' | 'mul' | 'div' | 'and' | 'or' | 'not':
-                return BrilMathInsn(insn['op'], insn['dest'], insn['args'][0], insn['args'][1])
+                return BrilMathInsn(insn['op'], insn['dest'], *insn['args'])   # not has one arg
             case op if op in relational_ops:
                 return BrilRelationalMathInsn(insn['dest'], insn['args'][0], insn['op'], insn['args'][1])
             case 'const':
@@ -142,6 +146,7 @@ def convert_to_BrilInsn(insn, isFuncName=False):
                 return insn
     return insn
 
+@instrument.stage('rv32 to BrilInsns')
 def convert_to_BrilInsns(func):
     lis_BrilInsns = []
     blocks = cfg.formBasicBlocks(func['instrs'])
@@ -184,6 +189,7 @@ def insert_labels(program):
         blocks = cfg.formBasicBlocks(func['instrs'], func['name'])
         func['instrs'] = list(itertools.chain(*blocks))
 
+@instrument.stage('rv32 emit')
 def write_asm(listRISCVObjs):
     asm = []
     for riscvobj in listRISCVObjs:
@@ -218,11 +224,28 @@ def map_args(lis_RVIRInsns, args):
             new_regs.append(regs[len(new_regs)])
         insn.cc_update(new_regs)
 
+@instrument.stage('rv32 regalloc')
+def allocate_registers(lis_RVIRInsns, mapping):
+    trivialRegAllocator = TrivialRegisterAllocator(lis_RVIRInsns,mapping)
+    return trivialRegAllocator.trivialRegisterAllocation()
+
 def use_xregs(RVIRInsnsAfterTrivialRA):
     visitor = Visitor(RVIRInsnsAfterTrivialRA)
     visitor.xregs()
 
 def lower(program):
+  lower_functions(program['functions'])
+
+def reset_labels():
+  '''
+    Restarts the numbering of the labels and temporaries the lowering
+    makes up, so a process that lowers several programs gives each the
+    same output as lowering it on its own
+  '''
+  BrilBranchInsn.numBranches = 1
+  BrilRelationalMathInsn.numRel = 1
+
+def lower_functions(functions, store=None):
   # get name of output file
   output_file = set_fileName()
 
@@ -230,11 +253,38 @@ def lower(program):
   x_regs = False
   if '-x' in sys.argv:
       x_regs = True
-  assembly_code = []
 
-  # preprocessing step
-  preprocess(program)
-  for func in program['functions']:
+  # Each function is written out as soon as it's lowered, so functions
+  # can come from a stream.FunctionReader
+  with open(output_file, 'w') as file:
+    for func in functions:
+      for insn in lower_cached(func, x_regs, store):
+        file.write(insn + '\n')
+
+def lower_cached(func, x_regs, store=None):
+  '''
+    Lowers one function, or takes its assembly from store (a
+    library/cache.py Cache) if it was lowered before with its made up
+    labels numbered from the same place, which is part of the key
+  '''
+  if store is None:
+    preprocess({'functions': [func]})
+    return lower_function(func, x_regs)
+
+  counters = [BrilBranchInsn.numBranches, BrilRelationalMathInsn.numRel]
+  key = store.key(func, 'rv32 x_regs='+str(x_regs)+' labels='+str(counters))
+  cached = store.get(key)
+  if cached is not None:
+    BrilBranchInsn.numBranches, BrilRelationalMathInsn.numRel = cached['labels']
+    return cached['asm']
+
+  preprocess({'functions': [func]})
+  asm = lower_function(func, x_regs)
+  store.put(key, {'asm': asm, 'labels': [BrilBranchInsn.numBranches, BrilRelationalMathInsn.numRel]})
+  return asm
+
+@instrument.stage('rv32 lower')
+def lower_function(func, x_regs):
     # convert each Bril instruction to a BrilInsn object
     lis_BrilInsns = convert_to_BrilInsns(func)
   
@@ -253,16 +303,11 @@ def lower(program):
     map_args(lis_RVIRInsns, func_args)
 
     # do trivial register allocation
-    trivialRegAllocator = TrivialRegisterAllocator(lis_RVIRInsns,mapping)
-    RVIRInsnsAfterTrivialRA = trivialRegAllocator.trivialRegisterAllocation()
+    RVIRInsnsAfterTrivialRA = allocate_registers(lis_RVIRInsns, mapping)
     
     # convert special regs to x_regs if x_regs flag passed
     if x_regs:
         use_xregs(RVIRInsnsAfterTrivialRA)
 
     # convert RVIRInsn objects to assembly code
-    assembly_code.extend(write_asm(RVIRInsnsAfterTrivialRA))
-
-  with open(output_file, 'w') as file:
-        for insn in assembly_code:
-            file.write(insn + '\n')
\ No newline at end of file
+    return write_asm(RVIRInsnsAfterTrivialRA)
\ No newline at end of file